@@ -1,7 +1,94 @@
+import os
+
 import gradio as gr
-from smolagents import GradioUI
+from Gradio_UI import GradioUI, add_message, stream_to_gradio
+from agent_sessions import AgentPool
+from instrumentation import serve_metrics, trace_iterable
+from review_cache import prompt_version
+from review_pipeline import find_pr_url, hit_step_limit, prepare_task, record_answer
+
+# Reviews run at once; each holds one worker thread and one session agent.
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "4"))
+# Requests waiting for a worker; beyond this new requests are refused until the queue drains.
+SERVE_QUEUE_SIZE = int(os.getenv("SERVE_QUEUE_SIZE", "32"))
+# Show the model's response while it is generated instead of once per finished step.
+STREAM_TOKENS = os.getenv("STREAM_TOKENS", "1") != "0"
 
 class CustomGradioUI(GradioUI):
+    def __init__(self, agent, agent_factory=None, file_upload_folder=None):
+        super().__init__(agent, file_upload_folder)
+        # Each browser session gets its own agent; without a factory they all share `agent`.
+        self.sessions = AgentPool(agent_factory or (lambda: agent))
+
+    def interact_with_agent(self, prompt, messages, request: gr.Request = None):
+        messages.append(gr.ChatMessage(role="user", content=prompt))
+        yield messages
+
+        session = self.sessions.acquire(request.session_hash if request is not None else "default")
+        # One review per session at a time, so a single user cannot occupy every worker.
+        if not session.lock.acquire(blocking=False):
+            messages.append(gr.ChatMessage(role="assistant", content="A review is already running in this session. Wait for it to finish or stop it first."))
+            yield messages
+            return
+        try:
+            session.cancelled.clear()
+            # Everything the turn does is recorded in one run trace, tagged with its PR.
+            yield from trace_iterable(self._run_turn(session, prompt, messages), "ui", find_pr_url(prompt))
+        finally:
+            session.lock.release()
+
+    def cancel_review(self, request: gr.Request):
+        session = self.sessions.get(request.session_hash)
+        if session is not None:
+            session.cancelled.set()
+
+    def end_session(self, request: gr.Request):
+        self.cancel_review(request)
+        self.sessions.release(request.session_hash)
+
+    def _run_turn(self, session, prompt, messages):
+        agent = session.agent
+
+        # PR links are fetched and analyzed up front so the agent only has to synthesize the review.
+        task, review = prepare_task(
+            prompt, model_id=getattr(agent.model, "model_id", "") or "", prompt_version=prompt_version(agent.prompt_templates)
+        )
+        if review is not None:
+            messages.append(
+                gr.ChatMessage(
+                    role="assistant",
+                    content=review.digest,
+                    metadata={"title": "🔎 Pre-analysis", "status": "done"},
+                )
+            )
+            yield messages
+
+        if review is not None and review.cached_answer is not None:
+            # Same question, same PR head, same prompts and model: answer from the cache.
+            messages.append(gr.ChatMessage(role="assistant", content=review.cached_answer))
+            yield messages
+            return
+
+        # The memory policy bounds what earlier turns are sent with this one.
+        self.sessions.prepare(session, task)
+        msg = None
+        for msg in stream_to_gradio(
+            agent, task=task, reset_agent_memory=False, stream_tokens=STREAM_TOKENS, stop=session.cancelled
+        ):
+            add_message(messages, msg)
+            yield messages
+            if session.cancelled.is_set():
+                # Closing the stream stops the agent's response and waits for its current step to end.
+                messages.append(gr.ChatMessage(role="assistant", content="Review stopped."))
+                yield messages
+                return
+        if (
+            review is not None and msg is not None and isinstance(msg.content, str) and msg.content.startswith("**Final answer:**")
+            and not hit_step_limit(agent)
+        ):
+            record_answer(review, msg.content)
+        yield messages
+
     def launch(self, **kwargs):
         with gr.Blocks(fill_height=True) as demo:
             # Add your header and instructions at the very top
@@ -36,6 +123,11 @@ class CustomGradioUI(GradioUI):
                 self.log_user_message,
                 [text_input, file_uploads_log],
                 [stored_messages, text_input],
-            ).then(self.interact_with_agent, [stored_messages, chatbot], [chatbot])
-        demo.launch(debug=True, share=True, **kwargs)
+            ).then(self.interact_with_agent, [stored_messages, chatbot], [chatbot], concurrency_limit=SERVE_WORKERS, concurrency_id="agent")
+            stop_button = gr.Button("Stop review", variant="stop")
+            stop_button.click(self.cancel_review, None, None, queue=False)
+            demo.unload(self.end_session)
+        demo.queue(max_size=SERVE_QUEUE_SIZE, default_concurrency_limit=SERVE_WORKERS)
+        serve_metrics()
+        demo.launch(debug=True, share=True, max_threads=max(40, SERVE_WORKERS * 2), **kwargs)
 
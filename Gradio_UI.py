@@ -13,39 +13,109 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import contextvars
 import mimetypes
 import os
+import queue
 import re
 import shutil
+import threading
 from typing import Optional
 
 from smolagents.agent_types import AgentAudio, AgentImage, AgentText, handle_agent_output_types
 from smolagents.agents import ActionStep, MultiStepAgent
 from smolagents.memory import MemoryStep
-from smolagents.utils import _is_package_available
+from smolagents.utils import _is_package_available, parse_code_blobs
+
+from instrumentation import token_usage
+from model_streaming import TokenListener, listen_tokens
+
+
+def _clean_model_output(model_output: str) -> str:
+    # Remove any trailing <end_code> and extra backticks, handling multiple possible formats
+    model_output = re.sub(r"```\s*<end_code>", "```", model_output)  # handles ```<end_code>
+    model_output = re.sub(r"<end_code>\s*```", "```", model_output)  # handles <end_code>```
+    model_output = re.sub(r"```\s*\n\s*<end_code>", "```", model_output)  # handles ```\n<end_code>
+    return model_output.strip()
+
+
+def _code_message_content(content: str) -> str:
+    # Clean up the content by removing any end code tags
+    content = re.sub(r"```.*?\n", "", content)  # Remove existing code blocks
+    content = re.sub(r"\s*<end_code>\s*", "", content)  # Remove end_code tags
+    content = content.strip()
+    if not content.startswith("```python"):
+        content = f"```python\n{content}\n```"
+    return content
+
+
+class LiveStep:
+    """Chat messages of the step being generated, updated in place as its tokens arrive.
+
+    `pull_messages_from_step` fills the same messages in when the step completes, so the
+    streamed text is replaced by the final one instead of being shown twice.
+    """
+
+    def __init__(self, step_number: Optional[int]):
+        import gradio as gr
+
+        self.header = gr.ChatMessage(role="assistant", content=f"**Step {step_number}**" if step_number else "")
+        self.thought = gr.ChatMessage(role="assistant", content="")
+        self.tool_call = None
+
+    def add_token(self, text: str) -> None:
+        self.thought.content += text
+
+    def parsed(self, model_output: str):
+        """Shows the step's code as a pending tool call as soon as the response parses."""
+        import gradio as gr
+
+        try:
+            code = parse_code_blobs(model_output)
+        except Exception:
+            return None
+        self.tool_call = gr.ChatMessage(
+            role="assistant",
+            content=_code_message_content(code),
+            metadata={"title": "🛠️ Used tool python_interpreter", "status": "pending"},
+        )
+        return self.tool_call
+
+
+def add_message(messages: list, message) -> None:
+    """Appends `message` unless it is already shown; live messages are yielded again after each update."""
+    if not any(shown is message for shown in messages):
+        messages.append(message)
 
 
 def pull_messages_from_step(
     step_log: MemoryStep,
+    live: Optional[LiveStep] = None,
 ):
-    """Extract ChatMessage objects from agent steps with proper nesting"""
+    """Extract ChatMessage objects from agent steps with proper nesting
+
+    When the step was streamed, its `live` messages are updated and yielded again
+    rather than new ones created."""
     import gradio as gr
 
     if isinstance(step_log, ActionStep):
         # Output the step number
         step_number = f"Step {step_log.step_number}" if step_log.step_number is not None else ""
-        yield gr.ChatMessage(role="assistant", content=f"**{step_number}**")
+        if live is not None:
+            live.header.content = f"**{step_number}**"
+            yield live.header
+        else:
+            yield gr.ChatMessage(role="assistant", content=f"**{step_number}**")
 
         # First yield the thought/reasoning from the LLM
         if hasattr(step_log, "model_output") and step_log.model_output is not None:
             # Clean up the LLM output
-            model_output = step_log.model_output.strip()
-            # Remove any trailing <end_code> and extra backticks, handling multiple possible formats
-            model_output = re.sub(r"```\s*<end_code>", "```", model_output)  # handles ```<end_code>
-            model_output = re.sub(r"<end_code>\s*```", "```", model_output)  # handles <end_code>```
-            model_output = re.sub(r"```\s*\n\s*<end_code>", "```", model_output)  # handles ```\n<end_code>
-            model_output = model_output.strip()
-            yield gr.ChatMessage(role="assistant", content=model_output)
+            model_output = _clean_model_output(step_log.model_output)
+            if live is not None:
+                live.thought.content = model_output
+                yield live.thought
+            else:
+                yield gr.ChatMessage(role="assistant", content=model_output)
 
         # For tool calls, create a parent message
         if hasattr(step_log, "tool_calls") and step_log.tool_calls is not None:
@@ -62,22 +132,20 @@ def pull_messages_from_step(
                 content = str(args).strip()
 
             if used_code:
-                # Clean up the content by removing any end code tags
-                content = re.sub(r"```.*?\n", "", content)  # Remove existing code blocks
-                content = re.sub(r"\s*<end_code>\s*", "", content)  # Remove end_code tags
-                content = content.strip()
-                if not content.startswith("```python"):
-                    content = f"```python\n{content}\n```"
-
-            parent_message_tool = gr.ChatMessage(
-                role="assistant",
-                content=content,
-                metadata={
-                    "title": f"🛠️ Used tool {first_tool_call.name}",
-                    "id": parent_id,
-                    "status": "pending",
-                },
-            )
+                content = _code_message_content(content)
+
+            metadata = {
+                "title": f"🛠️ Used tool {first_tool_call.name}",
+                "id": parent_id,
+                "status": "pending",
+            }
+            if live is not None and live.tool_call is not None:
+                # Shown as pending while the code ran; fill in the final content.
+                parent_message_tool = live.tool_call
+                parent_message_tool.content = content
+                parent_message_tool.metadata.update(metadata)
+            else:
+                parent_message_tool = gr.ChatMessage(role="assistant", content=content, metadata=metadata)
             yield parent_message_tool
 
             # Nesting execution logs under the tool call if they exist
@@ -108,6 +176,10 @@ def pull_messages_from_step(
         elif hasattr(step_log, "error") and step_log.error is not None:
             yield gr.ChatMessage(role="assistant", content=str(step_log.error), metadata={"title": "💥 Error"})
 
+        if live is not None and live.tool_call is not None and step_log.tool_calls is None:
+            # The code parsed for display but the step failed before it was run.
+            live.tool_call.metadata["status"] = "done"
+
         # Calculate duration and token information
         step_footnote = f"{step_number}"
         if hasattr(step_log, "input_token_count") and hasattr(step_log, "output_token_count"):
@@ -123,56 +195,160 @@ def pull_messages_from_step(
         yield gr.ChatMessage(role="assistant", content="-----")
 
 
-def stream_to_gradio(
-    agent,
-    task: str,
-    reset_agent_memory: bool = False,
-    additional_args: Optional[dict] = None,
-):
-    """Runs an agent with the given task and streams the messages from the agent as gradio ChatMessages."""
-    if not _is_package_available("gradio"):
-        raise ModuleNotFoundError(
-            "Please install 'gradio' extra to use the GradioUI: `pip install 'smolagents[gradio]'`"
-        )
-    import gradio as gr
+def _record_token_counts(agent, step_log) -> None:
+    # Read from the step's own model output; the model is shared with other sessions.
+    if isinstance(step_log, ActionStep) and step_log.model_output_message is not None:
+        step_log.input_token_count, step_log.output_token_count = token_usage(step_log.model_output_message)
 
-    total_input_tokens = 0
-    total_output_tokens = 0
-
-    for step_log in agent.run(task, stream=True, reset=reset_agent_memory, additional_args=additional_args):
-        # Track tokens if model provides them
-        if hasattr(agent.model, "last_input_token_count"):
-            total_input_tokens += agent.model.last_input_token_count
-            total_output_tokens += agent.model.last_output_token_count
-            if isinstance(step_log, ActionStep):
-                step_log.input_token_count = agent.model.last_input_token_count
-                step_log.output_token_count = agent.model.last_output_token_count
 
-        for message in pull_messages_from_step(
-            step_log,
-        ):
-            yield message
+def _final_answer_message(final_answer):
+    import gradio as gr
 
-    final_answer = step_log  # Last log is the run's final_answer
     final_answer = handle_agent_output_types(final_answer)
 
     if isinstance(final_answer, AgentText):
-        yield gr.ChatMessage(
+        return gr.ChatMessage(
             role="assistant",
             content=f"**Final answer:**\n{final_answer.to_string()}\n",
         )
     elif isinstance(final_answer, AgentImage):
-        yield gr.ChatMessage(
+        return gr.ChatMessage(
             role="assistant",
             content={"path": final_answer.to_string(), "mime_type": "image/png"},
         )
     elif isinstance(final_answer, AgentAudio):
-        yield gr.ChatMessage(
+        return gr.ChatMessage(
             role="assistant",
             content={"path": final_answer.to_string(), "mime_type": "audio/wav"},
         )
     else:
-        yield gr.ChatMessage(role="assistant", content=f"**Final answer:** {str(final_answer)}")
+        return gr.ChatMessage(role="assistant", content=f"**Final answer:** {str(final_answer)}")
+
+
+def stream_to_gradio(
+    agent,
+    task: str,
+    reset_agent_memory: bool = False,
+    additional_args: Optional[dict] = None,
+    stream_tokens: bool = False,
+    stop: Optional[threading.Event] = None,
+):
+    """Runs an agent with the given task and streams the messages from the agent as gradio ChatMessages.
+
+    With `stream_tokens`, the model's response is shown while it is generated; messages
+    are then yielded again as they are updated, so callers should add them with
+    `add_message`. Setting `stop` aborts a response being generated."""
+    if not _is_package_available("gradio"):
+        raise ModuleNotFoundError(
+            "Please install 'gradio' extra to use the GradioUI: `pip install 'smolagents[gradio]'`"
+        )
+    if stream_tokens:
+        yield from _stream_tokens_to_gradio(agent, task, reset_agent_memory, additional_args, stop)
+        return
+
+    for step_log in agent.run(task, stream=True, reset=reset_agent_memory, additional_args=additional_args):
+        _record_token_counts(agent, step_log)
+        for message in pull_messages_from_step(
+            step_log,
+        ):
+            yield message
+
+    yield _final_answer_message(step_log)  # Last log is the run's final_answer
+
+
+class _QueueListener(TokenListener):
+    """Hands the model's output from the agent's thread to the thread rendering the chat."""
+
+    def __init__(self, events: queue.Queue, closed: threading.Event, stop: Optional[threading.Event] = None):
+        self.events = events
+        self.closed = closed
+        self.stop = stop
+
+    def start(self) -> None:
+        self.events.put(("start", None))
+
+    def token(self, text: str) -> None:
+        self.events.put(("token", text))
+
+    def complete(self, text: str) -> None:
+        self.events.put(("complete", text))
+
+    def stopped(self) -> bool:
+        return self.closed.is_set() or (self.stop is not None and self.stop.is_set())
+
+
+def _unique(messages: list) -> list:
+    unique = []
+    for message in messages:
+        if not any(kept is message for kept in unique):
+            unique.append(message)
+    return unique
+
+
+def _stream_tokens_to_gradio(agent, task, reset_agent_memory, additional_args, stop):
+    # The agent runs on its own thread so tokens can be rendered while a step is still
+    # being generated; everything it produces arrives here through one queue.
+    events: queue.Queue = queue.Queue()
+    closed = threading.Event()
+    listener = _QueueListener(events, closed, stop)
+
+    def run_agent():
+        try:
+            with listen_tokens(listener):
+                for step_log in agent.run(task, stream=True, reset=reset_agent_memory, additional_args=additional_args):
+                    events.put(("step", step_log))
+                    if listener.stopped():
+                        break
+        except BaseException as e:
+            events.put(("error", e))
+        finally:
+            events.put(("done", None))
+
+    # The caller's context goes along so the run's metrics and trace see the agent's work.
+    worker = threading.Thread(target=contextvars.copy_context().run, args=(run_agent,), name="agent-stream", daemon=True)
+    worker.start()
+    live = None
+    step_log = None
+    try:
+        while True:
+            # Tokens that arrived while the previous update rendered are applied together.
+            batch = [events.get()]
+            while True:
+                try:
+                    batch.append(events.get_nowait())
+                except queue.Empty:
+                    break
+            updated = []
+            for kind, value in batch:
+                if kind == "start":
+                    live = LiveStep(getattr(agent, "step_number", None))
+                    updated.append(live.header)
+                elif kind == "token" and live is not None:
+                    live.add_token(value)
+                    updated.append(live.thought)
+                elif kind == "complete" and live is not None:
+                    live.thought.content = _clean_model_output(value)
+                    updated.append(live.thought)
+                    tool_call = live.parsed(value)
+                    if tool_call is not None:
+                        updated.append(tool_call)
+                elif kind == "step":
+                    step_log = value
+                    _record_token_counts(agent, step_log)
+                    updated.extend(pull_messages_from_step(step_log, live=live if isinstance(step_log, ActionStep) else None))
+                    live = None
+                elif kind == "error":
+                    raise value
+                elif kind == "done":
+                    yield from _unique(updated)
+                    if step_log is not None and not listener.stopped():
+                        yield _final_answer_message(step_log)  # Last log is the run's final_answer
+                    return
+            yield from _unique(updated)
+    finally:
+        closed.set()
+        # The agent is not safe to reuse until its current step has finished.
+        worker.join()
 
 
 class GradioUI:
@@ -293,4 +469,4 @@ class GradioUI:
         demo.launch(debug=True, share=True, **kwargs)
 
 
-__all__ = ["stream_to_gradio", "GradioUI"]
\ No newline at end of file
+__all__ = ["stream_to_gradio", "add_message", "GradioUI"]
\ No newline at end of file
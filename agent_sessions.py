@@ -0,0 +1,217 @@
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+from smolagents.memory import ActionStep, TaskStep
+
+from review_pipeline import find_pr_url
+
+MEMORY_POLICY = os.getenv("AGENT_MEMORY_POLICY", "per_pr")
+MEMORY_MAX_STEPS = int(os.getenv("AGENT_MEMORY_MAX_STEPS", "12"))
+MAX_SESSIONS = int(os.getenv("AGENT_MAX_SESSIONS", "32"))
+SESSION_IDLE_SECONDS = float(os.getenv("AGENT_SESSION_IDLE_SECONDS", "1800"))
+# Idle agents kept for reuse; building one re-renders the system prompt and tool schemas.
+MAX_IDLE_AGENTS = 4
+
+SUMMARY_HEADER = "Summary of earlier turns in this conversation:"
+SUMMARY_MAX_ENTRIES = 10
+SUMMARY_TASK_CHARS = 200
+SUMMARY_ANSWER_CHARS = 400
+
+
+class Session:
+    """One browser session's agent and the state its memory policy needs."""
+
+    __slots__ = ("agent", "pr", "last_used", "lock", "cancelled")
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.pr = None
+        self.last_used = time.monotonic()
+        # Held while the agent runs; a session has at most one review in progress.
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+
+
+def _turns(steps: list) -> List[list]:
+    """Groups memory steps into turns, each starting at its TaskStep."""
+    turns: List[list] = []
+    for step in steps:
+        if isinstance(step, TaskStep) or not turns:
+            turns.append([])
+        turns[-1].append(step)
+    return turns
+
+
+def _newest_turns(turns: List[list], max_steps: int) -> int:
+    """Index of the oldest turn that still fits, counting whole turns from the newest."""
+    used = 0
+    for index in range(len(turns) - 1, -1, -1):
+        used += len(turns[index])
+        if used > max_steps:
+            return index + 1
+    return 0
+
+
+class MemoryPolicy(ABC):
+    """Decides what an agent remembers of earlier turns before it runs a new task.
+
+    Applied before every run, so the prompt sent for a turn is bounded by the policy
+    rather than by how long the session has lasted.
+    """
+
+    def __init__(self, max_steps: int = MEMORY_MAX_STEPS):
+        self.max_steps = max_steps
+
+    @abstractmethod
+    def apply(self, session: Session, task: str) -> None:
+        """Trims or rewrites `session.agent.memory` before `task` runs."""
+
+
+class SlidingWindow(MemoryPolicy):
+    """Keeps the newest whole turns that fit in `max_steps` memory steps."""
+
+    def apply(self, session: Session, task: str) -> None:
+        memory = session.agent.memory
+        turns = _turns(memory.steps)
+        start = _newest_turns(turns, self.max_steps)
+        if start:
+            memory.steps = [step for turn in turns[start:] for step in turn]
+
+
+class SummarizingCompaction(MemoryPolicy):
+    """Like `SlidingWindow`, but turns falling out of the window are folded into one
+    summary step listing their task and final answer, so the agent still knows what
+    was asked and answered earlier. The summary keeps the newest `SUMMARY_MAX_ENTRIES`."""
+
+    def apply(self, session: Session, task: str) -> None:
+        memory = session.agent.memory
+        entries: List[str] = []
+        steps = memory.steps
+        if steps and isinstance(steps[0], TaskStep) and steps[0].task.startswith(SUMMARY_HEADER):
+            entries = steps[0].task[len(SUMMARY_HEADER) :].strip().split("\n")
+            steps = steps[1:]
+
+        turns = _turns(steps)
+        # One step is reserved for the summary itself.
+        start = _newest_turns(turns, max(self.max_steps - 1, 1))
+        if not start:
+            return
+        for turn in turns[:start]:
+            entries.append(_summarize_turn(turn))
+        entries = [entry for entry in entries if entry][-SUMMARY_MAX_ENTRIES:]
+        summary = TaskStep(task=SUMMARY_HEADER + "\n" + "\n".join(entries))
+        memory.steps = [summary] + [step for turn in turns[start:] for step in turn]
+
+
+def _summarize_turn(turn: list) -> str:
+    task = next((step.task for step in turn if isinstance(step, TaskStep)), "")
+    # Only the question itself, not the pre-analysis digest appended to it.
+    task = " ".join(task.split("\n\n", 1)[0].split())[:SUMMARY_TASK_CHARS]
+    answer = next(
+        (step.action_output for step in reversed(turn) if isinstance(step, ActionStep) and step.action_output is not None),
+        None,
+    )
+    if not task:
+        return ""
+    answer_text = " ".join(str(answer).split())[:SUMMARY_ANSWER_CHARS] if answer is not None else "(no answer)"
+    return f"- Task: {task} -> Answer: {answer_text}"
+
+
+class ResetPerPullRequest(SlidingWindow):
+    """Forgets everything when the session moves on to another PR; follow-up questions
+    about the same PR keep a sliding window of context."""
+
+    def apply(self, session: Session, task: str) -> None:
+        pr = find_pr_url(task)
+        if pr is not None and pr != session.pr:
+            session.agent.memory.reset()
+            session.pr = pr
+            return
+        super().apply(session, task)
+
+
+MEMORY_POLICIES = {
+    "window": SlidingWindow,
+    "summarize": SummarizingCompaction,
+    "per_pr": ResetPerPullRequest,
+}
+
+
+def memory_policy(name: str = MEMORY_POLICY, max_steps: int = MEMORY_MAX_STEPS) -> MemoryPolicy:
+    try:
+        return MEMORY_POLICIES[name](max_steps)
+    except KeyError:
+        raise ValueError(f"Unknown memory policy {name!r}; expected one of {', '.join(MEMORY_POLICIES)}") from None
+
+
+class AgentPool:
+    """Hands every session its own agent and recycles agents of ended sessions.
+
+    Sessions are kept in least-recently-used order. Sessions idle for longer than
+    `idle_seconds`, or beyond `max_sessions`, are ended, and their agents are reset
+    and kept for the next new session.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], object],
+        policy: Optional[MemoryPolicy] = None,
+        max_sessions: int = MAX_SESSIONS,
+        idle_seconds: float = SESSION_IDLE_SECONDS,
+    ):
+        self.factory = factory
+        self.policy = policy or memory_policy()
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._idle: list = []
+        self._lock = threading.Lock()
+
+    def acquire(self, session_id: str) -> Session:
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = Session(self._idle.pop() if self._idle else self.factory())
+                self._sessions[session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._retire(next(iter(self._sessions)))
+            self._sessions.move_to_end(session_id)
+            session.last_used = time.monotonic()
+            return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def prepare(self, session: Session, task: str) -> None:
+        """Applies the memory policy before the session's agent runs `task`."""
+        self.policy.apply(session, task)
+
+    def release(self, session_id: str) -> None:
+        with self._lock:
+            self._retire(session_id)
+
+    def _expire(self) -> None:
+        deadline = time.monotonic() - self.idle_seconds
+        for session_id in [key for key, session in self._sessions.items() if session.last_used < deadline]:
+            self._retire(session_id)
+
+    def _retire(self, session_id: str) -> None:
+        session = self._sessions.pop(session_id, None)
+        # An agent still running for its session is dropped rather than recycled.
+        if session is None or not session.lock.acquire(blocking=False):
+            return
+        try:
+            session.agent.memory.reset()
+            if len(self._idle) < MAX_IDLE_AGENTS:
+                self._idle.append(session.agent)
+        finally:
+            session.lock.release()
+
+    def __len__(self):
+        return len(self._sessions)
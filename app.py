@@ -1,46 +1,52 @@
-from smolagents import CodeAgent, HfApiModel,tool
-import datetime
-import requests
-import pytz
-import yaml
+from smolagents import CodeAgent, tool
 from tools.final_answer import FinalAnswerTool
 import re
-import ast
+import threading
 from typing import List
-from huggingface_hub import login
 import os
-from CustomGradioUI import CustomGradioUI
-
-
-from Gradio_UI import GradioUI
+from prompt_templates import load_prompt_templates
+from model_backends import create_model
+from model_cache import CachedModel, sampling_kwargs
+from instrumentation import InstrumentedModel, instrument_tool, record_step
+from github_client import get_client, repo_from_url, error_message, get_blob_text, GitHubAPIError
+from github_async import fetch_pr_context, run_with_client
+from diff_store import diff_store, DiffFetchError
+from diff_parser import parse_diff
+from diff_chunking import chunk_pr_diff, DEFAULT_TOKEN_BUDGET
+from code_smells import detect_smells
+from security_rules import DEFAULT_RULES, SEVERITY_ORDER
+from linting import lint_file
+from pr_analysis import analyze_pr, format_report
+from review_cache import get_review_cache
+from incremental_review import fetch_compare, IncrementalUnavailable
 
 
 @tool
-def get_open_pull_requests(github_url: str) -> str:
+def get_open_pull_requests(github_url: str, max_results: int = None) -> str:
     """Fetches a list of open pull requests for a given GitHub repository.
     
     Args:
         github_url: The URL of the GitHub repository where the pull requests should be retrieved. 
                     (e.g., 'https://github.com/LukeMattingly/huggingface-agents-course', 
                     'https://github.com/upb-lea/reinforcement_learning_course_materials').
+        max_results: Optional; the maximum number of pull requests to list. All open pull requests are listed if omitted.
     
     Returns:
         A string containing the list of open pull requests with their titles and links.
         If no pull requests are open, returns a message indicating no PRs were found.
     """
     try:
-        owner_repo = github_url.replace("https://github.com/", "")
-        api_url = f"https://api.github.com/repos/{owner_repo}/pulls"
-        response = requests.get(api_url)
+        owner_repo = repo_from_url(github_url)
+        pages = get_client().paginate(f"/repos/{owner_repo}/pulls", params={"state": "open"}, limit=max_results)
+        try:
+            pull_requests = [f"PR #{pr['number']}: {pr['title']} - {pr['html_url']}" for pr in pages]
+        except GitHubAPIError as e:
+            return f"Error fetching PRs: {str(e)}"
         
-        if response.status_code != 200:
-            return f"Error fetching PRs: {response.json().get('message', 'Unknown error')}"
-        
-        pull_requests = response.json()
         if not pull_requests:
             return "No open pull requests found."
         
-        return "\n".join([f"PR #{pr['number']}: {pr['title']} - {pr['html_url']}" for pr in pull_requests])
+        return "\n".join(pull_requests)
 
     except Exception as e:
         return f"Error retrieving pull requests: {str(e)}"
@@ -81,30 +87,100 @@ def get_pr_diff(github_url: str, pr_number: int, start_line: int = None, end_lin
         If the diff cannot be retrieved or if invalid parameters are provided, returns an error message.
     """
     try:
-        owner_repo = github_url.replace("https://github.com/", "")
-        api_url = f"https://api.github.com/repos/{owner_repo}/pulls/{pr_number}"
-        response = requests.get(api_url, headers={"Accept": "application/vnd.github.v3.diff"})
-        
-        if response.status_code != 200:
-            return f"Error fetching PR diff: {response.json().get('message', 'Unknown error')}"
-        
-        diff_text = response.text
-        # Split the diff into individual lines
-        diff_lines = diff_text.splitlines()
+        owner_repo = repo_from_url(github_url)
+        # The diff is downloaded once per PR head and sliced from an in-memory line index.
+        try:
+            pr_diff = diff_store.get(owner_repo, pr_number)
+        except DiffFetchError as e:
+            return f"Error fetching PR diff: {str(e)}"
         
         # Determine which subset of lines to return:
         if start_line is not None or end_line is not None:
             if start_line is None or end_line is None:
                 return "Error: Both start_line and end_line must be provided if specifying a range."
             # Adjust for 1-indexed line numbers provided by the user.
-            diff_lines = diff_lines[start_line - 1:end_line]
+            return pr_diff.lines(start_line - 1, end_line)
         elif total_lines is not None:
-            diff_lines = diff_lines[:total_lines]
+            return pr_diff.lines(None, total_lines)
         
-        return "\n".join(diff_lines)
+        return pr_diff.lines()
     except Exception as e:
         return f"Error retrieving PR diff: {str(e)}"
 
+@tool
+def get_pr_diff_page(github_url: str, pr_number: int, page: int = 1, token_budget: int = None) -> str:
+    """Fetches one page of a pull request's diff, split along file and hunk boundaries to fit a token budget.
+    Pages are ordered by risk: changes with security findings, large changes and source files come first.
+    Lockfiles, vendored, generated and binary files are summarized in one line instead of shown.
+    Prefer this over get_pr_diff for large pull requests.
+    
+    Args:
+        github_url: The URL of the GitHub repository where the pull request is located.
+                    (e.g., 'https://github.com/crewAIInc/crewAI').
+        pr_number: The pull request number for which the code diff should be retrieved.
+        page: Optional; the page to return, starting at 1. Defaults to 1, the riskiest changes.
+        token_budget: Optional; the maximum number of tokens per page, at least 500. Defaults to the configured budget.
+    
+    Returns:
+        A string with the page number and page count, the collapsed files, an index of the changes on the other
+        pages, followed by the diff of the changes on this page. Returns an error message if the diff cannot be retrieved.
+    """
+    try:
+        owner_repo = repo_from_url(github_url)
+        try:
+            pr_diff = diff_store.get(owner_repo, pr_number)
+        except DiffFetchError as e:
+            return f"Error fetching PR diff: {str(e)}"
+        # Chunking is done once per PR head and budget; later pages are served from memory.
+        chunked = chunk_pr_diff(
+            (owner_repo, pr_number, pr_diff.head_sha), lambda: parse_diff(pr_diff.lines()), token_budget or DEFAULT_TOKEN_BUDGET
+        )
+        return chunked.render_page(page)
+    except Exception as e:
+        return f"Error retrieving PR diff page: {str(e)}"
+
+@tool
+def get_pr_diff_since_last_review(github_url: str, pr_number: int) -> str:
+    """Fetches only the diff of the commits pushed to a pull request since it was last reviewed.
+    Use this when re-reviewing a pull request instead of reading its whole diff again.
+    
+    Args:
+        github_url: The URL of the GitHub repository where the pull request is located.
+                    (e.g., 'https://github.com/crewAIInc/crewAI').
+        pr_number: The pull request number.
+    
+    Returns:
+        A string with the previously reviewed and current head commits and the diff between them.
+        If the pull request was not reviewed before, or the delta cannot be computed (e.g. after a force-push),
+        returns a message saying so; the full diff is then available through get_pr_diff_page.
+    """
+    try:
+        cache = get_review_cache()
+        if cache is None:
+            return "The review cache is disabled, so the last reviewed commit is unknown. Use get_pr_diff_page instead."
+        owner_repo = repo_from_url(github_url)
+        response = get_client().get(f"/repos/{owner_repo}/pulls/{pr_number}")
+        if response.status_code != 200:
+            return f"Error fetching PR: {error_message(response)}"
+        head_sha = response.json()["head"]["sha"]
+
+        last = cache.get_last_reviewed(owner_repo, pr_number)
+        if last is None:
+            return "This pull request has not been reviewed before. Use get_pr_diff_page to read its diff."
+        old_sha = last[0]
+        if old_sha == head_sha:
+            return f"No commits have been pushed since the last review of {head_sha[:7]}."
+        try:
+            compare = fetch_compare(owner_repo, old_sha, head_sha)
+        except IncrementalUnavailable as e:
+            return f"The changes since the last review cannot be isolated ({str(e)}). Use get_pr_diff_page to read the full diff."
+        header = f"{compare.commits} commit(s) pushed since the last review ({old_sha[:7]}..{head_sha[:7]}), {len(compare.files)} file(s) changed:"
+        return header + "\n" + compare.diff_text()
+    except GitHubAPIError as e:
+        return f"Error fetching changes since the last review: {str(e)}"
+    except Exception as e:
+        return f"Error: {str(e)}"
+
 @tool
 def get_pr_diff_for_file(github_url: str, pr_number: int, file_path: str) -> str:
     """Fetches the code diff for a specific file in a given pull request.
@@ -122,23 +198,19 @@ def get_pr_diff_for_file(github_url: str, pr_number: int, file_path: str) -> str
     """
     try:
         # Extract owner and repo from the URL
-        owner_repo = github_url.replace("https://github.com/", "")
-        # API endpoint to get files changed in the PR
-        api_url = f"https://api.github.com/repos/{owner_repo}/pulls/{pr_number}/files"
-        response = requests.get(api_url)
-        
-        if response.status_code != 200:
-            return f"Error fetching PR files: {response.json().get('message', 'Unknown error')}"
-        
-        files = response.json()
-        # Look for the specific file in the list
-        for file_info in files:
-            if file_info.get('filename') == file_path:
-                patch = file_info.get('patch')
-                if patch:
-                    return patch
-                else:
-                    return f"No diff (patch) available for file: {file_path}"
+        owner_repo = repo_from_url(github_url)
+        # Files are streamed page by page, so the search stops at the page holding the file.
+        files = get_client().paginate(f"/repos/{owner_repo}/pulls/{pr_number}/files")
+        try:
+            for file_info in files:
+                if file_info.get('filename') == file_path:
+                    patch = file_info.get('patch')
+                    if patch:
+                        return patch
+                    else:
+                        return f"No diff (patch) available for file: {file_path}"
+        except GitHubAPIError as e:
+            return f"Error fetching PR files: {str(e)}"
         
         return f"File '{file_path}' not found in the pull request."
     except Exception as e:
@@ -146,27 +218,25 @@ def get_pr_diff_for_file(github_url: str, pr_number: int, file_path: str) -> str
 
 
 @tool
-def get_pr_files_changed(github_url: str, pr_number: int) -> List[str]:
+def get_pr_files_changed(github_url: str, pr_number: int, max_files: int = None) -> List[str]:
     """Retrieves the list of files changed in a given pull request.
     
     Args:
         github_url: The URL of the GitHub repository where the pull request is located.
         pr_number: The pull request number for which the changed files should be retrieved.
+        max_files: Optional; the maximum number of file paths to return. All changed files (up to GitHub's limit of 3000) are returned if omitted.
     
     Returns:
         A list of strings, where each string is a file path that was modified in the specified pull request.
         If no files are found or an error occurs, returns a list with an appropriate error message.
     """
     try:
-        owner_repo = github_url.replace("https://github.com/", "")
-        api_url = f"https://api.github.com/repos/{owner_repo}/pulls/{pr_number}/files"
-        response = requests.get(api_url)
-        
-        if response.status_code != 200:
-            return [f"Error fetching PR files: {response.json().get('message', 'Unknown error')}"]
-        
-        files = response.json()
-        files_changed = [file['filename'] for file in files]
+        owner_repo = repo_from_url(github_url)
+        files = get_client().paginate(f"/repos/{owner_repo}/pulls/{pr_number}/files", limit=max_files)
+        try:
+            files_changed = [file['filename'] for file in files]
+        except GitHubAPIError as e:
+            return [f"Error fetching PR files: {str(e)}"]
         print(files_changed)
         return files_changed
 
@@ -185,26 +255,8 @@ def diff_to_code(diff: str) -> str:
     Returns:
         A string containing the reconstructed code.
     """
-    code_lines = []
-    for line in diff.splitlines():
-        # Skip diff metadata lines
-        if line.startswith("diff") or line.startswith("index") or line.startswith("---") or line.startswith("+++"):
-            continue
-        # Skip hunk headers (lines starting with @@)
-        if re.match(r'^@@', line):
-            continue
-        # Skip removal lines (lines starting with '-')
-        if line.startswith("-"):
-            continue
-        # For added lines, remove the '+' prefix
-        if line.startswith("+"):
-            code_lines.append(line[1:])
-        # For context lines (starting with a space), remove the leading space
-        elif line.startswith(" "):
-            code_lines.append(line[1:])
-        else:
-            code_lines.append(line)
-    return "\n".join(code_lines)
+    # The parse is cached per diff, so every analysis tool run on the same diff shares it.
+    return parse_diff(diff).code()
 '''
 @tool
 def detect_code_smells(code: str) -> str:
@@ -235,34 +287,55 @@ def detect_code_smells(code: str) -> str:
         return f"Error analyzing code: {str(e)}"
 '''
 
+def head_source_loader(github_url: str, pr_number: int):
+    """
+    Builds a loader returning (source, blob_sha) for files at the head of a pull request.
+
+    Args:
+        github_url: The URL of the GitHub repository where the pull request is located.
+        pr_number: The pull request number.
+
+    Returns:
+        A callable taking a file path and returning its content and blob SHA, or None
+        if the file is not part of the pull request.
+    """
+    owner_repo = repo_from_url(github_url)
+    blob_shas = {}
+
+    def load(path):
+        if not blob_shas:
+            for file_info in get_client().paginate(f"/repos/{owner_repo}/pulls/{pr_number}/files"):
+                if file_info.get("status") != "removed":
+                    blob_shas[file_info["filename"]] = file_info["sha"]
+        sha = blob_shas.get(path)
+        if sha is None:
+            return None
+        return get_blob_text(owner_repo, sha), sha
+
+    return load
+
 @tool
-def detect_code_smells_diff(diff: str) -> str:
+def detect_code_smells_diff(diff: str, github_url: str = None, pr_number: int = None) -> str:
     """Detects common code smells such as long functions and deeply nested loops from a code diff.
     
     Args:
         diff: A unified diff string representing changes in code to analyze for potential code smells.
+        github_url: Optional; the URL of the GitHub repository the diff belongs to. Together with pr_number,
+                    the changed files are analyzed in full at the head of the pull request instead of hunk by hunk.
+        pr_number: Optional; the pull request number the diff belongs to.
     
     Returns:
-        A string listing detected code smells based on the added and context code lines.
+        A string listing detected code smells in the changed code of each Python file, with file and line.
         If no code smells are found, returns a message indicating the code is clean.
     """
     try:
-        # Use the helper function to convert the diff into a code string.
-        code = diff_to_code(diff)
-        tree = ast.parse(code)
-        issues = []
+        # Each Python file is analyzed separately and only constructs touching added lines are reported.
+        load_source = head_source_loader(github_url, pr_number) if github_url and pr_number else None
+        smells, notes = detect_smells(parse_diff(diff), load_source)
+        issues = [f"{path}:{line}: {message}" if path else message for path, line, message in smells]
+        issues.extend(f"Note: {note}" for note in notes)
 
-        for node in ast.walk(tree):
-            # Detect long functions (more than 20 statements)
-            if isinstance(node, ast.FunctionDef) and len(node.body) > 20:
-                issues.append(f"Long function detected: {node.name} ({len(node.body)} lines)")
-            # Detect deeply nested loops by counting nested For/While nodes
-            if isinstance(node, (ast.For, ast.While)):
-                nested_loops = sum(isinstance(n, (ast.For, ast.While)) for n in ast.walk(node))
-                if nested_loops > 2:
-                    issues.append(f"Deeply nested loop detected at line {node.lineno}")
-
-        return "\n".join(issues) if issues else "No code smells detected."
+        return "\n".join(issues) if smells else "\n".join(["No code smells detected."] + issues)
     
     except Exception as e:
         return f"Error analyzing code diff: {str(e)}"
@@ -301,41 +374,16 @@ def security_check_code_diff(diff: str) -> str:
     
     Returns:
         A string listing detected potential security vulnerabilities based on common patterns (e.g., hardcoded credentials,
-        risky usage of functions like eval or os.system, and simple SQL injection risks). If no issues are found, returns a message indicating the code is secure.
+        risky usage of functions like eval or os.system, and simple SQL injection risks), each with its severity, file and line.
+        Only added lines are checked. If no issues are found, returns a message indicating the code is secure.
     """
-    import re
-    issues = []
-    code = diff_to_code(diff)
-    
-    # Check for hardcoded credentials (case-insensitive search)
-    secret_patterns = [
-        r'(?i)api[-_]?key\s*=\s*[\'"].+[\'"]',
-        r'(?i)secret\s*=\s*[\'"].+[\'"]',
-        r'(?i)password\s*=\s*[\'"].+[\'"]',
-        r'(?i)token\s*=\s*[\'"].+[\'"]'
+    # All rules run as one precompiled pattern over the added lines only.
+    hits = DEFAULT_RULES.scan(parse_diff(diff))
+    hits.sort(key=lambda hit: (SEVERITY_ORDER.get(hit.rule.severity, len(SEVERITY_ORDER)), hit.path, hit.line))
+    issues = [
+        f"[{hit.rule.severity}] {hit.path + ':' if hit.path else 'line '}{hit.line}: {hit.rule.message}: {hit.text}"
+        for hit in hits
     ]
-    for pattern in secret_patterns:
-        matches = re.findall(pattern, code)
-        if matches:
-            issues.append("Potential hardcoded credential(s) found: " + ", ".join(matches))
-    
-    # Check for usage of eval() which can be dangerous
-    if "eval(" in code:
-        issues.append("Usage of eval() detected, which can lead to security vulnerabilities if misused.")
-    
-    # Check for potential command injection risks with os.system
-    if "os.system(" in code:
-        issues.append("Usage of os.system() detected; consider using safer alternatives to avoid command injection risks.")
-    
-    # Check for simple SQL injection patterns (heuristic)
-    sql_injection_patterns = [
-        r"execute\(.+\+.+\)",
-        r"format\(.+%\(.+\)s.+\)"
-    ]
-    for pattern in sql_injection_patterns:
-        matches = re.findall(pattern, code)
-        if matches:
-            issues.append("Potential SQL injection risk found in statements: " + ", ".join(matches))
     
     if issues:
         return "\n".join(issues)
@@ -361,59 +409,171 @@ def check_documentation_updates(changed_files: str) -> str:
         return "No documentation updates detected. Consider reviewing the docs to ensure they reflect the new changes."
 
 @tool
-def lint_code(diff: str) -> str:
-    """Analyzes the provided code snippet for style and potential issues using a linter.
+def lint_code(diff: str, github_url: str = None, pr_number: int = None) -> str:
+    """Analyzes the provided code diff for style and potential issues using pyflakes and pycodestyle.
     
     Args:
-        diff: The source code to be analyzed.
+        diff: A unified diff string (or plain source code) to be analyzed. Only added lines are reported.
+        github_url: Optional; the URL of the GitHub repository the diff belongs to. Together with pr_number,
+                    each changed file is linted in full at the head of the pull request instead of hunk by hunk.
+        pr_number: Optional; the pull request number the diff belongs to.
     
     Returns:
-        A string with linting warnings and suggestions for improvement, or a message indicating that no issues were found.
+        A string with linting warnings (file, line and message) followed by the time spent per file,
+        or a message indicating that no issues were found.
     """
-    # This is a placeholder; you could integrate pylint or flake8 via subprocess or an API.
-    # For demonstration, we'll simulate a response.
-    issues = []
+    try:
+        load_source = head_source_loader(github_url, pr_number) if github_url and pr_number else None
+        results = [
+            lint_file(file_diff, load_source(file_diff.path) if load_source and file_diff.path else None)
+            for file_diff in parse_diff(diff).files
+        ]
+        issues = [
+            f"{result.path + ':' if result.path else 'line '}{line}: {message}"
+            for result in results
+            for line, message in result.findings
+        ]
+        timings = ", ".join(
+            f"{result.path or 'diff'} {result.seconds * 1000:.1f} ms{' (cached)' if result.cached else ''}"
+            for result in sorted(results, key=lambda result: result.seconds, reverse=True)
+        )
+        if not issues:
+            return f"No linting issues found. Lint time: {timings}"
+        return "\n".join(issues + [f"Lint time: {timings}"])
+    except Exception as e:
+        return f"Error linting code: {str(e)}"
 
-    code = diff_to_code(diff)
-    
-    if "print(" in code:
-        issues.append("Consider removing debug print statements.")
-    if not issues:
-        return "No linting issues found."
-    return "\n".join(issues)
 
+@tool
+def analyze_pr_changes(github_url: str, pr_number: int, max_findings: int = 50) -> str:
+    """Runs every analyzer (security checks, code smells, linting and TODO/FIXME comments) over all files changed in a pull request in one call.
+    
+    Args:
+        github_url: The URL of the GitHub repository where the pull request is located.
+                    (e.g., 'https://github.com/crewAIInc/crewAI').
+        pr_number: The pull request number to analyze.
+        max_findings: Optional; the maximum number of findings to list, most severe first. Defaults to 50.
+    
+    Returns:
+        A string with a summary line followed by the findings ranked by severity, each with its file, line and analyzer.
+        If nothing is found, returns a message saying so.
+    """
+    try:
+        owner_repo = repo_from_url(github_url)
+        try:
+            pr_diff = diff_store.get(owner_repo, pr_number)
+        except DiffFetchError as e:
+            return f"Error fetching PR diff: {str(e)}"
+        # The diff is parsed once and the per-file analyzers are fanned out over a process pool.
+        findings = analyze_pr(parse_diff(pr_diff.lines()))
+        return format_report(findings, limit=max_findings)
+    except Exception as e:
+        return f"Error analyzing pull request: {str(e)}"
 
-final_answer = FinalAnswerTool()
 
-# If the agent does not answer, the model is overloaded, please use another model or the following Hugging Face Endpoint that also contains qwen2.5 coder:
-# model_id='https://pflgm2locj2t89co.us-east-1.aws.endpoints.huggingface.cloud' 
+@tool
+def gather_pr_context(github_url: str, pr_number: int, file_paths: List[str] = None, max_chars: int = 20000) -> str:
+    """Fetches a pull request's description, changed files and their patches in a single call, with all requests made concurrently.
+    
+    Args:
+        github_url: The URL of the GitHub repository where the pull request is located.
+                    (e.g., 'https://github.com/crewAIInc/crewAI').
+        pr_number: The pull request number.
+        file_paths: Optional; only include the patches of these files. Defaults to every changed file.
+        max_chars: Optional; the maximum length of the returned text. Defaults to 20000.
+    
+    Returns:
+        A string with the PR title, author, branches and description, the list of changed files with their
+        additions and deletions, followed by the patch of each selected file. Truncated to max_chars.
+    """
+    try:
+        # Metadata and every page of the file list are requested at the same time.
+        context = run_with_client(lambda client: fetch_pr_context(client, github_url, pr_number, include_diff=False))
+    except GitHubAPIError as e:
+        return f"Error fetching PR context: {str(e)}"
+    except Exception as e:
+        return f"Error: {str(e)}"
 
-hf_token = os.getenv("HF_TOKEN")
-if hf_token:
-    login(token=hf_token)
+    metadata, files = context["metadata"], context["files"]
+    wanted = set(file_paths) if file_paths else None
+    sections = [
+        f"PR #{metadata.get('number')}: {metadata.get('title')}",
+        f"Author: {(metadata.get('user') or {}).get('login')} | {metadata.get('head', {}).get('ref')} -> {metadata.get('base', {}).get('ref')}",
+        "Description: " + ((metadata.get("body") or "").strip() or "(none)"),
+        "Files changed:",
+    ]
+    sections.extend(f"- {info['filename']} ({info.get('status')}, +{info.get('additions', 0)} -{info.get('deletions', 0)})" for info in files)
+    for info in files:
+        if wanted is not None and info["filename"] not in wanted:
+            continue
+        sections.append(f"--- {info['filename']} ---\n{info.get('patch') or '(no patch available)'}")
 
-model = HfApiModel(
-max_tokens=2096,
-temperature=0.5,
-model_id='Qwen/Qwen2.5-Coder-32B-Instruct',# it is possible that this model may be overloaded deepseek-ai/DeepSeek-R1-Distill-Qwen-32B || Qwen/Qwen2.5-Coder-32B-Instruct
-custom_role_conversions=None,
-)
+    text = "\n".join(sections)
+    if len(text) > max_chars:
+        text = text[:max_chars] + f"\n... truncated {len(text) - max_chars} characters. Use file_paths to narrow the context."
+    return text
 
 
-with open("prompts.yaml", 'r') as stream:
-    prompt_templates = yaml.safe_load(stream)
-    
-agent = CodeAgent(
-    model=model,
-    tools=[final_answer, get_open_pull_requests, find_todo_comments, get_pr_diff, get_pr_files_changed, detect_code_smells_diff, security_check_code, check_documentation_updates, lint_code, get_pr_diff_for_file ], ## add your tools here (don't remove final answer)
-    max_steps=6,
-    verbosity_level=1,
-    grammar=None,
-    planning_interval=None,
-    name=None,
-    description=None,
-    prompt_templates=prompt_templates
-)
+final_answer = FinalAnswerTool()
 
+# If the agent does not answer, the model is overloaded, please use another model or the following Hugging Face Endpoint that also contains qwen2.5 coder:
+# model_id='https://pflgm2locj2t89co.us-east-1.aws.endpoints.huggingface.cloud' 
 
-CustomGradioUI(agent).launch()
\ No newline at end of file
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model() -> InstrumentedModel:
+    """Builds the model on first use; the token is passed along instead of a `login()` at import time.
+    Calls are timed and their tokens counted (see instrumentation.py), and repeated requests
+    are answered from the completion cache (see model_cache.py)."""
+    global _model
+    with _model_lock:
+        if _model is None:
+            settings = dict(
+                max_tokens=2096,
+                temperature=0.5,
+                # it is possible that this model may be overloaded deepseek-ai/DeepSeek-R1-Distill-Qwen-32B || Qwen/Qwen2.5-Coder-32B-Instruct
+                # MODEL_BACKEND=openai serves it from your own servers instead (see model_backends.py).
+                model_id=os.getenv("MODEL_ID", 'Qwen/Qwen2.5-Coder-32B-Instruct'),
+                custom_role_conversions=None,
+                token=os.getenv("HF_TOKEN"),
+            )
+            # MODEL_DETERMINISTIC / MODEL_PROMPT_CACHE (see model_cache.py) override the defaults above.
+            settings.update(sampling_kwargs())
+            _model = InstrumentedModel(CachedModel(create_model(**settings)))
+        return _model
+
+
+TOOLS = [final_answer, get_open_pull_requests, find_todo_comments, get_pr_diff, get_pr_files_changed, detect_code_smells_diff, security_check_code_diff, check_documentation_updates, lint_code, get_pr_diff_for_file, analyze_pr_changes, gather_pr_context, get_pr_diff_page, get_pr_diff_since_last_review ] ## add your tools here (don't remove final answer)
+# Every tool call is timed and counted (see instrumentation.py).
+TOOLS = [instrument_tool(tool) for tool in TOOLS]
+
+
+def build_agent() -> CodeAgent:
+    """Creates an agent with its own memory; the model, tools and prompts are shared."""
+    agent = CodeAgent(
+        model=get_model(),
+        tools=TOOLS,
+        max_steps=6,
+        verbosity_level=1,
+        grammar=None,
+        planning_interval=None,
+        name=None,
+        description=None,
+        prompt_templates=load_prompt_templates(),
+        step_callbacks=[record_step],
+    )
+    # smolagents builds this list from a set, so its order (and the system prompt that lists it)
+    # changes between processes; sorted, the prompt prefix is byte-identical and can be reused
+    # by the server's prefix cache and the completion cache.
+    agent.authorized_imports = sorted(agent.authorized_imports)
+    return agent
+
+
+if __name__ == "__main__":
+    # Gradio is only imported when serving the UI; review_cli.py imports this module headless.
+    from CustomGradioUI import CustomGradioUI
+
+    agent = build_agent()
+    CustomGradioUI(agent, agent_factory=build_agent).launch()
\ No newline at end of file
@@ -0,0 +1,205 @@
+"""A local stand-in for the GitHub REST API that replays pull request fixtures.
+
+Serves `/repos/{owner}/{repo}/pulls`, `/pulls/{n}` (JSON, or the diff with the diff
+media type), `/pulls/{n}/files` (paginated with `Link` headers) and `/git/blobs/{sha}`,
+with ETags so conditional requests get 304s like on GitHub. Fixtures are either
+generated (`synthetic.py`) or recorded from GitHub once:
+
+    python benchmarks/fake_github.py record https://github.com/owner/repo/pull/42 pr42.json
+    python benchmarks/fake_github.py serve pr42.json --port 8765
+
+and the app is pointed at it with `GITHUB_API_URL=http://127.0.0.1:8765`.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+_ROUTE = re.compile(r"^/repos/(?P<repo>[^/]+/[^/]+)/(?:pulls(?:/(?P<number>\d+)(?P<files>/files)?)?|git/blobs/(?P<sha>[0-9a-f]+))$")
+
+
+class Fixtures:
+    """Pull requests by repository and number, in the format `synthetic.synthetic_pr` returns."""
+
+    def __init__(self):
+        self.repos: Dict[str, Dict[int, dict]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, owner_repo: str, pr: dict) -> None:
+        with self._lock:
+            self.repos.setdefault(owner_repo, {})[int(pr["metadata"]["number"])] = pr
+
+    def get(self, owner_repo: str, number: int) -> Optional[dict]:
+        return self.repos.get(owner_repo, {}).get(number)
+
+    def blob(self, owner_repo: str, sha: str) -> Optional[str]:
+        for pr in self.repos.get(owner_repo, {}).values():
+            if sha in pr["blobs"]:
+                return pr["blobs"][sha]
+        return None
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as stream:
+            json.dump(self.repos, stream)
+
+    @classmethod
+    def load(cls, path: str) -> "Fixtures":
+        fixtures = cls()
+        with open(path, "r") as stream:
+            for owner_repo, prs in json.load(stream).items():
+                for pr in prs.values():
+                    fixtures.add(owner_repo, pr)
+        return fixtures
+
+
+def _handler(fixtures: Fixtures, requests_seen: list):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            requests_seen.append(url.path)
+            match = _ROUTE.match(url.path)
+            if match is None:
+                return self._send(404, {"message": "Not Found"})
+            owner_repo = match.group("repo")
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            accept = self.headers.get("Accept", "")
+
+            if match.group("sha"):
+                source = fixtures.blob(owner_repo, match.group("sha"))
+                if source is None:
+                    return self._send(404, {"message": "Not Found"})
+                if "raw" in accept:
+                    return self._send(200, source, "application/vnd.github.raw")
+                encoded = base64.b64encode(source.encode("utf-8")).decode("ascii")
+                return self._send(200, {"sha": match.group("sha"), "encoding": "base64", "content": encoded})
+
+            if match.group("number") is None:
+                prs = [pr["metadata"] for _, pr in sorted(fixtures.repos.get(owner_repo, {}).items())]
+                return self._paginate(prs, query)
+
+            pr = fixtures.get(owner_repo, int(match.group("number")))
+            if pr is None:
+                return self._send(404, {"message": "Not Found"})
+            if match.group("files"):
+                return self._paginate(pr["files"], query)
+            if "diff" in accept:
+                return self._send(200, pr["diff"], "text/plain; charset=utf-8")
+            return self._send(200, pr["metadata"])
+
+        def _paginate(self, items: list, query: dict):
+            per_page = min(int(query.get("per_page", 30)), 100)
+            page = int(query.get("page", 1))
+            last = max(1, math.ceil(len(items) / per_page))
+            links = []
+            base = f"http://{self.headers.get('Host')}{urlparse(self.path).path}?per_page={per_page}"
+            if page < last:
+                links.append(f'<{base}&page={page + 1}>; rel="next"')
+                links.append(f'<{base}&page={last}>; rel="last"')
+            self._send(200, items[(page - 1) * per_page : page * per_page], link=", ".join(links) or None)
+
+        def _send(self, status: int, payload, content_type: str = "application/json; charset=utf-8", link: Optional[str] = None):
+            body = payload.encode("utf-8") if isinstance(payload, str) else json.dumps(payload).encode("utf-8")
+            etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+            if status == 200 and self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.send_header("X-RateLimit-Remaining", "5000")
+            if link:
+                self.send_header("Link", link)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class FakeGitHub:
+    """Serves `fixtures` on a local port from a daemon thread."""
+
+    def __init__(self, fixtures: Fixtures, host: str = "127.0.0.1", port: int = 0):
+        self.fixtures = fixtures
+        self.requests: list = []
+        self.server = ThreadingHTTPServer((host, port), _handler(fixtures, self.requests))
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-github", daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeGitHub":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def record(pr_url: str, path: str) -> None:
+    """Fetches a pull request from GitHub (GITHUB_TOKEN is used if set) and appends it to a fixture file."""
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from github_client import get_blob_text, get_client
+    from review_pipeline import find_pr_url
+
+    found = find_pr_url(pr_url)
+    if found is None:
+        raise SystemExit(f"not a pull request URL: {pr_url}")
+    owner_repo = found[0].replace("https://github.com/", "")
+    client = get_client()
+    metadata = client.get(f"/repos/{owner_repo}/pulls/{found[1]}").json()
+    files = list(client.paginate(f"/repos/{owner_repo}/pulls/{found[1]}/files"))
+    diff = client.get(f"/repos/{owner_repo}/pulls/{found[1]}", accept="application/vnd.github.v3.diff").text
+    blobs = {info["sha"]: get_blob_text(owner_repo, info["sha"]) for info in files if info.get("status") != "removed" and info.get("sha")}
+
+    fixtures = Fixtures.load(path) if os.path.exists(path) else Fixtures()
+    fixtures.add(owner_repo, {"metadata": metadata, "files": files, "diff": diff, "blobs": blobs})
+    fixtures.save(path)
+    print(f"Recorded {owner_repo}#{found[1]} ({len(files)} files, {len(diff.splitlines())} diff lines) to {path}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Record GitHub pull requests as fixtures, or serve fixtures locally.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    record_command = commands.add_parser("record", help="Fetch a pull request from GitHub into a fixture file.")
+    record_command.add_argument("url")
+    record_command.add_argument("path")
+    serve_command = commands.add_parser("serve", help="Serve a fixture file.")
+    serve_command.add_argument("path")
+    serve_command.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        record(args.url, args.path)
+        return 0
+    server = FakeGitHub(Fixtures.load(args.path), port=args.port)
+    print(f"Serving {args.path} at {server.url}; set GITHUB_API_URL={server.url}")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""A local stand-in for an OpenAI-compatible model server (vLLM, llama.cpp).
+
+Serves `/v1/chat/completions` (also streamed as server-sent events), `/v1/completions`
+with one prompt or a list of them, and `/v1/models`. Answers come from `stub_model.reply`,
+so an agent pointed at it reviews like it does with `StubModel`:
+
+    python benchmarks/fake_model_server.py --port 8000 --latency 0.2 --slots 1
+    MODEL_BACKEND=openai MODEL_ENDPOINTS=http://127.0.0.1:8000/v1 python review_cli.py ...
+
+Every request holds one of `slots` generation slots for `latency` seconds (plus
+`seconds_per_token` per generated token of its longest answer), whatever its number
+of prompts, which is how a GPU server batches. `status` makes every request fail with
+that HTTP status, to exercise endpoint fallback.
+"""
+import argparse
+import json
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+from stub_model import reply
+
+_ASSISTANT_TURN = re.compile(r"<\|im_start\|>assistant\n")
+
+
+def _prompt_steps(prompt: str) -> int:
+    # The last assistant turn is the open one being generated.
+    return max(0, len(_ASSISTANT_TURN.findall(prompt)) - 1)
+
+
+def _message_text(content) -> str:
+    if isinstance(content, list):
+        return "\n".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def _handler(server: "FakeModelServer"):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/v1/models":
+                return self._send(200, {"object": "list", "data": [{"id": server.model_id, "object": "model"}]})
+            self._send(404, {"error": {"message": "Not Found"}})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            path = self.path.rstrip("/")
+            if path not in ("/v1/chat/completions", "/v1/completions"):
+                return self._send(404, {"error": {"message": "Not Found"}})
+            if server.status != 200:
+                server.requests.append((path, 0))
+                return self._send(server.status, {"error": {"message": f"HTTP {server.status}"}})
+
+            if path == "/v1/completions":
+                prompts = body.get("prompt", "")
+                prompts = prompts if isinstance(prompts, list) else [prompts]
+                texts = [reply(prompt, _prompt_steps(prompt)) for prompt in prompts]
+                input_chars = sum(len(prompt) for prompt in prompts)
+            else:
+                messages = body.get("messages", [])
+                conversation = "\n".join(_message_text(message.get("content")) for message in messages)
+                texts = [reply(conversation, sum(1 for message in messages if message.get("role") == "assistant"))]
+                input_chars = len(conversation)
+            server.requests.append((path, len(texts)))
+            usage = {
+                "prompt_tokens": input_chars // 4,
+                "completion_tokens": sum(len(text) for text in texts) // 4,
+                "total_tokens": (input_chars + sum(len(text) for text in texts)) // 4,
+            }
+            with server.slots:
+                delay = server.latency + server.seconds_per_token * max(len(text) for text in texts) / 4
+                if delay:
+                    time.sleep(delay)
+
+            if path == "/v1/completions":
+                choices = [{"index": index, "text": text, "finish_reason": "stop"} for index, text in enumerate(texts)]
+                return self._send(200, {"object": "text_completion", "model": server.model_id, "choices": choices, "usage": usage})
+            if body.get("stream"):
+                return self._stream(texts[0], usage, include_usage=bool((body.get("stream_options") or {}).get("include_usage")))
+            message = {"role": "assistant", "content": texts[0]}
+            return self._send(
+                200,
+                {"object": "chat.completion", "model": server.model_id, "choices": [{"index": 0, "message": message, "finish_reason": "stop"}], "usage": usage},
+            )
+
+        def _stream(self, text: str, usage: dict, include_usage: bool):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            for piece in re.findall(r"\S+\s*|\s+", text):
+                chunk = {"object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": piece}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            if include_usage:
+                self.wfile.write(f"data: {json.dumps({'object': 'chat.completion.chunk', 'choices': [], 'usage': usage})}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+
+        def _send(self, status: int, payload: dict):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class FakeModelServer:
+    """Serves stub answers on a local port from a daemon thread; `requests` lists (path, prompts) per request."""
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        seconds_per_token: float = 0.0,
+        slots: int = 1,
+        status: int = 200,
+        model_id: str = "benchmark-stub",
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.latency = latency
+        self.seconds_per_token = seconds_per_token
+        self.slots = threading.Semaphore(slots)
+        self.status = status
+        self.model_id = model_id
+        self.requests: List[tuple] = []
+        self.server = ThreadingHTTPServer((host, port), _handler(self))
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-model-server", daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeModelServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve stub answers over an OpenAI-compatible API.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds every request takes.")
+    parser.add_argument("--seconds-per-token", type=float, default=0.0)
+    parser.add_argument("--slots", type=int, default=1, help="Requests generated at once.")
+    parser.add_argument("--status", type=int, default=200, help="Answer every request with this HTTP status.")
+    args = parser.parse_args(argv)
+
+    server = FakeModelServer(args.latency, args.seconds_per_token, args.slots, args.status, port=args.port)
+    print(f"Serving stub completions at {server.url}; set MODEL_BACKEND=openai MODEL_ENDPOINTS={server.url}")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+"""Offline benchmarks of the analysis tools, the end-to-end review and startup.
+
+Nothing leaves the machine: GitHub is replaced by `fake_github.py` serving synthetic
+pull requests (or recorded ones with --fixtures), and the model by `stub_model.py`.
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --sizes 10 1000 --cases review --baseline results.json
+
+Every case is run --repeat times per diff size; the median, p95 and throughput go to
+--output as JSON. With --baseline, the script exits with status 1 when a median is
+slower than the baseline's by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(BENCHMARKS)
+sys.path.insert(0, REPO)
+
+from fake_github import FakeGitHub, Fixtures  # noqa: E402
+from fake_model_server import FakeModelServer  # noqa: E402
+from synthetic import synthetic_pr  # noqa: E402
+
+CASES = ["diff_to_code", "detect_code_smells_diff", "security_check_code_diff", "review", "model_backend", "startup"]
+SIZES = [10, 100, 1000, 10000, 100000]
+OWNER_REPO = "bench/repo"
+
+
+def summarize(samples: List[float], lines: Optional[int] = None) -> dict:
+    ordered = sorted(samples)
+    result = {
+        "runs": len(samples),
+        "median_seconds": statistics.median(ordered),
+        "p95_seconds": ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))],
+        "min_seconds": ordered[0],
+    }
+    if lines:
+        result["lines"] = lines
+        result["lines_per_second"] = round(lines / result["median_seconds"]) if result["median_seconds"] else None
+    return result
+
+
+def timed(function: Callable[[], object], repeat: int, before: Optional[Callable[[], None]] = None) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def bench_tools(app, sizes: List[int], cases: List[str], repeat: int) -> Dict[str, dict]:
+    """Analysis tools on diffs of each size; the diff and AST caches are cleared first so every run parses."""
+    import code_smells
+    import diff_parser
+
+    def clear_caches():
+        diff_parser._cache.clear()
+        with code_smells._ast_cache_lock:
+            code_smells._ast_cache.clear()
+
+    results = {}
+    for lines in sizes:
+        diff = synthetic_pr(1, lines)["diff"]
+        actual = len(diff.splitlines())
+        functions = {
+            "diff_to_code": lambda: app.diff_to_code(diff),
+            "detect_code_smells_diff": lambda: app.detect_code_smells_diff(diff),
+            "security_check_code_diff": lambda: app.security_check_code_diff(diff),
+        }
+        for case in cases:
+            if case in functions:
+                results[f"{case}/{lines}"] = summarize(timed(functions[case], repeat, clear_caches), actual)
+    return results
+
+
+def bench_review(fixtures: Fixtures, sizes: List[int], repeat: int, model_latency: float, recorded: List[str]) -> Dict[str, dict]:
+    """Full headless reviews against the fake GitHub with the stub model.
+
+    Every run reviews a different PR of the same size, so nothing is served from the
+    review cache; `review_cached` then asks about the first one again. The `recorded`
+    PR URLs are reviewed once each.
+    """
+    import app
+    from smolagents.monitoring import LogLevel
+    from stub_model import StubModel
+
+    from instrumentation import InstrumentedModel
+    from review_cli import HeadlessReviewer
+
+    app._model = InstrumentedModel(StubModel(latency=model_latency))
+
+    def build_quiet_agent():
+        agent = app.build_agent()
+        agent.logger.level = LogLevel.OFF
+        return agent
+
+    reviewer = HeadlessReviewer()
+    reviewer._build_agent = build_quiet_agent
+    results = {}
+    number = 1000
+    for lines in sizes:
+        numbers = []
+        for _ in range(repeat):
+            number += 1
+            pr = synthetic_pr(number, lines)
+            fixtures.add(OWNER_REPO, pr)
+            numbers.append(number)
+        actual = len(pr["diff"].splitlines())
+
+        def review(pr_number: int) -> None:
+            result = reviewer.review(f"https://github.com/{OWNER_REPO}/pull/{pr_number}")
+            if result["status"] != "ok":
+                raise RuntimeError(f"review of PR {pr_number} failed: {result.get('error')}")
+
+        pending = list(numbers)
+        results[f"review/{lines}"] = summarize(timed(lambda: review(pending.pop(0)), repeat), actual)
+        results[f"review_cached/{lines}"] = summarize(timed(lambda: review(numbers[0]), repeat), actual)
+
+    for url in recorded:
+        results[f"review_recorded/{url.replace('https://github.com/', '')}"] = summarize(timed(lambda: reviewer.review(url), 1))
+    return results
+
+
+def bench_model_backend(concurrency: int, repeat: int, model_latency: float) -> Dict[str, dict]:
+    """Step latency of `concurrency` sessions calling one single-slot model server at once,
+    each request on its own and batched into `/completions` requests."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    from model_backends import OpenAICompatibleModel
+
+    server = FakeModelServer(latency=model_latency or 0.05, slots=1).start()
+    messages = [
+        {"role": "system", "content": [{"type": "text", "text": "You review pull requests."}]},
+        {"role": "user", "content": [{"type": "text", "text": f"Review https://github.com/{OWNER_REPO}/pull/1"}]},
+    ]
+    results = {}
+    try:
+        for mode in ("unbatched", "batched"):
+            model = OpenAICompatibleModel("benchmark-stub", endpoints=[server.url], batch=mode == "batched", batch_max=concurrency)
+
+            def step() -> float:
+                started = time.perf_counter()
+                model(messages)
+                return time.perf_counter() - started
+
+            samples: List[float] = []
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                for _ in range(repeat):
+                    samples.extend(pool.map(lambda _: step(), range(concurrency)))
+            results[f"model_backend/{mode}/{concurrency}"] = summarize(samples)
+    finally:
+        server.stop()
+    return results
+
+
+def bench_startup(repeat: int) -> Dict[str, dict]:
+    from startup import TARGETS, measure
+
+    results = {}
+    for name in ("app (headless)", "review_cli"):
+        statement, _ = TARGETS[name]
+        measured = measure(statement, repeat)
+        results[f"startup/{name}"] = {"runs": repeat, "median_seconds": measured["median_seconds"], "min_seconds": measured["min_seconds"]}
+    return results
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name, {}).get("median_seconds")
+        if reference and result["median_seconds"] > reference * (1 + tolerance):
+            regressions.append(
+                f"{name}: median {result['median_seconds'] * 1000:.1f} ms, baseline {reference * 1000:.1f} ms (+{tolerance:.0%} allowed)"
+            )
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the review tools, the agent loop and startup.")
+    parser.add_argument("--cases", nargs="*", default=CASES, choices=CASES)
+    parser.add_argument("--sizes", nargs="*", type=int, default=SIZES, help="Diff sizes in lines.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--model-latency", type=float, default=0.0, help="Seconds the stub model waits per call.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Sessions calling the model server at once in the model_backend case.")
+    parser.add_argument("--fixtures", help="Also review the recorded pull requests in this fixture file.")
+    parser.add_argument("--output", default=os.path.join(BENCHMARKS, "results.json"))
+    parser.add_argument("--baseline", help="Results file of an earlier run to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown against the baseline (0.25 = 25%%).")
+    args = parser.parse_args(argv)
+
+    fixtures = Fixtures.load(args.fixtures) if args.fixtures else Fixtures()
+    server = FakeGitHub(fixtures).start()
+    scratch = tempfile.mkdtemp(prefix="pr-review-bench-")
+    # Read at import, so set before the app's modules are loaded.
+    os.environ.update(
+        GITHUB_API_URL=server.url,
+        GITHUB_TOKEN="",
+        REVIEW_CACHE_DIR=os.path.join(scratch, "cache"),
+        TRACES_ENABLED="0",
+        HF_TOKEN=os.environ.get("HF_TOKEN", "offline"),
+    )
+    import app
+
+    results: Dict[str, dict] = {}
+    try:
+        results.update(bench_tools(app, args.sizes, args.cases, args.repeat))
+        if "review" in args.cases:
+            recorded = [f"https://github.com/{owner_repo}/pull/{number}" for owner_repo, prs in fixtures.repos.items() for number in prs]
+            results.update(bench_review(fixtures, args.sizes, args.repeat, args.model_latency, recorded))
+        if "model_backend" in args.cases:
+            results.update(bench_model_backend(args.concurrency, args.repeat, args.model_latency))
+        if "startup" in args.cases:
+            results.update(bench_startup(args.repeat))
+    finally:
+        server.stop()
+
+    for name, result in results.items():
+        throughput = f"{result['lines_per_second']:>12,} lines/s" if result.get("lines_per_second") else ""
+        print(f"{name:40s} median {result['median_seconds'] * 1000:10.2f} ms  p95 {result.get('p95_seconds', result['median_seconds']) * 1000:10.2f} ms {throughput}")
+
+    report = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "model_latency": args.model_latency,
+            "concurrency": args.concurrency,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as stream:
+        json.dump(report, stream, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r") as stream:
+            regressions = compare(results, json.load(stream)["results"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
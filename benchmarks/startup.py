@@ -0,0 +1,121 @@
+"""Startup-time benchmark.
+
+Imports each entry point in a fresh interpreter several times and reports the median
+wall time, the slowest top-level imports, and which heavy optional modules got loaded.
+
+    python benchmarks/startup.py                         # print results
+    python benchmarks/startup.py --save baseline.json    # record a baseline on this machine
+    python benchmarks/startup.py --baseline baseline.json --tolerance 0.25
+
+Exits with status 1 when a headless entry point loads a module it must not (e.g.
+Gradio), or when a median is slower than the baseline by more than the tolerance.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Entry point -> (statement, modules it must not import).
+TARGETS = {
+    "app (headless)": ("import app", ["gradio", "duckduckgo_search", "markdownify"]),
+    "review_cli": ("import review_cli", ["gradio", "smolagents", "duckduckgo_search", "markdownify"]),
+    "app.build_agent": ("import app; app.build_agent()", ["gradio"]),
+    "CustomGradioUI": ("import CustomGradioUI", []),
+}
+
+_PROBE = """
+import sys, time, json
+started = time.perf_counter()
+exec({statement!r})
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "modules": sorted(m for m in sys.modules if "." not in m)}}))
+"""
+
+
+def measure(statement: str, runs: int) -> Dict:
+    """Runs `statement` in `runs` fresh interpreters and returns timings and loaded modules."""
+    samples: List[float] = []
+    modules: List[str] = []
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="0")
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(statement=statement)],
+            cwd=REPO, env=env, capture_output=True, text=True, check=True,
+        )
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        samples.append(result["seconds"])
+        modules = result["modules"]
+    return {
+        "median_seconds": statistics.median(samples),
+        "min_seconds": min(samples),
+        "modules": modules,
+    }
+
+
+def slowest_imports(statement: str, limit: int = 8) -> List[tuple]:
+    """Modules imported directly by the entry point, by cumulative import time (`-X importtime`)."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement], cwd=REPO, capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        # Nesting is two spaces per level after the separator's own space.
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if cumulative.strip().isdigit() and depth == 1:
+            rows.append((name.strip(), int(cumulative) / 1e6))
+    return sorted(rows, key=lambda row: -row[1])[:limit]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--save", help="Write the results to this JSON file as a baseline.")
+    parser.add_argument("--baseline", help="Compare against a baseline written by --save.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown against the baseline (0.25 = 25%%).")
+    parser.add_argument("--targets", nargs="*", default=list(TARGETS), help="Entry points to measure.")
+    args = parser.parse_args(argv)
+
+    results = {}
+    failures = []
+    for name in args.targets:
+        statement, forbidden = TARGETS[name]
+        result = measure(statement, args.runs)
+        loaded = sorted(set(forbidden) & set(result.pop("modules")))
+        result["forbidden_loaded"] = loaded
+        result["slowest_imports"] = slowest_imports(statement)
+        results[name] = result
+        print(f"{name:20s} median {result['median_seconds'] * 1000:8.1f} ms   min {result['min_seconds'] * 1000:8.1f} ms")
+        for module, seconds in result["slowest_imports"]:
+            print(f"    {module:32s} {seconds * 1000:8.1f} ms")
+        if loaded:
+            failures.append(f"{name} imported {', '.join(loaded)}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as stream:
+            baseline = json.load(stream)
+        for name, result in results.items():
+            reference = baseline.get(name, {}).get("median_seconds")
+            if reference and result["median_seconds"] > reference * (1 + args.tolerance):
+                failures.append(
+                    f"{name} took {result['median_seconds'] * 1000:.1f} ms, baseline {reference * 1000:.1f} ms (+{args.tolerance:.0%} allowed)"
+                )
+
+    if args.save:
+        with open(args.save, "w") as stream:
+            json.dump(results, stream, indent=2)
+
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""A deterministic stand-in for `HfApiModel`.
+
+It answers every review the same way: the first step reads the first page of the diff
+with `get_pr_diff_page`, the second calls `final_answer` with a summary of what that
+page contained. Token counts are estimated from the message lengths, and an optional
+latency per call and per output token imitates a real endpoint.
+"""
+import re
+import time
+from typing import Dict, List, Optional
+
+from smolagents.models import ChatMessage, MessageRole, Model
+
+_PR_URL = re.compile(r"(https://github\.com/[\w.-]+/[\w.-]+)/pull/(\d+)")
+
+READ_DIFF = """Thought: I will read the first page of the diff before writing the review.
+Code:
+```py
+page = get_pr_diff_page("{repo}", {number})
+print(page[:4000])
+```"""
+
+ANSWER = """Thought: I have what I need for the review.
+Code:
+```py
+final_answer("Reviewed {repo}/pull/{number}: the first diff page has " + str(len(page.splitlines())) + " lines.")
+```"""
+
+
+def reply(conversation: str, steps_done: int) -> str:
+    """The stub's answer to a conversation in which it has already taken `steps_done` steps."""
+    match = _PR_URL.search(conversation)
+    repo, number = match.groups() if match else ("https://github.com/bench/repo", "1")
+    return (READ_DIFF if steps_done == 0 else ANSWER).format(repo=repo, number=number)
+
+
+class StubModel(Model):
+    def __init__(self, latency: float = 0.0, seconds_per_token: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.model_id = "benchmark-stub"
+        self.latency = latency
+        self.seconds_per_token = seconds_per_token
+        self.calls = 0
+
+    def __call__(
+        self,
+        messages: List[Dict[str, str]],
+        stop_sequences: Optional[List[str]] = None,
+        grammar: Optional[str] = None,
+        tools_to_call_from=None,
+        **kwargs,
+    ) -> ChatMessage:
+        self.calls += 1
+        texts = [_text(message.get("content")) for message in messages]
+        steps_done = sum(1 for message in messages if message.get("role") in (MessageRole.ASSISTANT, "assistant"))
+        content = reply("\n".join(texts), steps_done)
+
+        input_tokens = sum(len(text) for text in texts) // 4
+        output_tokens = len(content) // 4
+        delay = self.latency + self.seconds_per_token * output_tokens
+        if delay:
+            time.sleep(delay)
+        # Usage in the shape of an OpenAI-style response, per call, as the real models report it.
+        usage = {"prompt_tokens": input_tokens, "completion_tokens": output_tokens}
+        return ChatMessage(role="assistant", content=content, raw={"usage": usage})
+
+
+def _text(content) -> str:
+    if isinstance(content, list):
+        return "\n".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
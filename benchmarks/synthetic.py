@@ -0,0 +1,134 @@
+"""Synthetic pull requests of a given size for the benchmarks.
+
+The generated Python code is deterministic for a seed and contains what the analyzers
+look for (long functions, deep nesting, eval/os.system calls, hardcoded secrets, TODOs),
+so the benchmarks exercise the same paths as real reviews.
+"""
+import hashlib
+import random
+from typing import Dict, List, Tuple
+
+# Lines per generated file; larger PRs get more files rather than longer ones.
+LINES_PER_FILE = 400
+
+_RISKY = [
+    "    result = eval(expression)",
+    '    password = "hunter2-{n}"',
+    '    os.system("rm -rf " + path)',
+    '    cursor.execute(f"SELECT * FROM users WHERE id = {{user_id}}")',
+    "    # TODO: handle the empty case",
+    "    data = pickle.loads(payload)",
+]
+
+
+def blob_sha(text: str) -> str:
+    """The git blob SHA of `text`, as GitHub reports it for the file at the PR head."""
+    data = text.encode("utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def _function(rng: random.Random, index: int) -> List[str]:
+    lines = [f"def handler_{index}(items, expression, path, payload, user_id):", "    total = 0"]
+    depth = 1
+    for _ in range(rng.randint(3, 45)):
+        roll = rng.random()
+        indent = "    " * depth
+        if roll < 0.12 and depth < 5:
+            lines.append(f"{indent}for item_{depth} in items:")
+            depth += 1
+        elif roll < 0.2 and depth < 5:
+            lines.append(f"{indent}if total > {rng.randint(1, 99)}:")
+            depth += 1
+        elif roll < 0.26 and depth > 1:
+            depth -= 1
+            lines.append(f"{'    ' * depth}total += 1")
+        elif roll < 0.31:
+            lines.append(indent[4:] + rng.choice(_RISKY).format(n=index))
+        else:
+            lines.append(f"{indent}total += len(str(items)) * {rng.randint(1, 9)}")
+    lines.append("    return total")
+    lines.append("")
+    return lines
+
+
+def _source(rng: random.Random, count: int, first_index: int) -> List[str]:
+    lines = ["import os", "import pickle", ""]
+    index = first_index
+    while len(lines) < count:
+        lines.extend(_function(rng, index))
+        index += 1
+    return lines[:count]
+
+
+def _file_diff(rng: random.Random, path: str, new_lines: List[str], added: bool) -> Tuple[str, str, int, int]:
+    """Returns (diff section, GitHub `patch`, additions, deletions) for one file."""
+    if added:
+        body = ["+" + line for line in new_lines]
+        hunk = f"@@ -0,0 +1,{len(new_lines)} @@"
+        header = [f"diff --git a/{path} b/{path}", "new file mode 100644", "index 0000000..1111111", "--- /dev/null", f"+++ b/{path}"]
+        additions, deletions = len(new_lines), 0
+    else:
+        body = []
+        additions = deletions = context = 0
+        for line in new_lines:
+            roll = rng.random()
+            if roll < 0.08:
+                body.append("-" + line.replace("total", "count", 1))
+                deletions += 1
+            if roll < 0.35:
+                body.append("+" + line)
+                additions += 1
+            else:
+                body.append(" " + line)
+                context += 1
+        hunk = f"@@ -1,{context + deletions} +1,{context + additions} @@"
+        header = [f"diff --git a/{path} b/{path}", "index 1111111..2222222 100644", f"--- a/{path}", f"+++ b/{path}"]
+    patch = "\n".join([hunk] + body)
+    return "\n".join(header) + "\n" + patch + "\n", patch, additions, deletions
+
+
+def synthetic_pr(number: int, lines: int, seed: int = 0) -> Dict:
+    """A pull request whose diff has about `lines` lines, in the fixture format of `fake_github`."""
+    rng = random.Random(f"{seed}:{number}:{lines}")
+    diff_parts: List[str] = []
+    files: List[dict] = []
+    blobs: Dict[str, str] = {}
+    remaining = max(lines, 1)
+    index = 0
+    while remaining > 0:
+        count = min(remaining, LINES_PER_FILE)
+        remaining -= count
+        path = f"pkg/module_{index}.py"
+        new_lines = _source(rng, count, index * 1000)
+        section, patch, additions, deletions = _file_diff(rng, path, new_lines, added=index % 2 == 0)
+        source = "\n".join(new_lines) + "\n"
+        sha = blob_sha(source)
+        blobs[sha] = source
+        diff_parts.append(section)
+        files.append(
+            {
+                "filename": path,
+                "status": "added" if index % 2 == 0 else "modified",
+                "additions": additions,
+                "deletions": deletions,
+                "changes": additions + deletions,
+                "sha": sha,
+                "patch": patch,
+            }
+        )
+        index += 1
+    head_sha = hashlib.sha1(f"{seed}:{number}:{lines}".encode()).hexdigest()
+    metadata = {
+        "number": number,
+        "title": f"Synthetic change of {lines} lines",
+        "state": "open",
+        "user": {"login": "bench"},
+        "body": "Generated by benchmarks/synthetic.py.",
+        "head": {"ref": f"bench-{number}", "sha": head_sha},
+        "base": {"ref": "main", "sha": "0" * 40},
+        "additions": sum(info["additions"] for info in files),
+        "deletions": sum(info["deletions"] for info in files),
+        "changed_files": len(files),
+        "html_url": f"https://github.com/bench/repo/pull/{number}",
+    }
+    return {"metadata": metadata, "files": files, "diff": "".join(diff_parts), "blobs": blobs}
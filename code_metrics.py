@@ -0,0 +1,118 @@
+import ast
+from typing import List, Optional
+
+
+class FunctionMetrics:
+    """Size and complexity of one function. `statements` counts top-level body statements."""
+
+    __slots__ = ("name", "lineno", "end_lineno", "statements", "max_loop_depth", "complexity")
+
+    def __init__(self, node):
+        self.name = node.name
+        self.lineno = node.lineno
+        self.end_lineno = node.end_lineno or node.lineno
+        self.statements = len(node.body)
+        self.max_loop_depth = 0
+        self.complexity = 1
+
+    @property
+    def length(self) -> int:
+        return self.end_lineno - self.lineno + 1
+
+    def __repr__(self):
+        return f"FunctionMetrics({self.name!r}, line={self.lineno}, complexity={self.complexity})"
+
+
+class LoopNest:
+    """An outermost loop and the deepest loop nesting found inside it."""
+
+    __slots__ = ("lineno", "end_lineno", "depth")
+
+    def __init__(self, node):
+        self.lineno = node.lineno
+        self.end_lineno = node.end_lineno or node.lineno
+        self.depth = 1
+
+    def __repr__(self):
+        return f"LoopNest(line={self.lineno}, depth={self.depth})"
+
+
+class ModuleMetrics:
+    __slots__ = ("functions", "loop_nests")
+
+    def __init__(self, functions: List[FunctionMetrics], loop_nests: List[LoopNest]):
+        self.functions = functions
+        self.loop_nests = loop_nests
+
+
+class MetricsVisitor(ast.NodeVisitor):
+    """Collects function size, loop nesting and cyclomatic complexity in a single traversal.
+
+    Loop depth is tracked on the way down instead of re-walking every loop's subtree,
+    so the cost is linear in the size of the tree and each nest is reported once, at
+    its outermost loop. Nested functions start a fresh loop depth and complexity count.
+    """
+
+    def __init__(self):
+        self.functions: List[FunctionMetrics] = []
+        self.loop_nests: List[LoopNest] = []
+        self._function: Optional[FunctionMetrics] = None
+        self._loop_depth = 0
+        self._nest: Optional[LoopNest] = None
+
+    def _visit_function(self, node):
+        metrics = FunctionMetrics(node)
+        self.functions.append(metrics)
+        saved = (self._function, self._loop_depth, self._nest)
+        self._function, self._loop_depth, self._nest = metrics, 0, None
+        self.generic_visit(node)
+        self._function, self._loop_depth, self._nest = saved
+
+    visit_FunctionDef = _visit_function
+    visit_AsyncFunctionDef = _visit_function
+
+    def _visit_loop(self, node):
+        self._branch()
+        outermost = self._nest is None
+        if outermost:
+            self._nest = LoopNest(node)
+        self._loop_depth += 1
+        self._nest.depth = max(self._nest.depth, self._loop_depth)
+        if self._function is not None:
+            self._function.max_loop_depth = max(self._function.max_loop_depth, self._loop_depth)
+        self.generic_visit(node)
+        self._loop_depth -= 1
+        if outermost:
+            self.loop_nests.append(self._nest)
+            self._nest = None
+
+    visit_For = _visit_loop
+    visit_AsyncFor = _visit_loop
+    visit_While = _visit_loop
+
+    def _branch(self, count: int = 1):
+        if self._function is not None:
+            self._function.complexity += count
+
+    def _visit_branch(self, node):
+        self._branch()
+        self.generic_visit(node)
+
+    visit_If = _visit_branch
+    visit_IfExp = _visit_branch
+    visit_ExceptHandler = _visit_branch
+    visit_match_case = _visit_branch
+
+    def visit_comprehension(self, node):
+        self._branch(1 + len(node.ifs))
+        self.generic_visit(node)
+
+    def visit_BoolOp(self, node):
+        self._branch(len(node.values) - 1)
+        self.generic_visit(node)
+
+
+def collect_metrics(tree: ast.AST) -> ModuleMetrics:
+    visitor = MetricsVisitor()
+    visitor.visit(tree)
+    return ModuleMetrics(visitor.functions, visitor.loop_nests)
@@ -0,0 +1,159 @@
+import ast
+import hashlib
+import textwrap
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from code_metrics import collect_metrics
+from diff_parser import FileDiff, ParsedDiff
+
+PYTHON_EXTENSIONS = (".py", ".pyi")
+
+LONG_FUNCTION_STATEMENTS = 20
+DEEP_LOOP_DEPTH = 3
+HIGH_COMPLEXITY = 10
+
+# Returns (source, blob_sha) of a file at the PR head, or None if it is unavailable.
+SourceLoader = Callable[[str], Optional[Tuple[str, str]]]
+
+
+def is_python_path(path: str) -> bool:
+    # Bare patches from the files API carry no path; give them the benefit of the doubt.
+    return not path or path.endswith(PYTHON_EXTENSIONS)
+
+
+def blob_sha(source: str) -> str:
+    """Git blob SHA of `source`, identical to the `sha` GitHub reports for the file."""
+    data = source.encode("utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+_ast_cache: "OrderedDict[str, object]" = OrderedDict()
+_ast_cache_lock = threading.Lock()
+_AST_CACHE_SIZE = 256
+
+
+def parse_source(source: str, sha: Optional[str] = None) -> ast.Module:
+    """Parses Python source once per blob SHA; repeated calls return the cached tree.
+
+    Raises:
+        SyntaxError: If the source does not parse (the failure is cached as well).
+    """
+    sha = sha or blob_sha(source)
+    with _ast_cache_lock:
+        cached = _ast_cache.get(sha)
+        if cached is not None:
+            _ast_cache.move_to_end(sha)
+    if cached is None:
+        try:
+            cached = ast.parse(source)
+        except SyntaxError as e:
+            # Only the details are kept: a cached exception would collect the traceback
+            # (and so the frames) of every caller it is raised in.
+            cached = (e.msg, e.lineno, e.offset, e.text)
+        except ValueError as e:
+            cached = (str(e), None, None, None)
+        with _ast_cache_lock:
+            _ast_cache[sha] = cached
+            while len(_ast_cache) > _AST_CACHE_SIZE:
+                _ast_cache.popitem(last=False)
+    if isinstance(cached, tuple):
+        msg, lineno, offset, text = cached
+        raise SyntaxError(msg, ("<unknown>", lineno, offset, text)) if lineno is not None else SyntaxError(msg)
+    return cached
+
+
+def _touches(changed: Sequence[int], first: int, last: int) -> bool:
+    """Whether any line in the sorted `changed` list falls within [first, last]."""
+    index = bisect_left(changed, first)
+    return index < len(changed) and changed[index] <= last
+
+
+def find_smells(tree: ast.AST, changed: Sequence[int], line_offset: int = 0) -> List[Tuple[int, str]]:
+    """Long or complex functions and deeply nested loops overlapping changed lines.
+
+    Args:
+        tree: The parsed module.
+        changed: Sorted new-file line numbers of the added lines.
+        line_offset: Added to the tree's line numbers to map them onto the new file.
+    """
+    metrics = collect_metrics(tree)
+    smells = []
+    for function in metrics.functions:
+        first = function.lineno + line_offset
+        if not _touches(changed, first, function.end_lineno + line_offset):
+            continue
+        if function.statements > LONG_FUNCTION_STATEMENTS:
+            smells.append((first, f"Long function detected: {function.name} ({function.statements} statements, {function.length} lines)"))
+        if function.complexity > HIGH_COMPLEXITY:
+            smells.append((first, f"High cyclomatic complexity detected: {function.name} (complexity {function.complexity})"))
+    for nest in metrics.loop_nests:
+        first = nest.lineno + line_offset
+        if nest.depth >= DEEP_LOOP_DEPTH and _touches(changed, first, nest.end_lineno + line_offset):
+            smells.append((first, f"Deeply nested loop detected at line {first} (depth {nest.depth})"))
+    smells.sort()
+    return smells
+
+
+def parse_fragment(text: str) -> Optional[ast.Module]:
+    """Parses a hunk's new-side text, or returns None if it is not self-contained Python."""
+    # Hunks frequently start inside an indented block; dedenting recovers most of them.
+    for candidate in (text, textwrap.dedent(text)):
+        try:
+            return parse_source(candidate)
+        except SyntaxError:
+            continue
+    return None
+
+
+def find_smells_in_file(file_diff: FileDiff, loaded: Optional[Tuple[str, str]] = None) -> Tuple[List[Tuple[int, str]], List[str]]:
+    """Smells as (new-file line, message) in one file, plus notes about skipped code.
+
+    Args:
+        file_diff: The parsed diff of the file.
+        loaded: Optional; (source, blob_sha) of the whole file at the PR head. Without it
+            each changed hunk is parsed on its own.
+    """
+    changed = sorted(file_diff.added_line_numbers())
+    if loaded is not None:
+        source, sha = loaded
+        try:
+            return find_smells(parse_source(source, sha), changed), []
+        except SyntaxError as e:
+            return [], [f"could not parse the file at the PR head ({e.msg}, line {e.lineno})"]
+
+    smells, notes = [], []
+    for hunk in file_diff.hunks:
+        if not any(line.kind == "+" for line in hunk.lines):
+            continue
+        tree = parse_fragment("\n".join(line.text for line in hunk.new_lines()))
+        if tree is None:
+            notes.append(f"hunk at line {hunk.new_start} is not a self-contained Python fragment and was skipped")
+            continue
+        smells.extend(find_smells(tree, changed, line_offset=hunk.new_start - 1))
+    return smells, notes
+
+
+def detect_smells(parsed: ParsedDiff, load_source: Optional[SourceLoader] = None) -> Tuple[List[Tuple[str, int, str]], List[str]]:
+    """Runs the smell checks on every changed Python file of a diff.
+
+    Each file is analyzed on its own. With `load_source` the whole file at the PR head is
+    parsed (once per blob SHA); otherwise each changed hunk is parsed separately. Only
+    constructs overlapping added lines are reported.
+
+    Returns:
+        A list of (path, line, message) smells and a list of notes about skipped code.
+    """
+    smells, notes = [], []
+    for file_diff in parsed.files:
+        if file_diff.is_deleted or file_diff.is_binary or not is_python_path(file_diff.path):
+            continue
+        if not file_diff.added_line_numbers():
+            continue
+        loaded = load_source(file_diff.path) if load_source is not None and file_diff.path else None
+        file_smells, file_notes = find_smells_in_file(file_diff, loaded)
+        smells.extend((file_diff.path, line, message) for line, message in file_smells)
+        notes.extend(f"{file_diff.path or 'diff'}: {note}" for note in file_notes)
+    return smells, notes
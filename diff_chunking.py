@@ -0,0 +1,401 @@
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from diff_parser import ADDED, REMOVED, DiffLine, FileDiff, Hunk, ParsedDiff
+from security_rules import DEFAULT_RULES, Hit, RuleSet
+
+TOKENIZER_ID = os.getenv("DIFF_TOKENIZER", "Qwen/Qwen2.5-Coder-32B-Instruct")
+DEFAULT_TOKEN_BUDGET = int(os.getenv("DIFF_TOKEN_BUDGET", "4000"))
+# Smaller budgets are raised to this, which leaves room for a page's header and index.
+MIN_TOKEN_BUDGET = 500
+# Rough characters per token for code, used when the model's tokenizer is unavailable.
+CHARS_PER_TOKEN = 4
+
+# Files whose diff says little to a reviewer; they are reduced to a one-line summary.
+COLLAPSED_PATTERNS: List[Tuple[str, re.Pattern]] = [
+    ("lockfile", re.compile(
+        r"(^|/)(package-lock\.json|npm-shrinkwrap\.json|yarn\.lock|pnpm-lock\.yaml|poetry\.lock|Pipfile\.lock|uv\.lock"
+        r"|Cargo\.lock|Gemfile\.lock|composer\.lock|go\.sum|packages\.lock\.json|mix\.lock|pubspec\.lock)$"
+    )),
+    ("vendored", re.compile(r"(^|/)(vendor|vendored|third_party|third-party|node_modules|bower_components)/")),
+    ("generated", re.compile(
+        r"(\.min\.(js|css)|\.map|_pb2(_grpc)?\.pyi?|\.pb\.go|\.generated\.\w+|\.g\.dart|\.snap)$|(^|/)(dist|build)/"
+    )),
+]
+# Markers that tools write at the top of generated files.
+GENERATED_MARKERS = re.compile(r"@generated|DO NOT EDIT|auto-generated|autogenerated", re.IGNORECASE)
+
+SOURCE_EXTENSIONS = {
+    ".py", ".js", ".jsx", ".ts", ".tsx", ".go", ".java", ".kt", ".rb", ".rs", ".c", ".h", ".cc", ".cpp", ".hpp",
+    ".cs", ".php", ".scala", ".swift", ".sh", ".sql",
+}
+CONFIG_EXTENSIONS = {".yml", ".yaml", ".json", ".toml", ".ini", ".cfg", ".conf", ".env", ".xml", ".tf"}
+DOC_EXTENSIONS = {".md", ".rst", ".txt", ".adoc"}
+SENSITIVE_PATH = re.compile(r"auth|login|passw|secret|token|crypt|permission|security|session|\.github/workflows", re.IGNORECASE)
+
+SEVERITY_WEIGHTS = {"high": 8.0, "medium": 4.0, "low": 1.0}
+# Most of a page that its header, collapsed files and index of the other pages may take.
+PAGE_OVERHEAD_SHARE = 0.25
+
+
+class TokenCounter:
+    """Counts tokens with the model's tokenizer when `transformers` can load it.
+
+    The tokenizer is loaded on first use. Without `transformers`, or when the tokenizer
+    cannot be downloaded, counts fall back to characters / `CHARS_PER_TOKEN`.
+    """
+
+    def __init__(self, model_id: str = TOKENIZER_ID):
+        self.model_id = model_id
+        self._tokenizer = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if not self._loaded:
+                try:
+                    from transformers import AutoTokenizer
+
+                    self._tokenizer = AutoTokenizer.from_pretrained(self.model_id)
+                except Exception as e:
+                    print(f"Tokenizer for {self.model_id} unavailable ({e}); estimating tokens from characters.")
+                self._loaded = True
+        return self._tokenizer
+
+    @property
+    def exact(self) -> bool:
+        return self._load() is not None
+
+    def count(self, text: str) -> int:
+        tokenizer = self._tokenizer if self._loaded else self._load()
+        if tokenizer is None:
+            return math.ceil(len(text) / CHARS_PER_TOKEN)
+        return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+class DiffChunk:
+    """A renderable piece of a file diff: whole hunks, or part of one oversized hunk."""
+
+    __slots__ = ("path", "text", "tokens", "additions", "deletions", "added_numbers", "hits", "part", "score")
+
+    def __init__(self, path: str, text: str, tokens: int, lines: List[DiffLine], part: str = ""):
+        self.path = path
+        self.text = text
+        self.tokens = tokens
+        self.additions = sum(1 for line in lines if line.kind == ADDED)
+        self.deletions = sum(1 for line in lines if line.kind == REMOVED)
+        self.added_numbers = frozenset(line.new_lineno for line in lines if line.kind == ADDED)
+        self.hits: List[Hit] = []
+        self.part = part
+        self.score = 0.0
+
+    def label(self) -> str:
+        return f"{self.path}{' ' + self.part if self.part else ''} (+{self.additions} -{self.deletions})"
+
+    def flags(self) -> List[str]:
+        return [f"# Flagged [{hit.rule.severity}] line {hit.line}: {hit.rule.message}" for hit in self.hits]
+
+    def __repr__(self):
+        return f"DiffChunk({self.path!r}, {self.part!r}, tokens={self.tokens}, score={self.score:.1f})"
+
+
+def _index_entry(number: int, parts: List[DiffChunk]) -> str:
+    if len(parts) == 1:
+        return f"- page {number}: {parts[0].label()}"
+    added = sum(chunk.additions for chunk in parts)
+    removed = sum(chunk.deletions for chunk in parts)
+    return f"- page {number}: {parts[0].path} ({len(parts)} parts, +{added} -{removed})"
+
+
+def _fit_lines(lines: List[str], room: int, count: Callable[[str], int]) -> Tuple[List[str], int]:
+    """Keeps the leading `lines` that fit in `room` tokens and counts the rest in a last line."""
+    costs = [count(line) + 1 for line in lines]
+    if sum(costs) <= room:
+        return lines, room - sum(costs)
+    room -= count(f"- ... and {len(lines)} more") + 1
+    kept = []
+    for line, cost in zip(lines, costs):
+        if cost > room:
+            break
+        kept.append(line)
+        room -= cost
+    kept.append(f"- ... and {len(lines) - len(kept)} more")
+    return kept, max(room, 0)
+
+
+class ChunkedDiff:
+    """Chunks packed into pages of at most `budget` tokens, most relevant page first.
+
+    Chunks fill a page only up to what `chunk_diff` reserved for the page's header, the
+    collapsed files and the index of the other pages; whatever of those does not fit the
+    rest of the budget is cut short and counted.
+    """
+
+    __slots__ = ("pages", "collapsed", "budget", "counter")
+
+    def __init__(self, pages: List[List[DiffChunk]], collapsed: List[str], budget: int, counter: "TokenCounter"):
+        self.pages = pages
+        self.collapsed = collapsed
+        self.budget = budget
+        self.counter = counter
+
+    @property
+    def exact_tokens(self) -> bool:
+        return self.counter.exact
+
+    def _header(self, page: int) -> str:
+        unit = "tokens" if self.exact_tokens else "estimated tokens"
+        return f"Diff page {page} of {max(len(self.pages), 1)} (budget {self.budget} {unit}, riskiest changes first)."
+
+    def _index(self, page: int) -> List[str]:
+        """One line per file and other page, so a file cut into many chunks takes one line per page."""
+        entries = []
+        for number, chunks in enumerate(self.pages, start=1):
+            if number == page:
+                continue
+            files: Dict[str, List[DiffChunk]] = {}
+            for chunk in chunks:
+                files.setdefault(chunk.path, []).append(chunk)
+            entries.extend(_index_entry(number, parts) for parts in files.values())
+        return entries
+
+    def render_page(self, page: int) -> str:
+        """Renders page `page` (1-indexed) with an index of the chunks on the other pages."""
+        if not 1 <= page <= max(len(self.pages), 1):
+            return f"Error: page must be between 1 and {max(len(self.pages), 1)}."
+        count = self.counter.count
+        chunks = self.pages[page - 1] if self.pages else []
+        body = [line for chunk in chunks for line in chunk.flags() + [chunk.text]] or ["No reviewable changes."]
+        lines = [self._header(page)]
+        # `chunk.tokens` already counts the chunk's flags and the newline before it.
+        room = self.budget - count(lines[0]) - sum(chunk.tokens for chunk in chunks) - 2
+        if self.collapsed:
+            collapsed, room = _fit_lines([f"- {summary}" for summary in self.collapsed], room - count("Collapsed files:") - 1, count)
+            lines.append("Collapsed files:")
+            lines.extend(collapsed)
+        index = self._index(page)
+        if index:
+            index, room = _fit_lines(index, room - count("On other pages:") - 1, count)
+            lines.append("On other pages:")
+            lines.extend(index)
+        lines.append("")
+        lines.extend(body)
+        return "\n".join(lines)
+
+
+def collapse_reason(file_diff: FileDiff) -> Optional[str]:
+    """Returns why a file is summarized instead of shown (lockfile, vendored, generated, binary)."""
+    if file_diff.is_binary:
+        return "binary"
+    for reason, pattern in COLLAPSED_PATTERNS:
+        if pattern.search(file_diff.path):
+            return reason
+    head = file_diff.hunks[0].lines[:5] if file_diff.hunks and file_diff.hunks[0].new_start <= 1 else []
+    if any(line.kind != REMOVED and GENERATED_MARKERS.search(line.text) for line in head):
+        return "generated"
+    return None
+
+
+def file_weight(path: str) -> float:
+    """How much a change in this kind of file matters for review."""
+    name = path.lower()
+    extension = os.path.splitext(name)[1]
+    if "test" in name.split("/")[-1] or "/tests/" in f"/{name}":
+        weight = 0.6
+    elif extension in SOURCE_EXTENSIONS:
+        weight = 1.0
+    elif extension in CONFIG_EXTENSIONS or name.endswith("dockerfile"):
+        weight = 0.8
+    elif extension in DOC_EXTENSIONS:
+        weight = 0.3
+    else:
+        weight = 0.5
+    if SENSITIVE_PATH.search(path):
+        weight += 0.5
+    return weight
+
+
+def _file_header(file_diff: FileDiff) -> str:
+    old_path = file_diff.old_path or file_diff.path
+    old = "/dev/null" if file_diff.is_new else f"a/{old_path}"
+    new = "/dev/null" if file_diff.is_deleted else f"b/{file_diff.path}"
+    return f"diff --git a/{old_path} b/{file_diff.path}\n--- {old}\n+++ {new}"
+
+
+def _render_hunk(lines: List[DiffLine], old_start: int, new_start: int, section: str) -> str:
+    old_count = sum(1 for line in lines if line.kind != ADDED)
+    new_count = sum(1 for line in lines if line.kind != REMOVED)
+    header = f"@@ -{old_start},{old_count} +{new_start},{new_count} @@{' ' + section if section else ''}"
+    return "\n".join([header] + [line.kind + line.text for line in lines])
+
+
+def _split_hunk(hunk: Hunk, max_lines: int) -> List[Tuple[List[DiffLine], str]]:
+    """Cuts a hunk into consecutive sub-hunks of at most `max_lines` lines, each with its own header."""
+    pieces = []
+    old_no, new_no = hunk.old_start, hunk.new_start
+    for start in range(0, len(hunk.lines), max_lines):
+        lines = hunk.lines[start : start + max_lines]
+        pieces.append((lines, _render_hunk(lines, old_no, new_no, hunk.section)))
+        old_no += sum(1 for line in lines if line.kind != ADDED)
+        new_no += sum(1 for line in lines if line.kind != REMOVED)
+    return pieces
+
+
+def _chunk_file(file_diff: FileDiff, budget: int, count: Callable[[str], int]) -> List[DiffChunk]:
+    """Splits one file along hunk boundaries so every chunk fits the budget.
+
+    A hunk that alone exceeds the budget is cut into sub-hunks.
+    """
+    header = _file_header(file_diff)
+    header_tokens = count(header)
+    room = max(budget - header_tokens, 1)
+
+    pieces = []
+    for hunk in file_diff.hunks:
+        text = _render_hunk(hunk.lines, hunk.old_start, hunk.new_start, hunk.section)
+        tokens = count(text)
+        if tokens <= room or len(hunk.lines) <= 1:
+            pieces.append((hunk.lines, text, tokens))
+            continue
+        max_lines = max(1, len(hunk.lines) * room // tokens)
+        pieces.extend((lines, text, count(text)) for lines, text in _split_hunk(hunk, max_lines))
+
+    groups: List[list] = []
+    used = room
+    for piece in pieces:
+        # Pieces are joined by a newline, which costs about one token.
+        if used + piece[2] + 1 > room:
+            groups.append([])
+            used = 0
+        groups[-1].append(piece)
+        used += piece[2] + 1
+
+    return [
+        DiffChunk(
+            file_diff.path,
+            "\n".join([header] + [piece[1] for piece in group]),
+            header_tokens + sum(piece[2] + 1 for piece in group),
+            [line for piece in group for line in piece[0]],
+            f"part {index}/{len(groups)}" if len(groups) > 1 else "",
+        )
+        for index, group in enumerate(groups, start=1)
+    ]
+
+
+def _score(chunk: DiffChunk) -> float:
+    size = math.log2(1 + chunk.additions + chunk.deletions)
+    security = sum(SEVERITY_WEIGHTS.get(hit.rule.severity, 1.0) for hit in chunk.hits)
+    return file_weight(chunk.path) * size + security
+
+
+def _page_overhead(files: List[FileDiff], collapsed: List[str], budget: int, counter: TokenCounter) -> int:
+    """Tokens a page keeps free for its header, the collapsed files and the index of the other pages.
+
+    The index is estimated as one line per file; it and the collapsed files get at most
+    `PAGE_OVERHEAD_SHARE` of the budget and are cut short when rendered if they need more.
+    """
+    header = counter.count(f"Diff page 99 of 99 (budget {budget} estimated tokens, riskiest changes first).") + 2
+    overview = ["Collapsed files:"] + [f"- {summary}" for summary in collapsed] if collapsed else []
+    overview += ["On other pages:"] + [f"- page 99: {file_diff.path} (99 parts, +9999 -9999)" for file_diff in files]
+    return header + min(sum(counter.count(line) + 1 for line in overview), int(budget * PAGE_OVERHEAD_SHARE))
+
+
+def chunk_diff(
+    parsed: ParsedDiff,
+    budget: int = DEFAULT_TOKEN_BUDGET,
+    counter: Optional[TokenCounter] = None,
+    rules: RuleSet = DEFAULT_RULES,
+) -> ChunkedDiff:
+    """Splits a parsed diff into token-budgeted pages, riskiest chunks first.
+
+    Lockfiles, vendored, generated and binary files become one-line summaries. Every
+    other file is cut along hunk boundaries into chunks that fit `budget` less the
+    page's overview (`_page_overhead`), scored by security hits on their added lines,
+    size and file type, and packed into pages in order of score. Budgets below
+    `MIN_TOKEN_BUDGET` are raised to it.
+    """
+    budget = max(budget, MIN_TOKEN_BUDGET)
+    counter = counter or get_token_counter()
+    collapsed = []
+    reviewable: List[FileDiff] = []
+    for file_diff in parsed.files:
+        reason = collapse_reason(file_diff)
+        if reason is not None:
+            added = sum(1 for hunk in file_diff.hunks for line in hunk.lines if line.kind == ADDED)
+            removed = sum(1 for hunk in file_diff.hunks for line in hunk.lines if line.kind == REMOVED)
+            collapsed.append(f"{file_diff.path}: {reason}, +{added} -{removed} lines (not shown)")
+        elif file_diff.hunks:
+            reviewable.append(file_diff)
+    content_budget = budget - _page_overhead(reviewable, collapsed, budget, counter)
+
+    chunks: List[DiffChunk] = []
+    for file_diff in reviewable:
+        file_chunks = _chunk_file(file_diff, content_budget, counter.count)
+        for hit in rules.scan(ParsedDiff([file_diff])):
+            for chunk in file_chunks:
+                if hit.line in chunk.added_numbers:
+                    chunk.hits.append(hit)
+                    break
+        for chunk in file_chunks:
+            chunk.score = _score(chunk)
+            if chunk.hits:
+                chunk.tokens += counter.count("\n".join(chunk.flags())) + 1
+        chunks.extend(file_chunks)
+
+    chunks.sort(key=lambda chunk: -chunk.score)
+    pages: List[List[DiffChunk]] = []
+    used: List[int] = []
+    for chunk in chunks:
+        # First fit keeps the riskiest chunks on the earliest pages.
+        for index, total in enumerate(used):
+            if total + chunk.tokens <= content_budget:
+                pages[index].append(chunk)
+                used[index] += chunk.tokens
+                break
+        else:
+            pages.append([chunk])
+            used.append(chunk.tokens)
+    return ChunkedDiff(pages, collapsed, budget, counter)
+
+
+_chunked: "OrderedDict[tuple, ChunkedDiff]" = OrderedDict()
+_chunked_lock = threading.Lock()
+_CHUNKED_SIZE = 16
+
+
+def chunk_pr_diff(key: tuple, parse: Callable[[], ParsedDiff], budget: int = DEFAULT_TOKEN_BUDGET) -> ChunkedDiff:
+    """`chunk_diff` memoized by a caller-chosen key, e.g. (repository, PR number, head SHA).
+
+    `parse` is only called on a miss, so paging through a PR decodes, parses, tokenizes
+    and scores its diff only once.
+    """
+    budget = max(budget, MIN_TOKEN_BUDGET)
+    with _chunked_lock:
+        chunked = _chunked.get((key, budget))
+        if chunked is not None:
+            _chunked.move_to_end((key, budget))
+            return chunked
+    chunked = chunk_diff(parse(), budget)
+    with _chunked_lock:
+        _chunked[(key, budget)] = chunked
+        while len(_chunked) > _CHUNKED_SIZE:
+            _chunked.popitem(last=False)
+    return chunked
+
+
+_counters: Dict[str, TokenCounter] = {}
+_counters_lock = threading.Lock()
+
+
+def get_token_counter(model_id: str = TOKENIZER_ID) -> TokenCounter:
+    """Returns the shared counter for `model_id`, so its tokenizer is loaded once per process."""
+    with _counters_lock:
+        counter = _counters.get(model_id)
+        if counter is None:
+            counter = _counters[model_id] = TokenCounter(model_id)
+        return counter
@@ -0,0 +1,249 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, Optional
+
+_HUNK_HEADER = re.compile(r"@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@ ?(.*)")
+
+ADDED = "+"
+REMOVED = "-"
+CONTEXT = " "
+
+
+class DiffLine:
+    """A single line of a hunk. Line numbers are None on the side the line does not exist."""
+
+    __slots__ = ("kind", "old_lineno", "new_lineno", "text")
+
+    def __init__(self, kind: str, old_lineno: Optional[int], new_lineno: Optional[int], text: str):
+        self.kind = kind
+        self.old_lineno = old_lineno
+        self.new_lineno = new_lineno
+        self.text = text
+
+    def __repr__(self):
+        return f"DiffLine({self.kind!r}, {self.old_lineno}, {self.new_lineno}, {self.text!r})"
+
+
+class Hunk:
+    __slots__ = ("old_start", "old_count", "new_start", "new_count", "section", "lines")
+
+    def __init__(self, old_start: int, old_count: int, new_start: int, new_count: int, section: str = ""):
+        self.old_start = old_start
+        self.old_count = old_count
+        self.new_start = new_start
+        self.new_count = new_count
+        self.section = section
+        self.lines: List[DiffLine] = []
+
+    def new_lines(self) -> List[DiffLine]:
+        """Lines present in the new version of the file (context and added)."""
+        return [line for line in self.lines if line.kind != REMOVED]
+
+
+class FileDiff:
+    """The hunks of one file. `path` is the new path, or the old one for deleted files."""
+
+    __slots__ = ("path", "old_path", "hunks", "is_new", "is_deleted", "is_binary", "_added_numbers")
+
+    def __init__(self, path: str = "", old_path: str = ""):
+        self.path = path
+        self.old_path = old_path
+        self.hunks: List[Hunk] = []
+        self.is_new = False
+        self.is_deleted = False
+        self.is_binary = False
+        self._added_numbers: Optional[FrozenSet[int]] = None
+
+    def added_lines(self) -> List[DiffLine]:
+        return [line for hunk in self.hunks for line in hunk.lines if line.kind == ADDED]
+
+    def added_line_numbers(self) -> FrozenSet[int]:
+        """New-file line numbers of every added line."""
+        if self._added_numbers is None:
+            self._added_numbers = frozenset(line.new_lineno for line in self.added_lines())
+        return self._added_numbers
+
+    def __repr__(self):
+        return f"FileDiff({self.path!r}, hunks={len(self.hunks)})"
+
+
+class ParsedDiff:
+    """A parsed unified diff: files -> hunks -> lines."""
+
+    __slots__ = ("files", "_by_path")
+
+    def __init__(self, files: List[FileDiff]):
+        self.files = files
+        self._by_path: Dict[str, FileDiff] = {f.path: f for f in files}
+
+    def file(self, path: str) -> Optional[FileDiff]:
+        return self._by_path.get(path)
+
+    def added_lines(self, path: Optional[str] = None) -> List[DiffLine]:
+        """Added lines of one file, or of every file when `path` is omitted."""
+        if path is not None:
+            file_diff = self._by_path.get(path)
+            return file_diff.added_lines() if file_diff else []
+        return [line for f in self.files for line in f.added_lines()]
+
+    def code(self) -> str:
+        """Added and context lines of every file, without diff markers."""
+        return "\n".join(line.text for f in self.files for hunk in f.hunks for line in hunk.lines if line.kind != REMOVED)
+
+
+def _strip_prefix(path: str) -> str:
+    path = path.split("\t", 1)[0]
+    if path.startswith("a/") or path.startswith("b/"):
+        return path[2:]
+    return path
+
+
+def _parse(diff: str) -> ParsedDiff:
+    files: List[FileDiff] = []
+    current: Optional[FileDiff] = None
+    hunk: Optional[Hunk] = None
+    old_remaining = new_remaining = 0
+    old_no = new_no = 0
+
+    for line in diff.split("\n"):
+        # Inside a hunk the header counts say exactly how many lines belong to it, so
+        # a removed line that happens to start with "--" is not mistaken for a header.
+        if hunk is not None and (old_remaining > 0 or new_remaining > 0):
+            marker = line[:1]
+            if marker == "+":
+                hunk.lines.append(DiffLine(ADDED, None, new_no, line[1:]))
+                new_no += 1
+                new_remaining -= 1
+                continue
+            if marker == "-":
+                hunk.lines.append(DiffLine(REMOVED, old_no, None, line[1:]))
+                old_no += 1
+                old_remaining -= 1
+                continue
+            if marker == " " or line == "":
+                hunk.lines.append(DiffLine(CONTEXT, old_no, new_no, line[1:]))
+                old_no += 1
+                new_no += 1
+                old_remaining -= 1
+                new_remaining -= 1
+                continue
+            if marker == "\\":
+                continue
+
+        if line.startswith("@@"):
+            match = _HUNK_HEADER.match(line)
+            if match is None:
+                continue
+            if current is None:
+                # A bare per-file patch, as returned by the pull request files API.
+                current = FileDiff()
+                files.append(current)
+            old_start, old_count, new_start, new_count, section = match.groups()
+            hunk = Hunk(
+                int(old_start),
+                int(old_count) if old_count is not None else 1,
+                int(new_start),
+                int(new_count) if new_count is not None else 1,
+                section,
+            )
+            current.hunks.append(hunk)
+            old_no, new_no = hunk.old_start, hunk.new_start
+            old_remaining, new_remaining = hunk.old_count, hunk.new_count
+        elif line.startswith("diff --git "):
+            parts = line[len("diff --git ") :].split(" b/", 1)
+            old_path = _strip_prefix(parts[0])
+            current = FileDiff(parts[1] if len(parts) == 2 else old_path, old_path)
+            files.append(current)
+            hunk = None
+        elif line.startswith("--- "):
+            if current is None or current.hunks:
+                # A plain `diff -u` style section without a "diff --git" header.
+                current = FileDiff()
+                files.append(current)
+            hunk = None
+            old_path = line[4:]
+            if old_path.startswith("/dev/null"):
+                current.is_new = True
+            else:
+                current.old_path = _strip_prefix(old_path)
+        elif line.startswith("+++ ") and current is not None:
+            hunk = None
+            new_path = line[4:]
+            if new_path.startswith("/dev/null"):
+                current.is_deleted = True
+                current.path = current.path or current.old_path
+            else:
+                current.path = _strip_prefix(new_path)
+        elif current is not None and line.startswith("Binary files "):
+            current.is_binary = True
+        elif current is not None and line.startswith("new file mode"):
+            current.is_new = True
+        elif current is not None and line.startswith("deleted file mode"):
+            current.is_deleted = True
+
+    if not files and diff.strip():
+        files.append(_headerless_file(diff.split("\n")))
+
+    return ParsedDiff(files)
+
+
+def _headerless_file(lines: List[str]) -> FileDiff:
+    """Builds a single-hunk file from text that has no hunk header.
+
+    Diff lines pasted without their `@@` header keep their markers; anything else is
+    plain source and every line is treated as added, so the analysis tools also accept
+    raw code.
+    """
+    while lines and lines[-1] == "":
+        lines = lines[:-1]
+    marked = all(line[:1] in ("+", "-", " ") for line in lines if line)
+    has_changes = any(line[:1] in ("+", "-") for line in lines)
+    file_diff = FileDiff()
+    hunk = Hunk(1, 0, 1, 0)
+    old_no = new_no = 1
+    for line in lines:
+        if not (marked and has_changes):
+            hunk.lines.append(DiffLine(ADDED, None, new_no, line))
+            new_no += 1
+        elif line.startswith("+"):
+            hunk.lines.append(DiffLine(ADDED, None, new_no, line[1:]))
+            new_no += 1
+        elif line.startswith("-"):
+            hunk.lines.append(DiffLine(REMOVED, old_no, None, line[1:]))
+            old_no += 1
+        else:
+            hunk.lines.append(DiffLine(CONTEXT, old_no, new_no, line[1:]))
+            old_no += 1
+            new_no += 1
+    hunk.old_count = old_no - 1
+    hunk.new_count = new_no - 1
+    file_diff.hunks.append(hunk)
+    return file_diff
+
+
+_cache: "OrderedDict[bytes, ParsedDiff]" = OrderedDict()
+_cache_lock = threading.Lock()
+_CACHE_SIZE = 64
+
+
+def parse_diff(diff: str) -> ParsedDiff:
+    """Parses a unified diff, reusing the result for identical input.
+
+    The parse is keyed by a hash of the diff text so every analysis tool run on the same
+    diff shares one parse. Callers must treat the returned object as read-only.
+    """
+    key = hashlib.blake2b(diff.encode("utf-8", errors="surrogatepass"), digest_size=16).digest()
+    with _cache_lock:
+        parsed = _cache.get(key)
+        if parsed is not None:
+            _cache.move_to_end(key)
+            return parsed
+
+    parsed = _parse(diff)
+    with _cache_lock:
+        _cache[key] = parsed
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return parsed
@@ -0,0 +1,118 @@
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Optional
+
+from github_client import GitHubClient, error_message, get_client
+
+DIFF_MEDIA_TYPE = "application/vnd.github.v3.diff"
+
+
+class DiffFetchError(Exception):
+    """Raised when GitHub refuses to return the PR metadata or diff."""
+
+
+class PullRequestDiff:
+    """A downloaded PR diff held in a single buffer with a line-offset index.
+
+    `offsets[i]` is the byte offset at which line `i` starts and the last element is the
+    end of the buffer, so any line range is one slice of the buffer and costs time in
+    proportion to the range rather than to the whole diff.
+
+    Lines are split on "\n" only, as git writes them; a "\r" before it (files with CRLF
+    line endings) is dropped from the returned text, like `str.splitlines` did.
+    """
+
+    __slots__ = ("head_sha", "_buffer", "_offsets")
+
+    def __init__(self, head_sha: str, data: bytes):
+        self.head_sha = head_sha
+        self._buffer = memoryview(data)
+        self._offsets = _line_offsets(data)
+
+    @property
+    def total_lines(self) -> int:
+        return len(self._offsets) - 1
+
+    def lines(self, start: Optional[int] = None, stop: Optional[int] = None) -> str:
+        """Returns lines [start, stop) (0-indexed, slice semantics) joined by newlines."""
+        start, stop, _ = slice(start, stop).indices(self.total_lines)
+        if stop <= start:
+            return ""
+        chunk = self._buffer[self._offsets[start] : self._offsets[stop]].tobytes()
+        text = chunk.decode("utf-8", errors="replace")
+        if "\r" in text:
+            text = text.replace("\r\n", "\n")
+        text = text[:-1] if text.endswith("\n") else text
+        return text[:-1] if text.endswith("\r") else text
+
+
+def _line_offsets(data: bytes) -> array:
+    offsets = array("Q", [0])
+    find = data.find
+    pos = find(b"\n")
+    while pos != -1:
+        offsets.append(pos + 1)
+        pos = find(b"\n", pos + 1)
+    if offsets[-1] != len(data):
+        offsets.append(len(data))
+    return offsets
+
+
+class DiffStore:
+    """Fetch-once cache of PR diffs keyed by repository and PR number.
+
+    Each lookup checks the PR head SHA (a cheap, conditionally revalidated metadata
+    request) and only downloads the diff again when the head has moved. Downloads of one
+    PR are serialized by one of `lock_stripes` locks, a fixed set that is never dropped
+    while a caller holds or waits on it.
+    """
+
+    def __init__(self, client: Optional[GitHubClient] = None, max_entries: int = 16, lock_stripes: int = 64):
+        self._client = client
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, PullRequestDiff]" = OrderedDict()
+        self._key_locks = [threading.Lock() for _ in range(lock_stripes)]
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> GitHubClient:
+        return self._client or get_client()
+
+    def get(self, owner_repo: str, pr_number: int) -> PullRequestDiff:
+        key = (owner_repo, int(pr_number))
+        key_lock = self._key_locks[hash(key) % len(self._key_locks)]
+
+        # Concurrent callers for the same PR wait for a single download.
+        with key_lock:
+            head_sha = self._head_sha(owner_repo, pr_number)
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry.head_sha == head_sha:
+                    self._entries.move_to_end(key)
+                    return entry
+
+            response = self.client.get(f"/repos/{owner_repo}/pulls/{pr_number}", accept=DIFF_MEDIA_TYPE, use_cache=False)
+            if response.status_code != 200:
+                raise DiffFetchError(error_message(response))
+            entry = PullRequestDiff(head_sha, response.content)
+
+            with self._lock:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return entry
+
+    def invalidate(self, owner_repo: str, pr_number: int) -> None:
+        with self._lock:
+            self._entries.pop((owner_repo, int(pr_number)), None)
+
+    def _head_sha(self, owner_repo: str, pr_number: int) -> str:
+        response = self.client.get(f"/repos/{owner_repo}/pulls/{pr_number}")
+        if response.status_code != 200:
+            raise DiffFetchError(error_message(response))
+        return response.json()["head"]["sha"]
+
+
+diff_store = DiffStore()
@@ -0,0 +1,229 @@
+import asyncio
+import os
+import re
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Tuple
+
+from github_client import GitHubAPIError, GitHubClient, error_message, get_client, repo_from_url
+from instrumentation import record_github
+
+if TYPE_CHECKING:
+    import httpx
+
+DIFF_MEDIA_TYPE = "application/vnd.github.v3.diff"
+RAW_MEDIA_TYPE = "application/vnd.github.raw+json"
+
+MAX_CONCURRENCY = int(os.getenv("GITHUB_ASYNC_CONCURRENCY", "16"))
+
+_PAGE_PARAM = re.compile(r"[?&]page=(\d+)")
+
+
+class AsyncGitHubClient:
+    """Asynchronous counterpart of `GitHubClient` for fetches that do not depend on each other.
+
+    Requests share a keep-alive httpx connection pool and are bounded by a semaphore.
+    Retry, backoff and rate-limit handling, as well as the conditional-request response
+    cache, are delegated to the synchronous client so both clients see the same
+    rate-limit state. The cache keeps each client's responses under its own keys, so a
+    caller always gets the response type of the client it used.
+    """
+
+    def __init__(self, policy: Optional[GitHubClient] = None, max_concurrency: int = MAX_CONCURRENCY):
+        # Imported here so that importing this module stays cheap for callers that never fetch.
+        import httpx
+
+        self._httpx = httpx
+        self.policy = policy or get_client()
+        connect, read = self.policy.timeout
+        self._client = httpx.AsyncClient(
+            headers=dict(self.policy.session.headers),
+            timeout=httpx.Timeout(read, connect=connect),
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def get(self, path: str, accept: Optional[str] = None, params: Optional[dict] = None, use_cache: bool = True) -> "httpx.Response":
+        url = self.policy.url(path)
+        cache = self.policy.cache
+        key = cache.key(url, accept or self.policy.session.headers["Accept"], params, client="httpx")
+        entry = cache.get(key) if use_cache else None
+        if entry is not None and cache.is_fresh(entry):
+            cache.record_hit()
+            return entry.response
+
+        headers = entry.validators() if entry is not None else {}
+        if accept:
+            headers["Accept"] = accept
+        response = await self._request(url, params, headers)
+
+        if not use_cache:
+            return response
+        if response.status_code == 304 and entry is not None:
+            cache.record_revalidation(entry)
+            return entry.response
+        cache.record_miss()
+        if response.status_code == 200:
+            cache.put(key, response)
+        return response
+
+    async def _request(self, url: str, params: Optional[dict], headers: dict) -> "httpx.Response":
+        attempt = 0
+        while True:
+            delay = self.policy.rate_limit_wait()
+            if delay:
+                await asyncio.sleep(delay)
+            try:
+                async with self._semaphore:
+                    started = time.perf_counter()
+                    response = await self._client.get(url, params=params, headers=headers)
+            except (self._httpx.ConnectError, self._httpx.TimeoutException):
+                if attempt >= self.policy.max_retries:
+                    raise
+                await asyncio.sleep(self.policy.backoff(attempt))
+                attempt += 1
+                continue
+
+            record_github("async", url, response.status_code, len(response.content), time.perf_counter() - started)
+            self.policy.record_rate_limit(response)
+            delay = self.policy.retry_delay(response, attempt)
+            if delay is None:
+                return response
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def get_json(self, path: str, params: Optional[dict] = None):
+        response = await self.get(path, params=params)
+        if response.status_code != 200:
+            raise GitHubAPIError(error_message(response), response.status_code)
+        return response.json()
+
+    async def list_all(self, path: str, params: Optional[dict] = None, per_page: int = 100, limit: Optional[int] = None) -> List[dict]:
+        """Collects every item of a list endpoint.
+
+        When the first page advertises the last page number, the remaining pages are
+        requested together instead of one after another.
+        """
+        params = dict(params or {}, per_page=per_page)
+        response = await self.get(path, params=params)
+        if response.status_code != 200:
+            raise GitHubAPIError(error_message(response), response.status_code)
+        items = list(response.json())
+        last_url = response.links.get("last", {}).get("url")
+        match = _PAGE_PARAM.search(last_url or "")
+        if match and (limit is None or len(items) < limit):
+            last_page = int(match.group(1))
+            if limit is not None:
+                last_page = min(last_page, -(-limit // per_page))
+            pages = await asyncio.gather(*(self.get_json(path, dict(params, page=page)) for page in range(2, last_page + 1)))
+            for page_items in pages:
+                items.extend(page_items)
+        else:
+            next_url = response.links.get("next", {}).get("url")
+            while next_url and (limit is None or len(items) < limit):
+                response = await self.get(next_url)
+                if response.status_code != 200:
+                    raise GitHubAPIError(error_message(response), response.status_code)
+                items.extend(response.json())
+                next_url = response.links.get("next", {}).get("url")
+        return items if limit is None else items[:limit]
+
+    async def get_text(self, path: str, accept: str, use_cache: bool = True) -> str:
+        response = await self.get(path, accept=accept, use_cache=use_cache)
+        if response.status_code != 200:
+            raise GitHubAPIError(error_message(response), response.status_code)
+        return response.content.decode("utf-8", errors="replace")
+
+    async def get_blobs(self, owner_repo: str, shas: Iterable[str]) -> Dict[str, str]:
+        """Fetches several blobs concurrently, keyed by SHA. Unavailable blobs are left out."""
+        shas = list(dict.fromkeys(shas))
+        results = await asyncio.gather(
+            *(self.get_text(f"/repos/{owner_repo}/git/blobs/{sha}", RAW_MEDIA_TYPE) for sha in shas),
+            return_exceptions=True,
+        )
+        return {sha: text for sha, text in zip(shas, results) if isinstance(text, str)}
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+async def fetch_pr_context(
+    client: AsyncGitHubClient,
+    github_url: str,
+    pr_number: int,
+    include_diff: bool = True,
+    select_sources: Optional[Callable[[List[dict]], Iterable[str]]] = None,
+) -> dict:
+    """Fetches PR metadata, changed files and (optionally) the full diff and file contents at once.
+
+    Args:
+        client: The async client to use.
+        github_url: The URL of the GitHub repository.
+        pr_number: The pull request number.
+        include_diff: Whether to download the full PR diff as well.
+        select_sources: Optional; given the changed files, returns the paths whose content
+            at the PR head should be fetched as well.
+
+    Returns:
+        A dict with `metadata`, `files`, `diff` (or None) and `sources`, which maps
+        paths to (content, blob_sha).
+    """
+    owner_repo = repo_from_url(github_url)
+    fetches = [
+        client.get_json(f"/repos/{owner_repo}/pulls/{pr_number}"),
+        client.list_all(f"/repos/{owner_repo}/pulls/{pr_number}/files"),
+    ]
+    if include_diff:
+        fetches.append(client.get_text(f"/repos/{owner_repo}/pulls/{pr_number}", DIFF_MEDIA_TYPE, use_cache=False))
+    results = await asyncio.gather(*fetches)
+    metadata, files = results[0], results[1]
+
+    sources: Dict[str, Tuple[str, str]] = {}
+    if select_sources is not None:
+        wanted = set(select_sources(files))
+        shas = {info["filename"]: info["sha"] for info in files if info["filename"] in wanted and info.get("status") != "removed"}
+        blobs = await client.get_blobs(owner_repo, shas.values())
+        sources = {path: (blobs[sha], sha) for path, sha in shas.items() if sha in blobs}
+
+    return {"metadata": metadata, "files": files, "diff": results[2] if include_diff else None, "sources": sources}
+
+
+class _LoopThread:
+    """A background event loop shared by synchronous callers, so the async client and its
+    connection pool outlive individual tool calls."""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[AsyncGitHubClient] = None
+        self._lock = threading.Lock()
+
+    def _start(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="github-async", daemon=True).start()
+                self._loop = loop
+        return self._loop
+
+    def run(self, make_coroutine):
+        """Runs `make_coroutine(client)` on the background loop and returns its result."""
+        loop = self._start()
+
+        async def call():
+            if self._client is None:
+                self._client = AsyncGitHubClient()
+            return await make_coroutine(self._client)
+
+        return asyncio.run_coroutine_threadsafe(call(), loop).result()
+
+
+_runner = _LoopThread()
+
+
+def run_with_client(make_coroutine):
+    """Runs `make_coroutine(client)` with the shared async client from synchronous code.
+
+    Example:
+        context = run_with_client(lambda client: fetch_pr_context(client, url, 42))
+    """
+    return _runner.run(make_coroutine)
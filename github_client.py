@@ -0,0 +1,361 @@
+import contextvars
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from typing import Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from instrumentation import record_github
+from response_cache import ResponseCache
+
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+
+# (connect, read) timeouts in seconds applied to every call unless overridden.
+DEFAULT_TIMEOUT = (
+    float(os.getenv("GITHUB_CONNECT_TIMEOUT", "5")),
+    float(os.getenv("GITHUB_READ_TIMEOUT", "30")),
+)
+
+RETRY_STATUSES = {500, 502, 503, 504}
+
+CACHE_TTL = float(os.getenv("GITHUB_CACHE_TTL", "60"))
+CACHE_SIZE = int(os.getenv("GITHUB_CACHE_SIZE", "256"))
+
+
+class GitHubAPIError(Exception):
+    """Raised by helpers that cannot hand a failed response back to the caller."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class GitHubRateLimitError(Exception):
+    """Raised when the primary rate limit is exhausted for longer than we are willing to wait."""
+
+
+class GitHubClient:
+    """Pooled, retrying client for the GitHub REST API shared by all PR tools.
+
+    A single `requests.Session` keeps keep-alive connections to api.github.com open so
+    consecutive tool calls reuse the same TLS connection. Transient 5xx answers and
+    secondary rate limits are retried with exponential backoff, honouring `Retry-After`,
+    and the primary limit advertised in `X-RateLimit-Remaining`/`X-RateLimit-Reset` is
+    tracked so we stop hammering the API once it is exhausted.
+
+    GET requests go through a `ResponseCache` unless `use_cache=False` is passed, so
+    repeated fetches of the same resource are served locally or revalidated with a
+    conditional request.
+    """
+
+    def __init__(
+        self,
+        token: Optional[str] = None,
+        base_url: str = GITHUB_API_URL,
+        timeout=DEFAULT_TIMEOUT,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        max_backoff: float = 30.0,
+        max_rate_limit_wait: float = 60.0,
+        pool_maxsize: int = 20,
+        cache: Optional[ResponseCache] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.max_rate_limit_wait = max_rate_limit_wait
+        self.cache = cache if cache is not None else ResponseCache(max_entries=CACHE_SIZE, ttl=CACHE_TTL)
+
+        self.session = requests.Session()
+        # Retries are handled here rather than by urllib3 so Retry-After and the
+        # GitHub specific rate limit headers can be taken into account.
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(
+            {
+                "Accept": "application/vnd.github+json",
+                "User-Agent": "github-pr-review-agent",
+                "X-GitHub-Api-Version": "2022-11-28",
+            }
+        )
+        token = token or os.getenv("GITHUB_TOKEN")
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+
+        self._rate_limit_lock = threading.Lock()
+        self._rate_limit_reset = 0.0
+        # Threads are only started on first use.
+        self._prefetch_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="github-prefetch")
+
+    def url(self, path: str) -> str:
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def get(
+        self,
+        path: str,
+        accept: Optional[str] = None,
+        params: Optional[dict] = None,
+        use_cache: bool = True,
+        **kwargs,
+    ) -> requests.Response:
+        if not use_cache:
+            return self.request("GET", path, accept=accept, params=params, **kwargs)
+
+        key = self.cache.key(self.url(path), accept or self.session.headers["Accept"], params)
+        entry = self.cache.get(key)
+        if entry is not None and self.cache.is_fresh(entry):
+            self.cache.record_hit()
+            return entry.response
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        if entry is not None:
+            headers.update(entry.validators())
+        response = self.request("GET", path, accept=accept, params=params, headers=headers, **kwargs)
+
+        if response.status_code == 304 and entry is not None:
+            self.cache.record_revalidation(entry)
+            return entry.response
+        self.cache.record_miss()
+        if response.status_code == 200:
+            self.cache.put(key, response)
+        return response
+
+    def paginate(
+        self,
+        path: str,
+        params: Optional[dict] = None,
+        per_page: int = 100,
+        limit: Optional[int] = None,
+        accept: Optional[str] = None,
+    ) -> Iterator[dict]:
+        """Yields the items of a list endpoint page by page, following `Link: rel="next"`.
+
+        The next page is requested in the background while the caller consumes the
+        current one, and no further pages are requested once `limit` items were yielded.
+
+        Args:
+            path: The API path of the list endpoint.
+            params: Optional; query string parameters for the first page.
+            per_page: Page size requested from GitHub (100 is the maximum).
+            limit: Optional; stop after this many items.
+            accept: Optional; overrides the default `Accept` header.
+
+        Raises:
+            GitHubAPIError: If any page cannot be retrieved.
+        """
+        params = dict(params or {}, per_page=per_page)
+        response = self.get(path, accept=accept, params=params)
+        yielded = 0
+        future = None
+        try:
+            while True:
+                if response.status_code != 200:
+                    raise GitHubAPIError(error_message(response), response.status_code)
+                items = response.json()
+                next_url = response.links.get("next", {}).get("url")
+                if next_url and (limit is None or yielded + len(items) < limit):
+                    # Run in the caller's context so the request counts towards its run.
+                    future = self._prefetch_executor.submit(contextvars.copy_context().run, self.get, next_url, accept)
+                else:
+                    future = None
+
+                for item in items:
+                    if limit is not None and yielded >= limit:
+                        return
+                    yield item
+                    yielded += 1
+
+                if future is None:
+                    return
+                response = future.result()
+                future = None
+        finally:
+            if future is not None:
+                future.cancel()
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        accept: Optional[str] = None,
+        params: Optional[dict] = None,
+        headers: Optional[dict] = None,
+        timeout=None,
+        **kwargs,
+    ) -> requests.Response:
+        """Sends a request, retrying transient failures.
+
+        Args:
+            method: The HTTP method.
+            path: An API path such as '/repos/{owner}/{repo}/pulls' or an absolute URL.
+            accept: Optional; overrides the default `Accept` header (e.g. the diff media type).
+            params: Optional; query string parameters.
+            headers: Optional; extra request headers.
+            timeout: Optional; overrides the client's (connect, read) timeout.
+
+        Returns:
+            The final `requests.Response`. Non-retryable error statuses are returned as is
+            so callers can surface GitHub's error message.
+        """
+        url = self.url(path)
+        request_headers = dict(headers or {})
+        if accept:
+            request_headers["Accept"] = accept
+
+        attempt = 0
+        while True:
+            delay = self.rate_limit_wait()
+            if delay:
+                time.sleep(delay)
+            started = time.perf_counter()
+            try:
+                response = self.session.request(
+                    method,
+                    url,
+                    params=params,
+                    headers=request_headers,
+                    timeout=timeout or self.timeout,
+                    **kwargs,
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(self.backoff(attempt))
+                attempt += 1
+                continue
+
+            record_github("sync", url, response.status_code, len(response.content), time.perf_counter() - started)
+            self.record_rate_limit(response)
+            delay = self.retry_delay(response, attempt)
+            if delay is None:
+                return response
+            time.sleep(delay)
+            attempt += 1
+
+    def backoff(self, attempt: int) -> float:
+        delay = min(self.max_backoff, self.backoff_factor * (2**attempt))
+        return delay + random.uniform(0, self.backoff_factor)
+
+    def retry_delay(self, response: requests.Response, attempt: int) -> Optional[float]:
+        """Returns how long to wait before retrying, or None if the response is final."""
+        if attempt >= self.max_retries:
+            return None
+
+        status = response.status_code
+        retry_after = _retry_after_seconds(response.headers.get("Retry-After"))
+        if status in RETRY_STATUSES:
+            # A server's Retry-After is honored only up to our own backoff ceiling.
+            return min(retry_after, self.max_backoff) if retry_after is not None else self.backoff(attempt)
+
+        if status in (403, 429):
+            if retry_after is not None:
+                return retry_after if retry_after <= self.max_rate_limit_wait else None
+            if response.headers.get("X-RateLimit-Remaining") == "0":
+                # Primary limit: only worth waiting if the window resets soon.
+                delay = _parse_seconds(response.headers.get("X-RateLimit-Reset", "0")) - time.time()
+                return max(delay, 0.0) if delay <= self.max_rate_limit_wait else None
+            if "secondary rate limit" in response.text.lower():
+                # GitHub asks for at least a minute between retries when no Retry-After is sent.
+                delay = max(60.0, self.backoff(attempt))
+                return delay if delay <= self.max_rate_limit_wait else None
+        return None
+
+    def record_rate_limit(self, response: requests.Response) -> None:
+        if response.headers.get("X-RateLimit-Remaining") != "0":
+            return
+        reset = _parse_seconds(response.headers.get("X-RateLimit-Reset", "0"))
+        with self._rate_limit_lock:
+            self._rate_limit_reset = max(self._rate_limit_reset, reset)
+
+    def rate_limit_wait(self) -> float:
+        """Seconds to wait before the next request because the primary limit is exhausted.
+
+        Raises:
+            GitHubRateLimitError: If the limit resets later than `max_rate_limit_wait`.
+        """
+        with self._rate_limit_lock:
+            remaining = self._rate_limit_reset - time.time()
+        if remaining <= 0:
+            return 0.0
+        if remaining > self.max_rate_limit_wait:
+            reset_at = time.strftime("%H:%M:%S", time.localtime(self._rate_limit_reset))
+            raise GitHubRateLimitError(f"GitHub API rate limit exhausted until {reset_at}.")
+        return remaining
+
+
+def _parse_seconds(value: str) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait for a `Retry-After` header (a number of seconds or an HTTP date); None if absent or unreadable."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+_client: Optional[GitHubClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> GitHubClient:
+    """Returns the process wide client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = GitHubClient()
+    return _client
+
+
+def repo_from_url(github_url: str) -> str:
+    """Turns 'https://github.com/owner/repo' into 'owner/repo'."""
+    owner_repo = github_url.replace("https://github.com/", "").strip("/")
+    if owner_repo.endswith(".git"):
+        owner_repo = owner_repo[: -len(".git")]
+    return owner_repo
+
+
+def get_blob_text(owner_repo: str, sha: str) -> str:
+    """Fetches a file's content by its git blob SHA.
+
+    Repeated lookups within the response cache's TTL are served from memory; after it,
+    the blob's ETag never changes, so revalidating costs a 304 that is not rate limited.
+
+    Raises:
+        GitHubAPIError: If the blob cannot be retrieved.
+    """
+    response = get_client().get(f"/repos/{owner_repo}/git/blobs/{sha}", accept="application/vnd.github.raw+json")
+    if response.status_code != 200:
+        raise GitHubAPIError(error_message(response), response.status_code)
+    return response.content.decode("utf-8", errors="replace")
+
+
+def error_message(response: requests.Response) -> str:
+    """Extracts GitHub's error message from a failed response."""
+    try:
+        return response.json().get("message", "Unknown error")
+    except ValueError:
+        # requests names the status text `reason`, httpx (used by the async client) `reason_phrase`.
+        reason = getattr(response, "reason", None) or getattr(response, "reason_phrase", None)
+        return reason or f"HTTP {response.status_code}"
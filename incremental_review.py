@@ -0,0 +1,89 @@
+from typing import List, Optional, Set
+
+from github_client import GitHubAPIError, GitHubClient, error_message, get_client
+
+# The compare API lists at most this many files; a longer delta is reviewed in full.
+MAX_COMPARE_FILES = 300
+
+
+class IncrementalUnavailable(Exception):
+    """Raised when the pushes since the last review cannot be reviewed as a delta,
+    e.g. after a force-push removed the previously reviewed commit."""
+
+
+class CompareResult:
+    """The commits pushed between two heads of a PR, as returned by `/compare/{old}...{new}`."""
+
+    __slots__ = ("old_sha", "new_sha", "commits", "files")
+
+    def __init__(self, old_sha: str, new_sha: str, commits: int, files: List[dict]):
+        self.old_sha = old_sha
+        self.new_sha = new_sha
+        self.commits = commits
+        self.files = files
+
+    def changed_paths(self) -> Set[str]:
+        """Paths touched by the delta, including the old names of renamed files."""
+        paths = set()
+        for info in self.files:
+            paths.add(info["filename"])
+            if info.get("previous_filename"):
+                paths.add(info["previous_filename"])
+        return paths
+
+    def diff_text(self) -> str:
+        return "\n".join(file_patch_diff(info) for info in self.files)
+
+
+class ReviewDelta:
+    """What changed since the last review and the findings of the files that changed."""
+
+    __slots__ = ("old_sha", "new_sha", "commits", "changed", "findings")
+
+    def __init__(self, compare: CompareResult, findings: list):
+        self.old_sha = compare.old_sha
+        self.new_sha = compare.new_sha
+        self.commits = compare.commits
+        self.changed = [info["filename"] for info in compare.files]
+        self.findings = findings
+
+
+def file_patch_diff(info: dict) -> str:
+    """Renders a file entry of the pulls/compare files APIs as a `diff --git` section."""
+    path = info["filename"]
+    old_path = info.get("previous_filename") or path
+    status = info.get("status")
+    lines = [
+        f"diff --git a/{old_path} b/{path}",
+        "--- /dev/null" if status == "added" else f"--- a/{old_path}",
+        "+++ /dev/null" if status == "removed" else f"+++ b/{path}",
+    ]
+    if info.get("patch"):
+        lines.append(info["patch"])
+    elif status not in ("renamed", "removed"):
+        lines.append(f"Binary files a/{old_path} and b/{path} differ")
+    return "\n".join(lines)
+
+
+def fetch_compare(owner_repo: str, old_sha: str, new_sha: str, client: Optional[GitHubClient] = None) -> CompareResult:
+    """Fetches the delta between the previously reviewed head and the current one.
+
+    Raises:
+        IncrementalUnavailable: If the old head is gone or not an ancestor of the new one,
+            or the delta is too large to be listed completely.
+        GitHubAPIError: If GitHub refuses the request for another reason.
+    """
+    client = client or get_client()
+    response = client.get(f"/repos/{owner_repo}/compare/{old_sha}...{new_sha}")
+    if response.status_code == 404:
+        raise IncrementalUnavailable(f"commit {old_sha[:7]} is no longer available")
+    if response.status_code != 200:
+        raise GitHubAPIError(error_message(response), response.status_code)
+
+    data = response.json()
+    if data.get("status") != "ahead":
+        raise IncrementalUnavailable(f"{new_sha[:7]} is {data.get('status')} relative to {old_sha[:7]}")
+    files = data.get("files") or []
+    if len(files) >= MAX_COMPARE_FILES:
+        raise IncrementalUnavailable(f"more than {MAX_COMPARE_FILES} files changed since {old_sha[:7]}")
+    return CompareResult(old_sha, new_sha, data.get("total_commits", len(data.get("commits") or [])), files)
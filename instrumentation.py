@@ -0,0 +1,552 @@
+"""Latency, token, GitHub and cache metrics for agent runs.
+
+Counters and histograms are kept in one process-wide registry and rendered in the
+Prometheus text format by `render_metrics()`; `serve_metrics()` exposes them on
+`/metrics`. Every agent run also gets a `RunTrace`: a JSON record of its model calls,
+tool calls, steps and GitHub requests, written to `TRACE_DIR` when the run ends.
+
+The current run is held in a context variable, so work done for it on other threads
+(the GitHub prefetch pool, the async client's event loop, the token-streaming worker)
+is attributed to it as long as those threads are started with the caller's context.
+"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+TRACES_ENABLED = os.getenv("TRACES_ENABLED", "1") != "0"
+TRACE_DIR = os.getenv("TRACE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "github-pr-review-agent", "traces"))
+# Spans kept per trace; a run fetching thousands of blobs still writes a bounded file.
+MAX_SPANS = 2000
+
+SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_HELP = {
+    "pr_review_runs_total": ("counter", "Agent runs by entry point and outcome."),
+    "pr_review_run_seconds": ("histogram", "Wall time of agent runs."),
+    "pr_review_steps_total": ("counter", "Agent steps by outcome."),
+    "pr_review_step_seconds": ("histogram", "Wall time of agent steps."),
+    "pr_review_tool_calls_total": ("counter", "Tool calls by tool and outcome."),
+    "pr_review_tool_seconds": ("histogram", "Wall time of tool calls."),
+    "pr_review_model_calls_total": ("counter", "Model calls by model and outcome."),
+    "pr_review_model_seconds": ("histogram", "Wall time of model calls."),
+    "pr_review_model_tokens_total": ("counter", "Model tokens by model and direction."),
+    "pr_review_model_endpoint_requests_total": ("counter", "Requests to self-hosted model servers by endpoint and outcome."),
+    "pr_review_model_endpoint_calls_total": ("counter", "Model calls answered by each self-hosted model server (batched calls count one each)."),
+    "pr_review_model_endpoint_seconds": ("histogram", "Wall time of requests to self-hosted model servers."),
+    "pr_review_github_requests_total": ("counter", "GitHub API requests by transport and status."),
+    "pr_review_github_bytes_total": ("counter", "Bytes of GitHub API response bodies."),
+    "pr_review_github_seconds": ("histogram", "Wall time of GitHub API requests."),
+    "pr_review_cache_total": ("counter", "Cache lookups by cache and result."),
+    "pr_review_webhook_deliveries_total": ("counter", "Webhook deliveries by event and outcome."),
+    "pr_review_jobs_total": ("counter", "Finished review jobs by outcome."),
+    "pr_review_job_wait_seconds": ("histogram", "Time review jobs waited in the queue before a worker took them."),
+}
+
+
+class Metrics:
+    """Thread-safe counters and histograms with Prometheus text rendering."""
+
+    def __init__(self, buckets: Tuple[float, ...] = SECONDS_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, tuple], float] = {}
+        self._histograms: Dict[Tuple[str, tuple], list] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # Per-bucket counts, then sum and count.
+                histogram = self._histograms[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[index] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": {_series(name, labels): value for (name, labels), value in self._counters.items()},
+                "histograms": {
+                    _series(name, labels): {"sum": values[-2], "count": values[-1]}
+                    for (name, labels), values in self._histograms.items()
+                },
+            }
+
+    def render(self) -> str:
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, list(values)) for key, values in self._histograms.items())
+        lines: List[str] = []
+        described = set()
+
+        def describe(name: str) -> None:
+            if name not in described and name in _HELP:
+                kind, text = _HELP[name]
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+            described.add(name)
+
+        for (name, labels), value in counters:
+            describe(name)
+            lines.append(f"{_series(name, labels)} {_number(value)}")
+        for (name, labels), values in histograms:
+            describe(name)
+            for bound, count in zip(self.buckets, values):
+                lines.append(f"{_series(name + '_bucket', labels + (('le', _number(bound)),))} {count}")
+            lines.append(f"{_series(name + '_bucket', labels + (('le', '+Inf'),))} {values[-1]}")
+            lines.append(f"{_series(name + '_sum', labels)} {_number(values[-2])}")
+            lines.append(f"{_series(name + '_count', labels)} {values[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+def _series(name: str, labels: tuple) -> str:
+    if not labels:
+        return name
+    pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+    return f"{name}{{{pairs}}}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+metrics = Metrics()
+
+
+class RunTrace:
+    """What one agent run spent: a span per model call, tool call, step and GitHub request."""
+
+    def __init__(self, source: str, repo: Optional[str] = None, pr_number: Optional[int] = None):
+        self.run_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.source = source
+        self.repo = repo
+        self.pr_number = pr_number
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans: List[dict] = []
+        self.dropped_spans = 0
+        self.steps: List[dict] = []
+        self.totals = {
+            "model_calls": 0,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "tool_calls": 0,
+            "github_requests": 0,
+            "github_bytes": 0,
+            "cache": {},
+        }
+        # Tokens spent since the last step ended, attributed to the next step recorded.
+        self._step_tokens = [0, 0]
+        self.status = "running"
+        self.error: Optional[str] = None
+        self.seconds: Optional[float] = None
+
+    def offset(self) -> float:
+        return time.perf_counter() - self._started
+
+    def add_span(self, kind: str, name: str, started: float, seconds: float, **attributes) -> None:
+        span = {"kind": kind, "name": name, "start": round(started, 4), "seconds": round(seconds, 4)}
+        span.update((key, value) for key, value in attributes.items() if value is not None)
+        with self._lock:
+            if len(self.spans) < MAX_SPANS:
+                self.spans.append(span)
+            else:
+                self.dropped_spans += 1
+
+    def count(self, field: str, value: int = 1) -> None:
+        with self._lock:
+            self.totals[field] += value
+
+    def count_cache(self, cache: str, result: str, value: int = 1) -> None:
+        with self._lock:
+            results = self.totals["cache"].setdefault(cache, {})
+            results[result] = results.get(result, 0) + value
+
+    def add_tokens(self, input_tokens: int, output_tokens: int) -> None:
+        with self._lock:
+            self.totals["input_tokens"] += input_tokens
+            self.totals["output_tokens"] += output_tokens
+            self._step_tokens[0] += input_tokens
+            self._step_tokens[1] += output_tokens
+
+    def end_step(self, step_number: Optional[int], seconds: float, error: Optional[str]) -> dict:
+        with self._lock:
+            step = {
+                "step": step_number,
+                "seconds": round(seconds, 4),
+                "input_tokens": self._step_tokens[0],
+                "output_tokens": self._step_tokens[1],
+            }
+            if error:
+                step["error"] = error
+            self._step_tokens = [0, 0]
+            self.steps.append(step)
+        return step
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.seconds = self.offset()
+        if isinstance(error, GeneratorExit):
+            # The consumer stopped iterating: the user pressed stop or left.
+            self.status = "stopped"
+        elif error is not None:
+            self.status = "error"
+            self.error = _error_text(error)
+        else:
+            self.status = "ok"
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "run_id": self.run_id,
+                "source": self.source,
+                "repo": self.repo,
+                "pr_number": self.pr_number,
+                "started_at": self.started_at,
+                "seconds": round(self.seconds, 4) if self.seconds is not None else None,
+                "status": self.status,
+                "error": self.error,
+                "totals": json.loads(json.dumps(self.totals)),
+                "steps": list(self.steps),
+                "spans": list(self.spans),
+                "dropped_spans": self.dropped_spans,
+            }
+
+    def write(self, directory: str = TRACE_DIR) -> Optional[str]:
+        """Writes the trace as `<run_id>.json`; returns the path, or None if it could not be written."""
+        path = os.path.join(directory, f"{self.run_id}.json")
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(path, "w") as stream:
+                json.dump(self.to_dict(), stream, indent=1)
+        except OSError as e:
+            print(f"Could not write run trace: {e}")
+            return None
+        return path
+
+
+_current_run: "contextvars.ContextVar[Optional[RunTrace]]" = contextvars.ContextVar("current_run", default=None)
+
+
+def current_run() -> Optional[RunTrace]:
+    return _current_run.get()
+
+
+def _end_run(trace: RunTrace, error: Optional[BaseException]) -> None:
+    trace.finish(error)
+    if METRICS_ENABLED:
+        metrics.inc("pr_review_runs_total", source=trace.source, status=trace.status)
+        metrics.observe("pr_review_run_seconds", trace.seconds, source=trace.source)
+    if TRACES_ENABLED:
+        trace.write()
+
+
+@contextmanager
+def trace_run(source: str, pr: Optional[Tuple[str, int]] = None) -> Iterator[RunTrace]:
+    """Makes a new `RunTrace` the current run for the block, then records and writes it.
+
+    `pr` is the (repository, number) pair the run is about, as `find_pr_url` returns it.
+    """
+    trace = RunTrace(source, *(pr or (None, None)))
+    token = _current_run.set(trace)
+    try:
+        yield trace
+    except BaseException as e:
+        _end_run(trace, e)
+        raise
+    else:
+        _end_run(trace, None)
+    finally:
+        _current_run.reset(token)
+
+
+def trace_iterable(iterable: Iterable, source: str, pr: Optional[Tuple[str, int]] = None) -> Iterator:
+    """Like `trace_run`, for a run driven by iterating a generator.
+
+    Each item is produced inside the same context, whichever thread asks for it (Gradio
+    resumes generators on pool threads), so everything the generator does is attributed
+    to the run. Closing the iterator early ends the run as stopped.
+    """
+    trace = RunTrace(source, *(pr or (None, None)))
+    context = contextvars.copy_context()
+    context.run(_current_run.set, trace)
+    iterator = iter(iterable)
+    error = None
+    try:
+        while True:
+            try:
+                item = context.run(next, iterator)
+            except StopIteration:
+                return
+            yield item
+    except GeneratorExit as e:
+        error = e
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            context.run(close)
+        raise
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _end_run(trace, error)
+
+
+def record_model(model_id: str, seconds: float, input_tokens: int, output_tokens: int, error: Optional[BaseException] = None) -> None:
+    status = "error" if error is not None else "ok"
+    if METRICS_ENABLED:
+        metrics.inc("pr_review_model_calls_total", model=model_id, status=status)
+        metrics.observe("pr_review_model_seconds", seconds, model=model_id)
+        metrics.inc("pr_review_model_tokens_total", input_tokens, model=model_id, direction="input")
+        metrics.inc("pr_review_model_tokens_total", output_tokens, model=model_id, direction="output")
+    trace = _current_run.get()
+    if trace is not None:
+        trace.count("model_calls")
+        trace.add_tokens(input_tokens, output_tokens)
+        trace.add_span(
+            "model", model_id, trace.offset() - seconds, seconds,
+            input_tokens=input_tokens, output_tokens=output_tokens, error=_error_text(error),
+        )
+
+
+def record_model_endpoint(endpoint: str, status: str, seconds: float, batch_size: int = 1) -> None:
+    """One HTTP request to a self-hosted model server; `batch_size` model calls were answered by it."""
+    if METRICS_ENABLED:
+        metrics.inc("pr_review_model_endpoint_requests_total", endpoint=endpoint, status=status)
+        metrics.inc("pr_review_model_endpoint_calls_total", batch_size, endpoint=endpoint)
+        metrics.observe("pr_review_model_endpoint_seconds", seconds, endpoint=endpoint)
+    trace = _current_run.get()
+    if trace is not None:
+        trace.add_span("model_endpoint", endpoint, trace.offset() - seconds, seconds, status=status, batch_size=batch_size)
+
+
+def record_tool(name: str, seconds: float, error: Optional[BaseException] = None) -> None:
+    if METRICS_ENABLED:
+        metrics.inc("pr_review_tool_calls_total", tool=name, status="error" if error is not None else "ok")
+        metrics.observe("pr_review_tool_seconds", seconds, tool=name)
+    trace = _current_run.get()
+    if trace is not None:
+        trace.count("tool_calls")
+        trace.add_span("tool", name, trace.offset() - seconds, seconds, error=_error_text(error))
+
+
+def record_step(memory_step, agent=None) -> None:
+    """Step callback for agents (`step_callbacks=[record_step]`)."""
+    seconds = getattr(memory_step, "duration", None)
+    if seconds is None:
+        return
+    error = getattr(memory_step, "error", None)
+    if METRICS_ENABLED:
+        metrics.inc("pr_review_steps_total", status="error" if error is not None else "ok")
+        metrics.observe("pr_review_step_seconds", seconds)
+    trace = _current_run.get()
+    if trace is not None:
+        step = trace.end_step(getattr(memory_step, "step_number", None), seconds, _error_text(error))
+        trace.add_span(
+            "step", f"step {step['step']}", trace.offset() - seconds, seconds,
+            input_tokens=step["input_tokens"], output_tokens=step["output_tokens"], error=step.get("error"),
+        )
+
+
+def record_github(transport: str, url: str, status: int, nbytes: int, seconds: float) -> None:
+    if METRICS_ENABLED:
+        metrics.inc("pr_review_github_requests_total", transport=transport, status=str(status))
+        metrics.inc("pr_review_github_bytes_total", nbytes, transport=transport)
+        metrics.observe("pr_review_github_seconds", seconds, transport=transport)
+    trace = _current_run.get()
+    if trace is not None:
+        trace.count("github_requests")
+        trace.count("github_bytes", nbytes)
+        trace.add_span("github", url, trace.offset() - seconds, seconds, status=status, bytes=nbytes, transport=transport)
+
+
+def record_cache(cache: str, result: str, count: int = 1) -> None:
+    """Counts `count` lookups in `cache` ('github', 'review_answer', ...) with `result` ('hit', 'miss', ...)."""
+    if count <= 0:
+        return
+    if METRICS_ENABLED:
+        metrics.inc("pr_review_cache_total", count, cache=cache, result=result)
+    trace = _current_run.get()
+    if trace is not None:
+        trace.count_cache(cache, result, count)
+
+
+def record_webhook(event: str, outcome: str) -> None:
+    if METRICS_ENABLED:
+        metrics.inc("pr_review_webhook_deliveries_total", event=event, outcome=outcome)
+
+
+def record_job(outcome: str, waited: Optional[float] = None) -> None:
+    """A review job attempt ended with `outcome` ('done', 'retry', 'released', 'failed', 'superseded', 'lost');
+    `waited` is its time in the queue."""
+    if METRICS_ENABLED:
+        metrics.inc("pr_review_jobs_total", outcome=outcome)
+        if waited is not None:
+            metrics.observe("pr_review_job_wait_seconds", waited)
+
+
+def _error_text(error) -> Optional[str]:
+    return None if error is None else f"{type(error).__name__}: {error}"
+
+
+def set_token_usage(message, input_tokens: int, output_tokens: int):
+    """Attaches a model call's token counts to the `ChatMessage` it returns.
+
+    Models are shared by concurrent sessions, so counts kept on the model would be
+    overwritten by another session's call before they are read.
+    """
+    message.token_usage = (input_tokens or 0, output_tokens or 0)
+    return message
+
+
+def token_usage(message) -> Tuple[int, int]:
+    """(input, output) tokens of the call that returned `message`: from `set_token_usage`,
+    else from the usage of its raw API response (smolagents' `HfApiModel`), else zeros."""
+    if message is None:
+        return 0, 0
+    usage = getattr(message, "token_usage", None)
+    if usage is not None:
+        return usage
+    raw = getattr(message, "raw", None)
+    usage = raw.get("usage") if isinstance(raw, dict) else getattr(raw, "usage", None)
+    if isinstance(usage, dict):
+        return usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0
+    if usage is not None:
+        return getattr(usage, "prompt_tokens", 0) or 0, getattr(usage, "completion_tokens", 0) or 0
+    return 0, 0
+
+
+def instrument_tool(tool):
+    """Times every call of a smolagents tool; returns the same tool, instrumented once."""
+    if getattr(tool, "_instrumented", False):
+        return tool
+    forward = tool.forward
+
+    @functools.wraps(forward)
+    def timed_forward(*args, **kwargs):
+        started = time.perf_counter()
+        error = None
+        try:
+            return forward(*args, **kwargs)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            record_tool(tool.name, time.perf_counter() - started, error)
+
+    tool.forward = timed_forward
+    tool._instrumented = True
+    return tool
+
+
+class InstrumentedModel:
+    """Wraps a smolagents model to time its calls and count their tokens.
+
+    Tokens are read from each returned message (`token_usage`). `last_input_token_count`
+    and `last_output_token_count` are those of the calling thread's last call, so
+    smolagents' monitor counts a session's own tokens while other sessions share the
+    model. Other attributes are read from the wrapped model, e.g. `model_id`.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._last = threading.local()
+
+    @property
+    def last_input_token_count(self) -> int:
+        return getattr(self._last, "usage", (0, 0))[0]
+
+    @property
+    def last_output_token_count(self) -> int:
+        return getattr(self._last, "usage", (0, 0))[1]
+
+    def __call__(self, *args, **kwargs):
+        started = time.perf_counter()
+        self._last.usage = (0, 0)
+        error = None
+        try:
+            message = self.model(*args, **kwargs)
+            self._last.usage = token_usage(message)
+            return message
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            record_model(
+                getattr(self.model, "model_id", "") or type(self.model).__name__,
+                time.perf_counter() - started,
+                self._last.usage[0],
+                self._last.usage[1],
+                error,
+            )
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+def render_metrics() -> str:
+    return metrics.render()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+def serve_metrics(host: str = METRICS_HOST, port: int = METRICS_PORT) -> Optional[ThreadingHTTPServer]:
+    """Serves `/metrics` on a daemon thread; returns the server, or None if disabled or the port is taken."""
+    global _server
+    if not METRICS_ENABLED or not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                print(f"Metrics endpoint disabled: {e}")
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+        return _server
@@ -0,0 +1,324 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from review_cache import REVIEW_CACHE_DIR
+
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", os.path.join(REVIEW_CACHE_DIR, "jobs.sqlite3"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    repo TEXT NOT NULL,
+    pr_number INTEGER NOT NULL,
+    head_sha TEXT NOT NULL,
+    delivery_id TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    leased_until REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    result TEXT,
+    error TEXT,
+    event_at REAL,
+    UNIQUE (repo, pr_number, head_sha)
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at);
+CREATE INDEX IF NOT EXISTS jobs_pr ON jobs (repo, pr_number, status);
+"""
+
+
+class Job:
+    """A review of one PR head: 'queued', 'running', or finished as 'done', 'failed' or 'superseded'."""
+
+    __slots__ = ("id", "repo", "pr_number", "head_sha", "delivery_id", "status", "attempts", "created_at", "result", "error")
+
+    def __init__(self, row: tuple):
+        (self.id, self.repo, self.pr_number, self.head_sha, self.delivery_id, self.status, self.attempts, self.created_at, result, self.error) = row
+        self.result = json.loads(result) if result else None
+
+    @property
+    def url(self) -> str:
+        return f"https://github.com/{self.repo}/pull/{self.pr_number}"
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+_COLUMNS = "id, repo, pr_number, head_sha, delivery_id, status, attempts, created_at, result, error"
+
+
+class JobQueue:
+    """Durable SQLite queue of PR review jobs, one per (repo, PR, head SHA).
+
+    Enqueuing a head SHA that already has a job is a no-op, so GitHub's redeliveries and
+    repeated events are idempotent; a failed job is queued again, and a superseded one
+    when a later event (a reopen, a force-push back to it) names its head. Events are
+    ordered by when they happened (`event_at`, the PR's `updated_at`), not by arrival, so
+    a late redelivery never displaces a newer head. A new head SHA supersedes the PR's
+    other jobs: queued ones are dropped and a running one is asked to stop
+    (`cancel_requested`). New jobs only become available after `delay` seconds, so a
+    burst of pushes collapses into a review of the last one.
+
+    Workers `claim` a job with a lease; a job whose worker died is claimed again once its
+    lease expires. The lease belongs to the attempt that claimed it: `renew`, `complete`,
+    `fail` and `release` take the attempt number `claim` returned and do nothing for an
+    earlier one, so only one worker runs and records a job at a time, and only one job
+    per PR runs at a time. Several processes may share the database; every change runs
+    in an immediate transaction.
+    """
+
+    def __init__(self, path: str = JOB_QUEUE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        if "event_at" not in {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}:
+            # Queues created before jobs recorded when their event happened.
+            self._db.execute("ALTER TABLE jobs ADD COLUMN event_at REAL")
+
+    def _transaction(self, work):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    def enqueue(
+        self,
+        repo: str,
+        pr_number: int,
+        head_sha: str,
+        delivery_id: Optional[str] = None,
+        delay: float = 0.0,
+        event_at: Optional[float] = None,
+    ) -> Tuple[Optional[int], str]:
+        """Adds a review of `head_sha` for an event that happened at `event_at` (default: now).
+
+        Returns (job id, outcome): 'queued', 'requeued', 'duplicate', or 'superseded' when
+        the PR already has a job for a later event, e.g. a redelivered old push.
+        """
+
+        def work(db):
+            now = time.time()
+            at = now if event_at is None else event_at
+            row = db.execute(
+                "SELECT id, status, COALESCE(event_at, created_at) FROM jobs WHERE repo=? AND pr_number=? AND head_sha=?",
+                (repo, pr_number, head_sha),
+            ).fetchone()
+            (latest,) = db.execute(
+                "SELECT MAX(COALESCE(event_at, created_at)) FROM jobs WHERE repo=? AND pr_number=? AND head_sha<>?",
+                (repo, pr_number, head_sha),
+            ).fetchone()
+            stale = latest is not None and latest > at
+
+            if row is None:
+                if not stale:
+                    self._supersede(db, repo, pr_number, now)
+                cursor = db.execute(
+                    "INSERT INTO jobs (repo, pr_number, head_sha, delivery_id, status, available_at, created_at, updated_at, event_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (repo, pr_number, head_sha, delivery_id, "superseded" if stale else "queued", now + delay, now, now, at),
+                )
+                return cursor.lastrowid, "superseded" if stale else "queued"
+
+            job_id, status, stored_at = row
+            if stale:
+                return job_id, "superseded"
+            # A failed job is retried by redelivering its event; a superseded one needs a later
+            # event for its head, such as reopening the PR or a force-push back to this commit.
+            if status == "failed" or (status == "superseded" and at > stored_at):
+                self._supersede(db, repo, pr_number, now)
+                db.execute(
+                    "UPDATE jobs SET status='queued', attempts=0, cancel_requested=0, error=NULL, available_at=?, updated_at=?, "
+                    "event_at=? WHERE id=?",
+                    (now, now, max(at, stored_at), job_id),
+                )
+                return job_id, "requeued"
+            if status == "superseded":
+                return job_id, "superseded"
+            if at > stored_at:
+                # The head is back at a commit that is reviewed or being reviewed: stop the others.
+                self._supersede(db, repo, pr_number, now, keep=job_id)
+                db.execute("UPDATE jobs SET event_at=? WHERE id=?", (at, job_id))
+            return job_id, "duplicate"
+
+        return self._transaction(work)
+
+    def cancel(self, repo: str, pr_number: int) -> int:
+        """Supersedes every active job of a PR (e.g. when it is closed). Returns how many there were."""
+        return self._transaction(lambda db: self._supersede(db, repo, pr_number, time.time()))
+
+    @staticmethod
+    def _supersede(db, repo: str, pr_number: int, now: float, keep: Optional[int] = None) -> int:
+        queued = db.execute(
+            "UPDATE jobs SET status='superseded', updated_at=? WHERE repo=? AND pr_number=? AND status='queued' AND id IS NOT ?",
+            (now, repo, pr_number, keep),
+        ).rowcount
+        running = db.execute(
+            "UPDATE jobs SET cancel_requested=1, updated_at=? WHERE repo=? AND pr_number=? AND status='running' AND id IS NOT ?",
+            (now, repo, pr_number, keep),
+        ).rowcount
+        return queued + running
+
+    def claim(self, lease: float) -> Optional[Job]:
+        """Takes the oldest available job for `lease` seconds and counts the attempt."""
+
+        def work(db):
+            now = time.time()
+            # A superseded job whose worker died is not run again.
+            db.execute(
+                "UPDATE jobs SET status='superseded', updated_at=? WHERE status='running' AND cancel_requested=1 AND leased_until<?",
+                (now, now),
+            )
+            row = db.execute(
+                f"SELECT {_COLUMNS} FROM jobs AS j WHERE "
+                "((j.status='queued' AND j.available_at<=?) OR (j.status='running' AND j.leased_until<?)) "
+                "AND NOT EXISTS (SELECT 1 FROM jobs AS r WHERE r.repo=j.repo AND r.pr_number=j.pr_number "
+                "AND r.id<>j.id AND r.status='running' AND r.leased_until>=?) "
+                "ORDER BY j.available_at LIMIT 1",
+                (now, now, now),
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE jobs SET status='running', attempts=attempts+1, leased_until=?, updated_at=? WHERE id=?",
+                (now + lease, now, row[0]),
+            )
+            job = Job(row)
+            job.status = "running"
+            job.attempts += 1
+            return job
+
+        return self._transaction(work)
+
+    def renew(self, job_id: int, attempt: int, lease: float) -> bool:
+        """Extends the lease of the job's `attempt`. Returns False when that attempt should stop:
+        the job was superseded, or its lease expired and another worker claimed it."""
+
+        def work(db):
+            now = time.time()
+            return bool(
+                db.execute(
+                    "UPDATE jobs SET leased_until=? WHERE id=? AND attempts=? AND status='running' AND cancel_requested=0",
+                    (now + lease, job_id, attempt),
+                ).rowcount
+            )
+
+        return self._transaction(work)
+
+    def complete(self, job_id: int, attempt: int, result: dict) -> str:
+        """Records a finished review; a job superseded while it ran is stored as 'superseded'.
+
+        Returns 'lost' without storing anything when `attempt` no longer holds the job.
+        """
+
+        def work(db):
+            row = self._held(db, job_id, attempt)
+            if row is None:
+                return "lost"
+            status = "superseded" if row[0] else "done"
+            db.execute(
+                "UPDATE jobs SET status=?, result=?, error=NULL, leased_until=NULL, updated_at=? WHERE id=?",
+                (status, json.dumps(result), time.time(), job_id),
+            )
+            return status
+
+        return self._transaction(work)
+
+    def fail(self, job_id: int, attempt: int, error: str, retry_delay: Optional[float]) -> str:
+        """Requeues the job after `retry_delay` seconds, or marks it failed when that is None.
+
+        Returns 'lost' without changing the job when `attempt` no longer holds it.
+        """
+
+        def work(db):
+            now = time.time()
+            row = self._held(db, job_id, attempt)
+            if row is None:
+                return "lost"
+            if row[0]:
+                status = "superseded"
+            else:
+                status = "failed" if retry_delay is None else "queued"
+            db.execute(
+                "UPDATE jobs SET status=?, error=?, available_at=?, leased_until=NULL, updated_at=? WHERE id=?",
+                (status, error, now + (retry_delay or 0.0), now, job_id),
+            )
+            return status
+
+        return self._transaction(work)
+
+    def release(self, job_id: int, attempt: int) -> str:
+        """Puts a running job back in the queue at once without counting its attempt, e.g. when the service stops.
+
+        Returns 'lost' when `attempt` no longer holds the job.
+        """
+
+        def work(db):
+            now = time.time()
+            row = self._held(db, job_id, attempt)
+            if row is None:
+                return "lost"
+            status = "superseded" if row[0] else "queued"
+            db.execute(
+                "UPDATE jobs SET status=?, attempts=MAX(attempts-1, 0), available_at=?, leased_until=NULL, updated_at=? WHERE id=?",
+                (status, now, now, job_id),
+            )
+            return status
+
+        return self._transaction(work)
+
+    @staticmethod
+    def _held(db, job_id: int, attempt: int) -> Optional[tuple]:
+        # The attempt count identifies the lease: claiming a job again after its lease expired
+        # increments it, so the worker that lost the lease can no longer write the job.
+        return db.execute(
+            "SELECT cancel_requested FROM jobs WHERE id=? AND attempts=? AND status='running'", (job_id, attempt)
+        ).fetchone()
+
+    def get(self, job_id: int) -> Optional[Job]:
+        with self._lock:
+            row = self._db.execute(f"SELECT {_COLUMNS} FROM jobs WHERE id=?", (job_id,)).fetchone()
+        return Job(row) if row else None
+
+    def jobs_for(self, repo: str, pr_number: int, limit: int = 20) -> List[Job]:
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {_COLUMNS} FROM jobs WHERE repo=? AND pr_number=? ORDER BY id DESC LIMIT ?", (repo, pr_number, limit)
+            ).fetchall()
+        return [Job(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def prune(self, max_age: float) -> int:
+        """Deletes finished jobs older than `max_age` seconds."""
+
+        def work(db):
+            cutoff = time.time() - max_age
+            return db.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed', 'superseded') AND updated_at<?", (cutoff,)
+            ).rowcount
+
+        return self._transaction(work)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
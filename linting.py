@@ -0,0 +1,176 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from code_smells import blob_sha, is_python_path, parse_fragment, parse_source
+from diff_parser import FileDiff
+
+MAX_LINE_LENGTH = int(os.getenv("LINT_MAX_LINE_LENGTH", "120"))
+
+# Bump when the checks or their configuration change, so cached results are dropped.
+LINT_CONFIG_VERSION = "1"
+
+# pyflakes messages that need the whole module to be meaningful; a lone hunk lacks the
+# imports and definitions around it.
+HUNK_UNRELIABLE_PYFLAKES = {"UndefinedName", "UndefinedLocal", "UndefinedExport", "UnusedImport", "ImportStarUsage"}
+# pycodestyle codes that a hunk cut out of its file triggers spuriously.
+HUNK_UNRELIABLE_PYCODESTYLE = ("E1", "E3", "E9", "W391", "W292")
+
+
+class LintResult:
+    """Lint findings as (new-file line, message) for one file and the time spent on it."""
+
+    __slots__ = ("path", "findings", "seconds", "cached")
+
+    def __init__(self, path: str, findings: List[Tuple[int, str]], seconds: float, cached: bool):
+        self.path = path
+        self.findings = findings
+        self.seconds = seconds
+        self.cached = cached
+
+
+class Linter:
+    """pyflakes and pycodestyle driven through their Python APIs.
+
+    The checkers are imported once per process by `warm_up()`, so a long-lived server or
+    pool worker pays no import cost per call. Results for a whole blob are cached by
+    (blob SHA, rule-set version): re-reviewing a PR after a push only lints the files
+    whose content changed.
+    """
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[tuple, List[Tuple[int, str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pyflakes_checker = None
+        self._pycodestyle = None
+        self.version = None
+
+    def warm_up(self) -> None:
+        if self._pycodestyle is not None:
+            return
+        try:
+            import pycodestyle
+            import pyflakes
+            from pyflakes.checker import Checker
+        except ImportError as e:
+            raise ImportError(
+                "You must install packages `pyflakes` and `pycodestyle` to lint code: for instance run `pip install pyflakes pycodestyle`."
+            ) from e
+        self._pyflakes_checker = Checker
+        self._pycodestyle = pycodestyle
+        self.version = f"pyflakes-{pyflakes.__version__}/pycodestyle-{pycodestyle.__version__}/{LINT_CONFIG_VERSION}"
+
+    def lint_source(self, source: str, sha: Optional[str] = None, fragment: bool = False) -> List[Tuple[int, str]]:
+        """Lints a whole source text, reusing the cached result for the same blob."""
+        self.warm_up()
+        key = (sha or blob_sha(source), self.version, fragment)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+
+        findings = self._pyflakes(source, key[0], fragment) + self._pycodestyle_messages(source, fragment)
+        findings.extend(
+            (number, "P001 Consider removing debug print statement.")
+            for number, text in enumerate(source.split("\n"), start=1)
+            if text.lstrip().startswith("print(")
+        )
+        findings.sort()
+        with self._lock:
+            self._cache[key] = findings
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return findings
+
+    def _pyflakes(self, source: str, sha: str, fragment: bool) -> List[Tuple[int, str]]:
+        if fragment:
+            tree = parse_fragment(source)
+            if tree is None:
+                return []
+        else:
+            try:
+                tree = parse_source(source, sha)
+            except SyntaxError as e:
+                return [(e.lineno or 1, f"E999 SyntaxError: {e.msg}")]
+        checker = self._pyflakes_checker(tree, filename="<diff>")
+        return [
+            (message.lineno, f"{message.message % message.message_args} (pyflakes)")
+            for message in checker.messages
+            if not (fragment and type(message).__name__ in HUNK_UNRELIABLE_PYFLAKES)
+        ]
+
+    def _pycodestyle_messages(self, source: str, fragment: bool) -> List[Tuple[int, str]]:
+        findings = []
+        pycodestyle = self._pycodestyle
+
+        class CollectingReport(pycodestyle.BaseReport):
+            def error(self, line_number, offset, text, check):
+                code = text[:4]
+                if fragment and code.startswith(HUNK_UNRELIABLE_PYCODESTYLE):
+                    return None
+                if super().error(line_number, offset, text, check):
+                    findings.append((line_number, text))
+                return code
+
+        style = pycodestyle.StyleGuide(quiet=True, max_line_length=MAX_LINE_LENGTH)
+        lines = source.splitlines(True)
+        if lines and not lines[-1].endswith("\n"):
+            lines[-1] += "\n"
+        checker = pycodestyle.Checker(lines=lines, options=style.options, report=CollectingReport(style.options))
+        checker.check_all()
+        return findings
+
+    def lint_file(self, file_diff: FileDiff, loaded: Optional[Tuple[str, str]] = None) -> LintResult:
+        """Lints one changed file and keeps only findings on added lines.
+
+        Args:
+            file_diff: The parsed diff of the file.
+            loaded: Optional; (source, blob_sha) of the whole file at the PR head. Without it
+                each changed hunk is linted on its own, skipping checks that need the module.
+        """
+        self.warm_up()
+        started = time.perf_counter()
+        added = file_diff.added_line_numbers()
+        cached = False
+        findings = []
+        if added and is_python_path(file_diff.path) and not file_diff.is_binary:
+            units = []
+            if loaded is not None:
+                units.append((loaded[0], loaded[1], 0, False))
+            else:
+                for hunk in file_diff.hunks:
+                    if any(line.kind == "+" for line in hunk.lines):
+                        text = "\n".join(line.text for line in hunk.new_lines())
+                        units.append((text, None, hunk.new_start - 1, True))
+            # Reported as cached only when there was something to lint and all of it was.
+            cached = bool(units)
+            for source, sha, offset, fragment in units:
+                key = (sha or blob_sha(source), self.version, fragment)
+                with self._lock:
+                    cached = cached and key in self._cache
+                for line, message in self.lint_source(source, sha, fragment=fragment):
+                    if line + offset in added:
+                        findings.append((line + offset, message))
+        return LintResult(file_diff.path, findings, time.perf_counter() - started, cached)
+
+
+_linter = Linter()
+
+
+def warm_up() -> None:
+    """Imports the checkers ahead of the first call, e.g. as a process pool initializer."""
+    _linter.warm_up()
+
+
+def checker_version() -> str:
+    """Versions of the checkers and their configuration, e.g. to key cached lint results."""
+    _linter.warm_up()
+    return _linter.version
+
+
+def lint_file(file_diff: FileDiff, loaded: Optional[Tuple[str, str]] = None) -> LintResult:
+    return _linter.lint_file(file_diff, loaded)
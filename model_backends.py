@@ -0,0 +1,349 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from smolagents.models import ChatMessage, Model, parse_tool_args_if_needed, remove_stop_sequences
+from smolagents.tools import Tool
+
+from instrumentation import record_model_endpoint, set_token_usage
+from model_streaming import GenerationStopped, StreamingHfApiModel, current_listener
+
+# "hf" for the Hugging Face Inference API, "openai" for the servers in MODEL_ENDPOINTS.
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "hf")
+MODEL_ENDPOINTS = [url.strip().rstrip("/") for url in os.getenv("MODEL_ENDPOINTS", "http://127.0.0.1:8000/v1").split(",") if url.strip()]
+MODEL_API_KEY = os.getenv("MODEL_API_KEY", "")
+
+# (connect, read) timeouts in seconds; a step can take a while to generate.
+MODEL_TIMEOUT = (
+    float(os.getenv("MODEL_CONNECT_TIMEOUT", "5")),
+    float(os.getenv("MODEL_READ_TIMEOUT", "120")),
+)
+
+MODEL_BATCH = os.getenv("MODEL_BATCH", "0") != "0"
+MODEL_BATCH_WINDOW = float(os.getenv("MODEL_BATCH_WINDOW_MS", "20")) / 1000
+MODEL_BATCH_MAX = int(os.getenv("MODEL_BATCH_MAX", "8"))
+MODEL_ENDPOINT_COOLDOWN = float(os.getenv("MODEL_ENDPOINT_COOLDOWN", "30"))
+
+# Answers that mean "try another server" rather than "the request is wrong".
+FAILOVER_STATUSES = {429, 500, 502, 503, 504}
+
+# Qwen2.5 (and most open chat models served with a completions endpoint) use ChatML.
+_CHATML_END = "<|im_end|>"
+
+
+class ModelEndpointError(Exception):
+    """Raised when no model server could answer a request."""
+
+
+class Endpoint:
+    """One model server with its smoothed request latency and failure state."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.latency: Optional[float] = None
+        self.failures = 0
+        self.down_until = 0.0
+
+    def __repr__(self) -> str:
+        latency = "unmeasured" if self.latency is None else f"{self.latency * 1000:.0f} ms"
+        return f"Endpoint({self.url!r}, {latency}, failures={self.failures})"
+
+
+class EndpointPool:
+    """Orders a list of servers by measured latency and sidelines the ones that fail.
+
+    Servers are tried fastest first; one that has not answered yet is tried before the
+    measured ones so it gets a latency. A failed server is skipped for `cooldown`
+    seconds, doubling with each consecutive failure up to 10 times `cooldown`, and only
+    used again before that when every server is down.
+    """
+
+    def __init__(self, urls: List[str], cooldown: float = MODEL_ENDPOINT_COOLDOWN, smoothing: float = 0.3):
+        if not urls:
+            raise ValueError("At least one model endpoint is required.")
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.cooldown = cooldown
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+
+    def ordered(self) -> List[Endpoint]:
+        now = time.monotonic()
+        with self._lock:
+            up = [endpoint for endpoint in self.endpoints if endpoint.down_until <= now]
+            down = [endpoint for endpoint in self.endpoints if endpoint.down_until > now]
+            up.sort(key=lambda endpoint: (endpoint.latency is not None, endpoint.latency or 0.0))
+            down.sort(key=lambda endpoint: endpoint.down_until)
+        return up + down
+
+    def succeeded(self, endpoint: Endpoint, seconds: float) -> None:
+        with self._lock:
+            if endpoint.latency is None:
+                endpoint.latency = seconds
+            else:
+                endpoint.latency += self.smoothing * (seconds - endpoint.latency)
+            endpoint.failures = 0
+            endpoint.down_until = 0.0
+
+    def failed(self, endpoint: Endpoint) -> None:
+        with self._lock:
+            endpoint.failures += 1
+            # The exponent is capped first: a long outage would otherwise overflow the float.
+            endpoint.down_until = time.monotonic() + min(self.cooldown * 2 ** min(endpoint.failures - 1, 10), 10 * self.cooldown)
+
+
+class _Batch:
+    def __init__(self):
+        self.items: List[Tuple[str, Future]] = []
+        self.full = threading.Event()
+
+
+class CompletionBatcher:
+    """Collects concurrent completion requests with the same parameters into one request.
+
+    The first caller of a batch waits up to `window` seconds (or until `max_size`
+    prompts have joined) and then sends all of them with `send(prompts, parameters)`,
+    which returns one `(text, input_tokens, output_tokens)` per prompt. Every caller
+    blocks until its own result is in.
+    """
+
+    def __init__(self, send, window: float = MODEL_BATCH_WINDOW, max_size: int = MODEL_BATCH_MAX):
+        self.send = send
+        self.window = window
+        self.max_size = max(1, max_size)
+        self._open: Dict[str, _Batch] = {}
+        self._lock = threading.Lock()
+
+    def complete(self, prompt: str, parameters: dict) -> Tuple[str, int, int]:
+        key = json.dumps(parameters, sort_keys=True, default=str)
+        future: Future = Future()
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._open[key] = _Batch()
+            batch.items.append((prompt, future))
+            if len(batch.items) >= self.max_size:
+                del self._open[key]
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._open.get(key) is batch:
+                    del self._open[key]
+            self._dispatch(batch, parameters)
+        return future.result()
+
+    def _dispatch(self, batch: _Batch, parameters: dict) -> None:
+        try:
+            results = self.send([prompt for prompt, _ in batch.items], parameters)
+        except BaseException as e:
+            for _, future in batch.items:
+                future.set_exception(e)
+            raise
+        for (_, future), result in zip(batch.items, results):
+            future.set_result(result)
+
+
+def chatml_prompt(messages: List[Dict]) -> str:
+    """Renders chat messages with the ChatML template, ending with an open assistant turn."""
+    parts = []
+    for message in messages:
+        role = message["role"]
+        parts.append(f"<|im_start|>{getattr(role, 'value', role)}\n{message['content']}{_CHATML_END}\n")
+    parts.append("<|im_start|>assistant\n")
+    return "".join(parts)
+
+
+class OpenAICompatibleModel(Model):
+    """Model served by self-hosted OpenAI-compatible servers (vLLM, llama.cpp, TGI).
+
+    Requests go to the fastest of `endpoints` that is up (see `EndpointPool`); connection
+    errors, timeouts and 429/5xx answers move on to the next one. With a `TokenListener`
+    registered the chat response is streamed to it, like `StreamingHfApiModel` does.
+
+    With `batch=True`, concurrent steps from different sessions are sent together as one
+    `/completions` request with a list of ChatML prompts (`CompletionBatcher`), which
+    vLLM and llama.cpp answer in one batch. Batched calls are not streamed: the listener
+    gets the whole response at once. Tool-calling requests always use `/chat/completions`.
+    """
+
+    def __init__(
+        self,
+        model_id: str,
+        endpoints: Optional[List[str]] = None,
+        api_key: str = MODEL_API_KEY,
+        batch: bool = MODEL_BATCH,
+        batch_window: float = MODEL_BATCH_WINDOW,
+        batch_max: int = MODEL_BATCH_MAX,
+        timeout=MODEL_TIMEOUT,
+        custom_role_conversions: Optional[Dict[str, str]] = None,
+        pool_maxsize: int = 32,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.model_id = model_id
+        self.pool = EndpointPool(endpoints or MODEL_ENDPOINTS)
+        self.timeout = timeout
+        self.custom_role_conversions = custom_role_conversions
+        self.batcher = CompletionBatcher(self._send_batch, batch_window, batch_max) if batch else None
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.pool.endpoints), pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["User-Agent"] = "github-pr-review-agent"
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def __call__(
+        self,
+        messages: List[Dict[str, str]],
+        stop_sequences: Optional[List[str]] = None,
+        grammar: Optional[str] = None,
+        tools_to_call_from: Optional[List[Tool]] = None,
+        **kwargs,
+    ) -> ChatMessage:
+        payload = self._prepare_completion_kwargs(
+            messages=messages,
+            stop_sequences=stop_sequences,
+            grammar=grammar,
+            tools_to_call_from=tools_to_call_from,
+            model=self.model_id,
+            custom_role_conversions=self.custom_role_conversions,
+            flatten_messages_as_text=True,
+            **kwargs,
+        )
+        # `extra_body` is how the HF and OpenAI clients pass server-specific fields.
+        payload.update(payload.pop("extra_body", None) or {})
+
+        listener = current_listener()
+        if self.batcher is not None and tools_to_call_from is None:
+            messages = payload.pop("messages")
+            payload["stop"] = list(payload.get("stop") or []) + [_CHATML_END]
+            if listener is not None:
+                listener.start()
+            content, input_tokens, output_tokens = self.batcher.complete(chatml_prompt(messages), payload)
+            content = remove_stop_sequences(content, payload["stop"])
+            if listener is not None:
+                listener.token(content)
+                listener.complete(content)
+            return set_token_usage(ChatMessage(role="assistant", content=content), input_tokens, output_tokens)
+
+        if listener is not None and tools_to_call_from is None:
+            return self._stream_chat(payload, listener)
+
+        endpoint, response, started = self._post("/chat/completions", payload)
+        data = response.json()
+        self._succeeded(endpoint, started, 1)
+        message = ChatMessage.from_dict(
+            {key: value for key, value in data["choices"][0]["message"].items() if key in ("role", "content", "tool_calls")}
+        )
+        # `token_usage` reads the response's usage from here.
+        message.raw = data
+        if tools_to_call_from is not None:
+            return parse_tool_args_if_needed(message)
+        return message
+
+    def _post(self, path: str, payload: dict, stream: bool = False, batch_size: int = 1) -> Tuple[Endpoint, requests.Response, float]:
+        """Sends `payload` to the first server that answers; returns it, its response and the start time."""
+        errors = []
+        for endpoint in self.pool.ordered():
+            started = time.perf_counter()
+            try:
+                response = self.session.post(endpoint.url + path, json=payload, timeout=self.timeout, stream=stream)
+            except requests.RequestException as e:
+                self.pool.failed(endpoint)
+                record_model_endpoint(endpoint.url, "unreachable", time.perf_counter() - started, batch_size)
+                errors.append(f"{endpoint.url}: {type(e).__name__}")
+                continue
+            if response.status_code in FAILOVER_STATUSES:
+                response.close()
+                self.pool.failed(endpoint)
+                record_model_endpoint(endpoint.url, str(response.status_code), time.perf_counter() - started, batch_size)
+                errors.append(f"{endpoint.url}: HTTP {response.status_code}")
+                continue
+            if response.status_code >= 400:
+                record_model_endpoint(endpoint.url, str(response.status_code), time.perf_counter() - started, batch_size)
+                raise ModelEndpointError(f"{endpoint.url}{path} returned {response.status_code}: {response.text[:500]}")
+            return endpoint, response, started
+        raise ModelEndpointError("No model endpoint answered: " + "; ".join(errors))
+
+    def _succeeded(self, endpoint: Endpoint, started: float, batch_size: int) -> None:
+        seconds = time.perf_counter() - started
+        self.pool.succeeded(endpoint, seconds)
+        record_model_endpoint(endpoint.url, "200", seconds, batch_size)
+
+    def _send_batch(self, prompts: List[str], parameters: dict) -> List[Tuple[str, int, int]]:
+        endpoint, response, started = self._post("/completions", dict(parameters, prompt=prompts), batch_size=len(prompts))
+        data = response.json()
+        self._succeeded(endpoint, started, len(prompts))
+        texts = [""] * len(prompts)
+        for position, choice in enumerate(data["choices"]):
+            texts[choice.get("index", position)] = choice.get("text") or ""
+        # Usage is reported for the whole batch; it is split in proportion to the text lengths.
+        usage = data.get("usage") or {}
+        prompt_chars = sum(len(prompt) for prompt in prompts) or 1
+        output_chars = sum(len(text) for text in texts) or 1
+        return [
+            (
+                text,
+                round(usage.get("prompt_tokens", 0) * len(prompt) / prompt_chars),
+                round(usage.get("completion_tokens", 0) * len(text) / output_chars),
+            )
+            for prompt, text in zip(prompts, texts)
+        ]
+
+    def _stream_chat(self, payload: dict, listener) -> ChatMessage:
+        payload = dict(payload, stream=True, stream_options={"include_usage": True})
+        endpoint, response, started = self._post("/chat/completions", payload, stream=True)
+        listener.start()
+        parts: List[str] = []
+        usage = None
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if listener.stopped():
+                    raise GenerationStopped("Generation stopped by the user.")
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                if chunk.get("usage"):
+                    usage = chunk["usage"]
+                if not chunk.get("choices"):
+                    continue
+                text = (chunk["choices"][0].get("delta") or {}).get("content")
+                if text:
+                    parts.append(text)
+                    listener.token(text)
+        except requests.RequestException:
+            # The server dropped the connection or stalled after the stream had started.
+            self.pool.failed(endpoint)
+            record_model_endpoint(endpoint.url, "unreachable", time.perf_counter() - started, 1)
+            raise
+        finally:
+            response.close()
+        self._succeeded(endpoint, started, 1)
+
+        content = "".join(parts)
+        listener.complete(content)
+        message = ChatMessage(role="assistant", content=content)
+        if usage is not None:
+            return set_token_usage(message, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+        return set_token_usage(message, 0, len(parts))
+
+
+def create_model(model_id: str, token: Optional[str] = None, **kwargs) -> Model:
+    """The model for MODEL_BACKEND; `token` is only used by the Hugging Face Inference API."""
+    if MODEL_BACKEND == "openai":
+        return OpenAICompatibleModel(model_id, **kwargs)
+    if MODEL_BACKEND != "hf":
+        raise ValueError(f"Unknown MODEL_BACKEND {MODEL_BACKEND!r}; expected 'hf' or 'openai'.")
+    return StreamingHfApiModel(model_id=model_id, token=token, **kwargs)
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional
+
+from smolagents.models import ChatMessage
+
+from instrumentation import record_cache, set_token_usage, token_usage
+from model_streaming import current_listener
+from review_cache import ReviewCache, get_review_cache
+
+MODEL_CACHE_ENABLED = os.getenv("MODEL_CACHE_ENABLED", "1") != "0"
+MODEL_CACHE_TTL = float(os.getenv("MODEL_CACHE_TTL", str(7 * 24 * 3600)))
+# Greedy decoding with a fixed seed, so a cached completion is the one the model would give again.
+MODEL_DETERMINISTIC = os.getenv("MODEL_DETERMINISTIC", "0") != "0"
+MODEL_SEED = int(os.getenv("MODEL_SEED", "0"))
+# Ask llama.cpp-style servers to keep the evaluated prompt between requests.
+MODEL_PROMPT_CACHE = os.getenv("MODEL_PROMPT_CACHE", "0") != "0"
+
+# Request parameters that change what the model answers.
+_SAMPLING_KEYS = ("temperature", "top_p", "top_k", "max_tokens", "seed", "frequency_penalty", "presence_penalty", "response_format")
+
+
+def sampling_kwargs() -> dict:
+    """Extra model arguments for the configured mode: greedy and seeded when deterministic,
+    and the prompt-cache hint for servers that support it."""
+    kwargs = {}
+    if MODEL_DETERMINISTIC:
+        kwargs.update(temperature=0.0, seed=MODEL_SEED)
+    if MODEL_PROMPT_CACHE:
+        kwargs["extra_body"] = {"cache_prompt": True}
+    return kwargs
+
+
+def _text(content) -> str:
+    if isinstance(content, list):
+        return "\n".join(
+            part.get("text", "") if part.get("type") == "text" else json.dumps(part, sort_keys=True, default=str)
+            for part in content
+            if isinstance(part, dict)
+        )
+    return "" if content is None else str(content)
+
+
+def normalize_messages(messages: List[Dict]) -> List[List[str]]:
+    """Messages as [role, text] pairs with line endings and trailing whitespace normalized."""
+    normalized = []
+    for message in messages:
+        role = message.get("role")
+        role = getattr(role, "value", role)
+        text = "\n".join(line.rstrip() for line in _text(message.get("content")).replace("\r\n", "\n").split("\n")).strip()
+        normalized.append([str(role), text])
+    return normalized
+
+
+def completion_key(messages: List[Dict], model_id: str, parameters: dict) -> str:
+    payload = json.dumps([model_id, parameters, normalize_messages(messages)], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8", errors="surrogatepass")).hexdigest()
+
+
+class CachedModel:
+    """Wraps a smolagents model and answers repeated requests from the review cache.
+
+    The key covers the normalized messages, the model id and every sampling parameter,
+    so a different prompt, model or temperature is a miss. Hits cost no model time and
+    report zero tokens; with a token listener registered the cached text is streamed
+    to it in one piece. Tool-calling requests are passed through uncached.
+    """
+
+    def __init__(self, model, cache: Optional[ReviewCache] = None, max_age: float = MODEL_CACHE_TTL):
+        self.model = model
+        self.cache = cache
+        self._cache_resolved = cache is not None
+        self.max_age = max_age
+
+    def _cache(self) -> Optional[ReviewCache]:
+        # Opened on first use, so building the model does not touch the disk.
+        if not self._cache_resolved:
+            self.cache = get_review_cache() if MODEL_CACHE_ENABLED else None
+            self._cache_resolved = True
+        return self.cache
+
+    def __call__(
+        self,
+        messages: List[Dict],
+        stop_sequences: Optional[List[str]] = None,
+        grammar: Optional[str] = None,
+        tools_to_call_from=None,
+        **kwargs,
+    ) -> ChatMessage:
+        cache = self._cache() if tools_to_call_from is None else None
+        if cache is None:
+            return self._call_model(messages, stop_sequences, grammar, tools_to_call_from, **kwargs)
+
+        model_id = getattr(self.model, "model_id", "") or type(self.model).__name__
+        configured = dict(getattr(self.model, "kwargs", {}) or {}, **kwargs)
+        parameters = {name: configured[name] for name in _SAMPLING_KEYS if configured.get(name) is not None}
+        parameters.update(stop=stop_sequences or [], grammar=grammar)
+        key = completion_key(messages, model_id, parameters)
+
+        stored = cache.get_completion(key, self.max_age)
+        if stored is not None:
+            record_cache("model_completion", "hit")
+            content = stored[0]
+            listener = current_listener()
+            if listener is not None:
+                listener.start()
+                listener.token(content)
+                listener.complete(content)
+            return set_token_usage(ChatMessage(role="assistant", content=content), 0, 0)
+
+        record_cache("model_completion", "miss")
+        message = self._call_model(messages, stop_sequences, grammar, tools_to_call_from, **kwargs)
+        if isinstance(message.content, str) and message.content:
+            input_tokens, output_tokens = token_usage(message)
+            cache.put_completion(key, model_id, message.content, input_tokens, output_tokens, self.max_age)
+        return message
+
+    def _call_model(self, messages, stop_sequences, grammar, tools_to_call_from, **kwargs) -> ChatMessage:
+        # Usage travels on the returned message; the wrapped model is shared by concurrent sessions.
+        return self.model(messages, stop_sequences=stop_sequences, grammar=grammar, tools_to_call_from=tools_to_call_from, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
@@ -0,0 +1,108 @@
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from smolagents import HfApiModel
+from smolagents.models import ChatMessage
+from smolagents.tools import Tool
+
+from instrumentation import set_token_usage
+
+_local = threading.local()
+
+
+class GenerationStopped(Exception):
+    """Raised inside a model call when its listener asks generation to stop."""
+
+
+class TokenListener:
+    """Receives a model response while it is generated.
+
+    Register one with `listen_tokens`; every streaming model call made on the same thread
+    reports to it. Methods run on the thread calling the model, so they should only hand
+    the text over (e.g. to a queue) and return.
+    """
+
+    def start(self) -> None:
+        """A model call started."""
+
+    def token(self, text: str) -> None:
+        """The next piece of the response."""
+
+    def complete(self, text: str) -> None:
+        """The response is complete; `text` is all of it."""
+
+    def stopped(self) -> bool:
+        """Return True to abort the call; the agent records it as a generation error."""
+        return False
+
+
+@contextmanager
+def listen_tokens(listener: TokenListener):
+    """Streams the model calls made on this thread to `listener` while the block runs."""
+    previous = getattr(_local, "listener", None)
+    _local.listener = listener
+    try:
+        yield listener
+    finally:
+        _local.listener = previous
+
+
+def current_listener() -> Optional[TokenListener]:
+    return getattr(_local, "listener", None)
+
+
+class StreamingHfApiModel(HfApiModel):
+    """`HfApiModel` that streams its responses to the thread's `TokenListener`.
+
+    Without a listener, and for tool-calling agents, it makes the same single request as
+    `HfApiModel`, so headless runs are unaffected.
+    """
+
+    def __call__(
+        self,
+        messages: List[Dict[str, str]],
+        stop_sequences: Optional[List[str]] = None,
+        grammar: Optional[str] = None,
+        tools_to_call_from: Optional[List[Tool]] = None,
+        **kwargs,
+    ) -> ChatMessage:
+        listener = current_listener()
+        if listener is None or tools_to_call_from is not None:
+            return super().__call__(messages, stop_sequences, grammar, tools_to_call_from, **kwargs)
+
+        completion_kwargs = self._prepare_completion_kwargs(
+            messages=messages,
+            stop_sequences=stop_sequences,
+            grammar=grammar,
+            convert_images_to_image_urls=True,
+            custom_role_conversions=self.custom_role_conversions,
+            **kwargs,
+        )
+        listener.start()
+        stream = self.client.chat_completion(**completion_kwargs, stream=True, stream_options={"include_usage": True})
+        parts: List[str] = []
+        usage = None
+        try:
+            for chunk in stream:
+                if listener.stopped():
+                    raise GenerationStopped("Generation stopped by the user.")
+                if getattr(chunk, "usage", None) is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                text = chunk.choices[0].delta.content
+                if text:
+                    parts.append(text)
+                    listener.token(text)
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+
+        content = "".join(parts)
+        listener.complete(content)
+        if usage is not None:
+            return set_token_usage(ChatMessage(role="assistant", content=content), usage.prompt_tokens, usage.completion_tokens)
+        # Servers that do not report usage while streaming: one chunk is about one token.
+        return set_token_usage(ChatMessage(role="assistant", content=content), 0, len(parts))
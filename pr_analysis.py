@@ -0,0 +1,153 @@
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+from code_smells import DEEP_LOOP_DEPTH, HIGH_COMPLEXITY, LONG_FUNCTION_STATEMENTS, find_smells_in_file, is_python_path
+from diff_parser import FileDiff, ParsedDiff
+from linting import checker_version, lint_file, warm_up
+from security_rules import DEFAULT_RULES, SEVERITY_ORDER
+
+TODO_PATTERN = re.compile(r"#\s*(TODO|FIXME):?\s*(.*)", re.IGNORECASE)
+
+# Below this many files the pool's IPC costs more than it saves.
+PARALLEL_MIN_FILES = int(os.getenv("ANALYSIS_PARALLEL_MIN_FILES", "8"))
+MAX_WORKERS = int(os.getenv("ANALYSIS_MAX_WORKERS", "0")) or os.cpu_count() or 1
+
+# Bump when an analyzer changes in a way that alters its findings for the same input.
+ANALYSIS_VERSION = "2"
+
+
+class Finding:
+    __slots__ = ("severity", "path", "line", "analyzer", "message")
+
+    def __init__(self, severity: str, path: str, line: int, analyzer: str, message: str):
+        self.severity = severity
+        self.path = path
+        self.line = line
+        self.analyzer = analyzer
+        self.message = message
+
+    def to_list(self) -> list:
+        return [self.severity, self.path, self.line, self.analyzer, self.message]
+
+    @classmethod
+    def from_list(cls, values: list) -> "Finding":
+        return cls(*values)
+
+    def rank(self) -> tuple:
+        return (SEVERITY_ORDER.get(self.severity, len(SEVERITY_ORDER)), self.path, self.line or 0)
+
+    def __str__(self):
+        location = f"{self.path}:{self.line}" if self.path else f"line {self.line}"
+        return f"[{self.severity}] {location} ({self.analyzer}): {self.message}"
+
+    def __repr__(self):
+        return f"Finding({self.severity!r}, {self.path!r}, {self.line}, {self.analyzer!r}, {self.message!r})"
+
+
+def analysis_version() -> str:
+    """Identifies the analyzers' behaviour, so persisted findings are dropped when it changes."""
+    thresholds = f"{LONG_FUNCTION_STATEMENTS}-{DEEP_LOOP_DEPTH}-{HIGH_COMPLEXITY}"
+    return f"{ANALYSIS_VERSION}/{DEFAULT_RULES.fingerprint}/{thresholds}/{checker_version()}"
+
+
+def analyze_file(file_diff: FileDiff, source: Optional[Tuple[str, str]] = None) -> List[Finding]:
+    """Runs every analyzer on the added lines of one file.
+
+    Args:
+        file_diff: The parsed diff of the file.
+        source: Optional; (content, blob_sha) of the file at the PR head, which lets the
+            smell checks parse the whole file instead of individual hunks.
+    """
+    findings = []
+    path = file_diff.path
+    if file_diff.is_binary or file_diff.is_deleted:
+        return findings
+
+    for hit in DEFAULT_RULES.scan(ParsedDiff([file_diff])):
+        findings.append(Finding(hit.rule.severity, path, hit.line, "security", f"{hit.rule.message}: {hit.text}"))
+
+    if is_python_path(path):
+        smells, _ = find_smells_in_file(file_diff, source)
+        findings.extend(Finding("medium", path, line, "smells", message) for line, message in smells)
+        findings.extend(Finding("low", path, line, "lint", message) for line, message in lint_file(file_diff, source).findings)
+
+    for line in file_diff.added_lines():
+        match = TODO_PATTERN.search(line.text)
+        if match:
+            findings.append(Finding("low", path, line.new_lineno, "todo", f"{match.group(1).upper()}: {match.group(2)}"))
+    return findings
+
+
+def _analyze_job(job: Tuple[FileDiff, Optional[Tuple[str, str]]]) -> List[Finding]:
+    return analyze_file(*job)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    # The pool is kept for the life of the process so workers are only started once.
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS, initializer=warm_up)
+    return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    """Drops a broken pool so the next call starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def analyze_pr(parsed: ParsedDiff, sources: Optional[Dict[str, Tuple[str, str]]] = None) -> List[Finding]:
+    """Analyzes every file of an already parsed PR diff and returns ranked findings.
+
+    Large PRs are spread over a process pool in chunks, so wall-clock time follows the
+    number of cores rather than the number of files. If a worker dies, the pool is
+    replaced for later calls and this batch is analyzed in this process.
+
+    Args:
+        parsed: The parsed PR diff.
+        sources: Optional; (content, blob_sha) of files at the PR head, keyed by path.
+    """
+    sources = sources or {}
+    jobs = [(file_diff, sources.get(file_diff.path)) for file_diff in parsed.files]
+    if len(jobs) < PARALLEL_MIN_FILES or MAX_WORKERS == 1:
+        results = list(map(_analyze_job, jobs))
+    else:
+        chunksize = max(1, len(jobs) // (MAX_WORKERS * 4))
+        pool = _get_pool()
+        try:
+            results = list(pool.map(_analyze_job, jobs, chunksize=chunksize))
+        except BrokenProcessPool:
+            _discard_pool(pool)
+            results = list(map(_analyze_job, jobs))
+
+    findings = [finding for file_findings in results for finding in file_findings]
+    findings.sort(key=Finding.rank)
+    return findings
+
+
+def format_report(findings: List[Finding], limit: Optional[int] = None) -> str:
+    """Renders ranked findings, most severe first, with a per-severity summary line."""
+    if not findings:
+        return "No issues found in the changed code."
+    counts: Dict[str, int] = {}
+    for finding in findings:
+        counts[finding.severity] = counts.get(finding.severity, 0) + 1
+    summary = ", ".join(f"{count} {severity}" for severity, count in sorted(counts.items(), key=lambda item: SEVERITY_ORDER.get(item[0], 99)))
+    shown = findings if limit is None else findings[:limit]
+    lines = [f"{len(findings)} finding(s): {summary}"] + [str(finding) for finding in shown]
+    if len(shown) < len(findings):
+        lines.append(f"... {len(findings) - len(shown)} more finding(s) not shown.")
+    return "\n".join(lines)
@@ -0,0 +1,40 @@
+import functools
+import hashlib
+import json
+import os
+
+PROMPTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts.yaml")
+PROMPT_CACHE_DIR = os.getenv("PROMPT_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "github-pr-review-agent"))
+
+
+@functools.lru_cache(maxsize=None)
+def load_prompt_templates(path: str = PROMPTS_PATH) -> dict:
+    """Parses the agent's prompt templates once per process.
+
+    The parsed templates are also written as JSON next to the other caches, keyed by a
+    hash of the YAML, so later processes skip the YAML parser entirely. Editing the YAML
+    changes the hash and the JSON is rebuilt. Callers share the returned dict and must
+    not modify it.
+    """
+    with open(path, "rb") as stream:
+        data = stream.read()
+    compiled = os.path.join(PROMPT_CACHE_DIR, f"prompts-{hashlib.sha1(data).hexdigest()[:16]}.json")
+    try:
+        with open(compiled, "r") as stream:
+            return json.load(stream)
+    except (OSError, ValueError):
+        pass
+
+    import yaml
+
+    templates = yaml.load(data, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+    try:
+        os.makedirs(PROMPT_CACHE_DIR, exist_ok=True)
+        partial = f"{compiled}.{os.getpid()}.tmp"
+        with open(partial, "w") as stream:
+            json.dump(templates, stream)
+        os.replace(partial, compiled)
+    except OSError:
+        # A read-only filesystem only costs the YAML parse on the next start.
+        pass
+    return templates
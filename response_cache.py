@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import requests
+
+from instrumentation import record_cache
+
+
+class CacheEntry:
+    __slots__ = ("response", "etag", "last_modified", "stored_at")
+
+    def __init__(self, response: requests.Response):
+        self.response = response
+        self.etag = response.headers.get("ETag")
+        self.last_modified = response.headers.get("Last-Modified")
+        self.stored_at = time.monotonic()
+
+    def validators(self) -> dict:
+        """Headers that turn the next request for this entry into a conditional one."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """In-process LRU cache of GitHub responses keyed by URL, query, Accept header and HTTP client.
+
+    Entries younger than `ttl` seconds are served without touching the network. Older
+    entries are revalidated with `If-None-Match`/`If-Modified-Since`; GitHub answers
+    those with a 304 that does not count against the rate limit, and the stored body is
+    reused. The counters returned by `stats()` show how much API budget that saves.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[tuple, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(url: str, accept: Optional[str], params: Optional[dict] = None, client: str = "requests") -> tuple:
+        """`client` keeps the sync (`requests`) and async (`httpx`) clients' responses apart,
+        so each gets back the response type it returns."""
+        return (url, accept or "", tuple(sorted((params or {}).items())), client)
+
+    def get(self, key: tuple) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return time.monotonic() - entry.stored_at < self.ttl
+
+    def put(self, key: tuple, response: requests.Response) -> None:
+        with self._lock:
+            self._entries[key] = CacheEntry(response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def record_hit(self) -> None:
+        with self._lock:
+            self.hits += 1
+        record_cache("github", "hit")
+
+    def record_miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+        record_cache("github", "miss")
+
+    def record_revalidation(self, entry: CacheEntry) -> None:
+        with self._lock:
+            entry.stored_at = time.monotonic()
+            self.revalidations += 1
+        record_cache("github", "revalidated")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            served = self.hits + self.revalidations
+            total = served + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "revalidations": self.revalidations,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(served / total, 3) if total else 0.0,
+            }
@@ -0,0 +1,230 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from instrumentation import record_cache
+
+REVIEW_CACHE_ENABLED = os.getenv("REVIEW_CACHE_ENABLED", "1") != "0"
+REVIEW_CACHE_DIR = os.getenv("REVIEW_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "github-pr-review-agent"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reviews (
+    repo TEXT NOT NULL,
+    pr_number INTEGER NOT NULL,
+    head_sha TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    model_id TEXT NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (repo, pr_number, head_sha, prompt_version, model_id, question)
+);
+CREATE TABLE IF NOT EXISTS artifacts (
+    repo TEXT NOT NULL,
+    pr_number INTEGER NOT NULL,
+    head_sha TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (repo, pr_number, head_sha, name)
+);
+CREATE TABLE IF NOT EXISTS last_reviews (
+    repo TEXT NOT NULL,
+    pr_number INTEGER NOT NULL,
+    head_sha TEXT NOT NULL,
+    previous_sha TEXT,
+    reviewed_at REAL NOT NULL,
+    PRIMARY KEY (repo, pr_number)
+);
+CREATE TABLE IF NOT EXISTS file_findings (
+    repo TEXT NOT NULL,
+    path TEXT NOT NULL,
+    blob_sha TEXT NOT NULL,
+    patch_digest TEXT NOT NULL,
+    analysis_version TEXT NOT NULL,
+    findings TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (repo, path, blob_sha, patch_digest, analysis_version)
+);
+CREATE TABLE IF NOT EXISTS completions (
+    key TEXT PRIMARY KEY,
+    model_id TEXT NOT NULL,
+    content TEXT NOT NULL,
+    input_tokens INTEGER NOT NULL,
+    output_tokens INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+# Completions are pruned by age once every this many inserts.
+_PRUNE_EVERY = 200
+
+
+def digest(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8", errors="surrogatepass")).hexdigest()
+
+
+def prompt_version(prompt_templates: dict) -> str:
+    """A short fingerprint of the agent's prompt templates; editing prompts.yaml changes it."""
+    return digest(json.dumps(prompt_templates, sort_keys=True, default=str))[:16]
+
+
+def normalize_question(prompt: str) -> str:
+    return digest(" ".join(prompt.lower().split()))
+
+
+class ReviewKey:
+    """Identifies one answer: the same question about the same PR head, prompts and model."""
+
+    __slots__ = ("repo", "pr_number", "head_sha", "prompt_version", "model_id", "question")
+
+    def __init__(self, repo: str, pr_number: int, head_sha: str, prompt_version: str, model_id: str, question: str):
+        self.repo = repo
+        self.pr_number = int(pr_number)
+        self.head_sha = head_sha
+        self.prompt_version = prompt_version
+        self.model_id = model_id
+        self.question = question
+
+    def as_tuple(self) -> tuple:
+        return (self.repo, self.pr_number, self.head_sha, self.prompt_version, self.model_id, self.question)
+
+
+class ReviewCache:
+    """SQLite store of finished reviews, fetched PR artifacts and per-file analyzer findings.
+
+    Answers and artifacts are keyed by PR head SHA, so a push invalidates them. Findings
+    are keyed by blob SHA and a digest of the file's patch, so files that did not change
+    between two pushes keep their results. One connection is shared behind a lock; the
+    database runs in WAL mode so other processes can read while one writes.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._completion_puts = 0
+
+    def get_answer(self, key: ReviewKey) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT answer FROM reviews WHERE repo=? AND pr_number=? AND head_sha=? AND prompt_version=? AND model_id=? AND question=?",
+                key.as_tuple(),
+            ).fetchone()
+        record_cache("review_answer", "hit" if row else "miss")
+        return row[0] if row else None
+
+    def put_answer(self, key: ReviewKey, answer: str) -> None:
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO reviews VALUES (?, ?, ?, ?, ?, ?, ?, ?)", key.as_tuple() + (answer, time.time()))
+
+    def get_artifact(self, repo: str, pr_number: int, head_sha: str, name: str):
+        """Returns the JSON value stored under `name` for this PR head, or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM artifacts WHERE repo=? AND pr_number=? AND head_sha=? AND name=?",
+                (repo, int(pr_number), head_sha, name),
+            ).fetchone()
+        record_cache(f"artifact_{name}", "hit" if row else "miss")
+        return json.loads(row[0]) if row else None
+
+    def put_artifact(self, repo: str, pr_number: int, head_sha: str, name: str, value) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?)",
+                (repo, int(pr_number), head_sha, name, json.dumps(value), time.time()),
+            )
+
+    def get_last_reviewed(self, repo: str, pr_number: int) -> Optional[Tuple[str, Optional[str]]]:
+        """Returns (last reviewed head SHA, the head reviewed before it) for a PR, or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT head_sha, previous_sha FROM last_reviews WHERE repo=? AND pr_number=?", (repo, int(pr_number))
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set_last_reviewed(self, repo: str, pr_number: int, head_sha: str) -> None:
+        # Reviewing a new head moves the old one to previous_sha; the same head again is a no-op.
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO last_reviews VALUES (?, ?, ?, NULL, ?) ON CONFLICT (repo, pr_number) DO UPDATE SET "
+                "previous_sha = CASE WHEN head_sha = excluded.head_sha THEN previous_sha ELSE head_sha END, "
+                "head_sha = excluded.head_sha, reviewed_at = excluded.reviewed_at",
+                (repo, int(pr_number), head_sha, time.time()),
+            )
+
+    def get_file_findings(self, repo: str, files: Iterable[Tuple[str, str, str]], analysis_version: str) -> Dict[str, List[list]]:
+        """Looks up findings for (path, blob_sha, patch_digest) triples; returns them by path."""
+        found = {}
+        looked_up = 0
+        with self._lock:
+            for path, sha, patch_digest in files:
+                looked_up += 1
+                row = self._db.execute(
+                    "SELECT findings FROM file_findings WHERE repo=? AND path=? AND blob_sha=? AND patch_digest=? AND analysis_version=?",
+                    (repo, path, sha, patch_digest, analysis_version),
+                ).fetchone()
+                if row:
+                    found[path] = json.loads(row[0])
+        record_cache("file_findings", "hit", len(found))
+        record_cache("file_findings", "miss", looked_up - len(found))
+        return found
+
+    def put_file_findings(self, repo: str, entries: Iterable[Tuple[str, str, str, List[list]]], analysis_version: str) -> None:
+        """Stores findings for (path, blob_sha, patch_digest, findings) entries in one transaction."""
+        now = time.time()
+        rows = [(repo, path, sha, patch_digest, analysis_version, json.dumps(findings), now) for path, sha, patch_digest, findings in entries]
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.executemany("INSERT OR REPLACE INTO file_findings VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def get_completion(self, key: str, max_age: float) -> Optional[Tuple[str, int, int]]:
+        """Returns (content, input tokens, output tokens) of a stored model completion younger than `max_age`."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT content, input_tokens, output_tokens FROM completions WHERE key=? AND created_at>=?", (key, time.time() - max_age)
+            ).fetchone()
+        return (row[0], row[1], row[2]) if row else None
+
+    def put_completion(self, key: str, model_id: str, content: str, input_tokens: int, output_tokens: int, max_age: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?, ?, ?)", (key, model_id, content, input_tokens, output_tokens, now)
+            )
+            self._completion_puts += 1
+            if self._completion_puts % _PRUNE_EVERY == 0:
+                self._db.execute("DELETE FROM completions WHERE created_at<?", (now - max_age,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+_cache: Optional[ReviewCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_review_cache() -> Optional[ReviewCache]:
+    """Returns the shared cache, or None when caching is disabled or the directory is unusable."""
+    global _cache
+    if not REVIEW_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            try:
+                _cache = ReviewCache(os.path.join(REVIEW_CACHE_DIR, "reviews.sqlite3"))
+            except (OSError, sqlite3.Error) as e:
+                print(f"Review cache disabled: {e}")
+                return None
+        return _cache
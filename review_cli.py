@@ -0,0 +1,180 @@
+"""Headless PR reviews for cron jobs, webhooks and batch runs.
+
+Examples:
+    python review_cli.py https://github.com/owner/repo/pull/42
+    python review_cli.py --file prs.txt --concurrency 4 --output reviews.jsonl
+    python review_cli.py --analysis-only https://github.com/owner/repo/pull/42
+
+Every PR produces one JSON line as soon as its review finishes. Gradio is never
+imported, and with --analysis-only neither is the model nor the agent.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterable, List, Optional, TextIO
+
+from instrumentation import render_metrics, trace_run
+from review_cache import get_review_cache, prompt_version
+from review_pipeline import find_pr_url, hit_step_limit, prepare_review, prepare_task, record_answer
+
+DEFAULT_PROMPT = "Review this pull request: {url}"
+CLI_CONCURRENCY = int(os.getenv("CLI_CONCURRENCY", "4"))
+
+
+class ReviewStopped(Exception):
+    """Raised when a review's `stop` callback asks it to end."""
+
+
+class HeadlessReviewer:
+    """Runs reviews on worker threads, each with its own agent built on first use.
+
+    `source` labels the run traces ('cli', 'webhook').
+    """
+
+    def __init__(self, prompt: str = DEFAULT_PROMPT, analysis_only: bool = False, source: str = "cli"):
+        self.prompt = prompt
+        self.analysis_only = analysis_only
+        self.source = source
+        self._local = threading.local()
+        self._build_agent = None
+
+    def _agent(self):
+        agent = getattr(self._local, "agent", None)
+        if agent is None:
+            if self._build_agent is None:
+                # Deferred so --analysis-only runs never load the model or the tools.
+                from app import build_agent
+
+                self._build_agent = build_agent
+            agent = self._local.agent = self._build_agent()
+        return agent
+
+    def review(self, url: str, stop: Optional[Callable[[], bool]] = None) -> dict:
+        """Reviews one PR; when `stop` returns True the agent ends after its current step."""
+        started = time.perf_counter()
+        found = find_pr_url(url)
+        result = {"url": url}
+        if found is None:
+            return dict(result, status="error", error="not a GitHub pull request URL")
+        result.update(repo=found[0], pr_number=found[1])
+        try:
+            with trace_run(self.source, found) as trace:
+                result["run_id"] = trace.run_id
+                answer, review, cached = self._review(url, found, stop)
+        except ReviewStopped as e:
+            return dict(result, status="stopped", error=str(e), seconds=round(time.perf_counter() - started, 3))
+        except Exception as e:
+            return dict(result, status="error", error=str(e), seconds=round(time.perf_counter() - started, 3))
+
+        if review is not None:
+            result.update(
+                head_sha=review.metadata.get("head", {}).get("sha"),
+                title=review.metadata.get("title"),
+                findings=[
+                    {"severity": f.severity, "path": f.path, "line": f.line, "analyzer": f.analyzer, "message": f.message}
+                    for f in review.findings
+                ],
+            )
+        result.update(status="ok", answer=answer, cached=cached, seconds=round(time.perf_counter() - started, 3))
+        return result
+
+    def _review(self, url: str, found: tuple, stop: Optional[Callable[[], bool]] = None):
+        """Returns (answer, prepared review, whether the answer came from the cache)."""
+        if self.analysis_only:
+            return None, prepare_review(*found, cache=get_review_cache()), False
+        agent = self._agent()
+        task, review = prepare_task(
+            self.prompt.format(url=url),
+            model_id=getattr(agent.model, "model_id", "") or "",
+            prompt_version=prompt_version(agent.prompt_templates),
+        )
+        if review is not None and review.cached_answer is not None:
+            return review.cached_answer, review, True
+        if stop is None:
+            answer = str(agent.run(task, reset=True))
+        else:
+            # Streamed so `stop` is checked between steps; the last item is the final answer.
+            # Once a step has given the final answer no other step runs, so `stop` is no
+            # longer asked and a finished review is kept.
+            final = []
+
+            def reached_final(answer, memory) -> bool:
+                final.append(answer)
+                return True
+
+            checks = agent.final_answer_checks
+            agent.final_answer_checks = list(checks or []) + [reached_final]
+            try:
+                answer = None
+                for answer in agent.run(task, reset=True, stream=True):
+                    if not final and stop():
+                        raise ReviewStopped("review stopped")
+            finally:
+                agent.final_answer_checks = checks
+            answer = str(answer)
+        if review is not None and not hit_step_limit(agent):
+            record_answer(review, answer)
+        return answer, review, False
+
+
+def read_urls(urls: List[str], path: Optional[str]) -> List[str]:
+    """PR URLs from the command line followed by those in `path` ('-' for stdin), de-duplicated."""
+    lines: List[str] = []
+    if path == "-":
+        lines = sys.stdin.read().splitlines()
+    elif path:
+        with open(path, "r") as stream:
+            lines = stream.read().splitlines()
+    collected = list(urls) + [line.strip() for line in lines if line.strip() and not line.lstrip().startswith("#")]
+    return list(dict.fromkeys(collected))
+
+
+def run(urls: Iterable[str], reviewer: HeadlessReviewer, output: TextIO, concurrency: int = CLI_CONCURRENCY) -> int:
+    """Reviews every URL and writes one JSON line per PR in completion order. Returns the number of failures."""
+    failures = 0
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1), thread_name_prefix="review") as pool:
+        futures = [pool.submit(reviewer.review, url) for url in urls]
+        for future in as_completed(futures):
+            result = future.result()
+            failures += result["status"] != "ok"
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+    return failures
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Review GitHub pull requests without the web UI and print JSON lines.")
+    parser.add_argument("urls", nargs="*", help="Pull request URLs, e.g. https://github.com/owner/repo/pull/42.")
+    parser.add_argument("-f", "--file", help="File with one pull request URL per line, or '-' for stdin.")
+    parser.add_argument("-o", "--output", help="Write the JSON lines to this file instead of stdout.")
+    parser.add_argument("-c", "--concurrency", type=int, default=CLI_CONCURRENCY, help="Pull requests reviewed at once.")
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT, help="Task given to the agent; {url} is replaced by the PR URL.")
+    parser.add_argument(
+        "--analysis-only", action="store_true", help="Only run the deterministic analyzers; no model calls."
+    )
+    parser.add_argument("--metrics", help="Write the run's metrics to this file in the Prometheus text format on exit.")
+    args = parser.parse_args(argv)
+
+    urls = read_urls(args.urls, args.file)
+    if not urls:
+        parser.error("no pull request URLs given")
+
+    reviewer = HeadlessReviewer(prompt=args.prompt, analysis_only=args.analysis_only)
+    output = open(args.output, "a") if args.output else sys.stdout
+    try:
+        failures = run(urls, reviewer, output, args.concurrency)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if args.metrics:
+            with open(args.metrics, "w") as stream:
+                stream.write(render_metrics())
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
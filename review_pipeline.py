@@ -0,0 +1,302 @@
+import asyncio
+import contextvars
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from code_smells import is_python_path
+from diff_parser import ParsedDiff, parse_diff
+from diff_store import diff_store
+from github_async import fetch_pr_context, run_with_client
+from github_client import GitHubAPIError, error_message, get_client, repo_from_url
+from incremental_review import IncrementalUnavailable, ReviewDelta, fetch_compare, file_patch_diff
+from pr_analysis import Finding, analysis_version, analyze_pr, format_report
+from review_cache import ReviewCache, ReviewKey, digest, get_review_cache, normalize_question
+
+PR_URL_PATTERN = re.compile(r"https?://github\.com/([\w.-]+)/([\w.-]+)/pull/(\d+)")
+
+PRE_ANALYSIS_ENABLED = os.getenv("PRE_ANALYSIS_ENABLED", "1") != "0"
+# Files fetched in full at the PR head so smells and lint see whole modules.
+MAX_SOURCE_FILES = int(os.getenv("PRE_ANALYSIS_MAX_SOURCES", "20"))
+MAX_DIGEST_FILES = 30
+MAX_DIGEST_FINDINGS = 40
+
+
+class PreparedReview:
+    """Everything fetched and computed for a PR before the agent starts."""
+
+    __slots__ = ("github_url", "pr_number", "metadata", "files", "findings", "delta", "digest", "cache_key", "cached_answer")
+
+    def __init__(
+        self,
+        github_url: str,
+        pr_number: int,
+        metadata: dict,
+        files: List[dict],
+        findings: List[Finding],
+        delta: Optional[ReviewDelta] = None,
+    ):
+        self.github_url = github_url
+        self.pr_number = pr_number
+        self.metadata = metadata
+        self.files = files
+        self.findings = findings
+        self.delta = delta
+        self.digest = format_digest(metadata, files, findings, delta)
+        # Set by `prepare_task` when the review cache is enabled.
+        self.cache_key: Optional[ReviewKey] = None
+        self.cached_answer: Optional[str] = None
+
+
+def find_pr_url(text: str) -> Optional[Tuple[str, int]]:
+    """Returns (repository URL, PR number) for the first pull request link in `text`."""
+    match = PR_URL_PATTERN.search(text)
+    if match is None:
+        return None
+    owner, repo, number = match.groups()
+    return f"https://github.com/{owner}/{repo}", int(number)
+
+
+def _python_sources(files: List[dict]) -> List[str]:
+    paths = [info["filename"] for info in files if info.get("status") != "removed" and is_python_path(info["filename"])]
+    return paths[:MAX_SOURCE_FILES]
+
+
+def _file_keys(files: List[dict]) -> Dict[str, Tuple[str, str, str]]:
+    # The patch is part of the key: the same blob against a moved base adds different lines.
+    return {
+        info["filename"]: (info["filename"], info["sha"], digest(info.get("patch") or ""))
+        for info in files
+        if info.get("sha")
+    }
+
+
+def fetch_metadata(github_url: str, pr_number: int) -> dict:
+    """PR metadata through the shared client, served from its conditional-request cache when fresh."""
+    response = get_client().get(f"/repos/{repo_from_url(github_url)}/pulls/{pr_number}")
+    if response.status_code != 200:
+        raise GitHubAPIError(error_message(response), response.status_code)
+    return response.json()
+
+
+def prepare_review(github_url: str, pr_number: int, cache: Optional[ReviewCache] = None) -> PreparedReview:
+    """Fetches PR metadata, file list, diff and changed sources concurrently and runs every analyzer.
+
+    With a cache, files whose blob and patch were analyzed before (typically files a new
+    push did not touch) reuse their stored findings and are neither fetched nor analyzed
+    again; the fresh results and the PR artifacts are stored for the next run.
+
+    Raises:
+        GitHubAPIError: If GitHub refuses any of the requests.
+    """
+    owner_repo = repo_from_url(github_url)
+    version = analysis_version()
+    keys: Dict[str, Tuple[str, str, str]] = {}
+    reused: Dict[str, List[list]] = {}
+
+    def select_sources(files: List[dict]) -> List[str]:
+        if cache is not None:
+            keys.update(_file_keys(files))
+            reused.update(cache.get_file_findings(owner_repo, keys.values(), version))
+        return _python_sources([info for info in files if info["filename"] not in reused])
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="pre-analysis") as pool:
+        # The diff goes through the diff store so later get_pr_diff calls reuse it.
+        diff_future = pool.submit(contextvars.copy_context().run, diff_store.get, owner_repo, pr_number)
+        context = run_with_client(
+            lambda client: fetch_pr_context(client, github_url, pr_number, include_diff=False, select_sources=select_sources)
+        )
+        parsed = parse_diff(diff_future.result().lines())
+
+    pending = ParsedDiff([file_diff for file_diff in parsed.files if file_diff.path not in reused])
+    findings = analyze_pr(pending, context["sources"])
+    metadata, files = context["metadata"], context["files"]
+
+    if cache is not None:
+        by_path: Dict[str, List[list]] = {file_diff.path: [] for file_diff in pending.files}
+        for finding in findings:
+            by_path.setdefault(finding.path, []).append(finding.to_list())
+        cache.put_file_findings(owner_repo, (keys[path] + (values,) for path, values in by_path.items() if path in keys), version)
+        findings.extend(Finding.from_list(values) for path_findings in reused.values() for values in path_findings)
+        findings.sort(key=Finding.rank)
+        _store_review(cache, owner_repo, pr_number, metadata, files, findings, version)
+    return PreparedReview(github_url, pr_number, metadata, files, findings)
+
+
+def _store_review(
+    cache: ReviewCache, owner_repo: str, pr_number: int, metadata: dict, files: List[dict], findings: List[Finding], version: str
+) -> None:
+    head_sha = metadata["head"]["sha"]
+    cache.put_artifact(
+        owner_repo, pr_number, head_sha, "review",
+        {"files": files, "findings": [finding.to_list() for finding in findings], "analysis_version": version},
+    )
+
+
+def prepare_incremental_review(github_url: str, pr_number: int, cache: ReviewCache, metadata: dict) -> Optional[PreparedReview]:
+    """Re-reviews a PR from the findings of its last reviewed head and the commits pushed since.
+
+    Only the compare delta `/compare/{old}...{new}` is inspected: the files it touches
+    are analyzed again (against the PR base, so line numbers match the full review) and
+    every other file keeps its earlier findings. Returns None when there is no usable
+    earlier review or the delta cannot be computed, in which case the PR is reviewed in full.
+    """
+    owner_repo = repo_from_url(github_url)
+    new_sha = metadata["head"]["sha"]
+    last = cache.get_last_reviewed(owner_repo, pr_number)
+    if last is None or last[0] == new_sha:
+        return None
+    old_sha = last[0]
+    version = analysis_version()
+    stored = cache.get_artifact(owner_repo, pr_number, old_sha, "review")
+    if stored is None or stored.get("analysis_version") != version:
+        return None
+    try:
+        compare = fetch_compare(owner_repo, old_sha, new_sha)
+    except IncrementalUnavailable as e:
+        print(f"Reviewing {github_url}/pull/{pr_number} in full: {e}")
+        return None
+
+    changed = compare.changed_paths()
+    source_paths = set(_python_sources(compare.files))
+    source_shas = {info["filename"]: info["sha"] for info in compare.files if info["filename"] in source_paths and info.get("sha")}
+    files, blobs = run_with_client(
+        lambda client: asyncio.gather(
+            client.list_all(f"/repos/{owner_repo}/pulls/{pr_number}/files"),
+            client.get_blobs(owner_repo, source_shas.values()),
+        )
+    )
+    sources = {path: (blobs[sha], sha) for path, sha in source_shas.items() if sha in blobs}
+
+    # Changed files are analyzed on their whole PR patch, not just the delta.
+    by_path = {info["filename"]: info for info in files}
+    parsed = ParsedDiff([
+        file_diff for path in sorted(changed) if path in by_path for file_diff in parse_diff(file_patch_diff(by_path[path])).files
+    ])
+    fresh = analyze_pr(parsed, sources)
+    kept = [Finding.from_list(values) for values in stored["findings"] if values[1] not in changed and values[1] in by_path]
+    findings = sorted(kept + fresh, key=Finding.rank)
+
+    keys = _file_keys(files)
+    fresh_by_path: Dict[str, List[list]] = {file_diff.path: [] for file_diff in parsed.files}
+    for finding in fresh:
+        fresh_by_path.setdefault(finding.path, []).append(finding.to_list())
+    cache.put_file_findings(owner_repo, (keys[path] + (values,) for path, values in fresh_by_path.items() if path in keys), version)
+    _store_review(cache, owner_repo, pr_number, metadata, files, findings, version)
+    return PreparedReview(github_url, pr_number, metadata, files, findings, ReviewDelta(compare, fresh))
+
+
+def _cached_review(cache: ReviewCache, github_url: str, pr_number: int, metadata: dict) -> Optional[PreparedReview]:
+    stored = cache.get_artifact(repo_from_url(github_url), pr_number, metadata["head"]["sha"], "review")
+    if stored is None or stored.get("analysis_version") != analysis_version():
+        return None
+    findings = [Finding.from_list(values) for values in stored["findings"]]
+    return PreparedReview(github_url, pr_number, metadata, stored["files"], findings)
+
+
+def format_digest(metadata: dict, files: List[dict], findings: List[Finding], delta: Optional[ReviewDelta] = None) -> str:
+    """Compact text summary of a PR and its findings for the model's context."""
+    lines = [
+        f"PR #{metadata.get('number')}: {metadata.get('title')}",
+        f"Author: {(metadata.get('user') or {}).get('login')} | {metadata.get('head', {}).get('ref')} -> {metadata.get('base', {}).get('ref')}"
+        f" | head {metadata.get('head', {}).get('sha', '')[:7]} | state: {metadata.get('state')}",
+        f"Changes: {len(files)} file(s), +{metadata.get('additions', 0)} -{metadata.get('deletions', 0)}",
+    ]
+    body = (metadata.get("body") or "").strip()
+    if body:
+        lines.append("Description: " + " ".join(body.split())[:500])
+
+    lines.append("Files:")
+    for info in files[:MAX_DIGEST_FILES]:
+        lines.append(f"- {info['filename']} ({info.get('status')}, +{info.get('additions', 0)} -{info.get('deletions', 0)})")
+    if len(files) > MAX_DIGEST_FILES:
+        lines.append(f"- ... {len(files) - MAX_DIGEST_FILES} more file(s)")
+
+    docs_updated = any("readme" in info["filename"].lower() or "docs" in info["filename"].lower() for info in files)
+    lines.append("Documentation updated: " + ("yes" if docs_updated else "no"))
+    if delta is not None:
+        lines.append(
+            f"Since the last review ({delta.old_sha[:7]}..{delta.new_sha[:7]}, {delta.commits} commit(s)), "
+            f"{len(delta.changed)} file(s) changed:"
+        )
+        lines.extend(f"- {path}" for path in delta.changed[:MAX_DIGEST_FILES])
+        lines.append("Findings in those files:")
+        lines.append(format_report(delta.findings, limit=MAX_DIGEST_FINDINGS))
+    lines.append("Findings:" if delta is None else "All findings:")
+    lines.append(format_report(findings, limit=MAX_DIGEST_FINDINGS))
+    return "\n".join(lines)
+
+
+def prepare_task(prompt: str, model_id: str = "", prompt_version: str = "") -> Tuple[str, Optional[PreparedReview]]:
+    """Prepends a precomputed review digest to prompts that contain a PR link.
+
+    The agent then only has to synthesize the review instead of spending steps on
+    fetching files and running each analyzer. Prompts without a PR link, or for which
+    the pre-analysis fails, are returned unchanged.
+
+    With the review cache enabled, a PR whose head has not moved is rebuilt from the
+    cache after a single metadata request, and `cached_answer` holds the final answer
+    previously given to the same question with the same prompts and model.
+    """
+    if not PRE_ANALYSIS_ENABLED:
+        return prompt, None
+    found = find_pr_url(prompt)
+    if found is None:
+        return prompt, None
+    try:
+        cache = get_review_cache()
+        review = None
+        if cache is not None:
+            metadata = fetch_metadata(*found)
+            key = ReviewKey(
+                repo_from_url(found[0]), found[1], metadata["head"]["sha"], prompt_version, model_id, normalize_question(prompt)
+            )
+            review = _cached_review(cache, *found, metadata) or prepare_incremental_review(*found, cache, metadata)
+        if review is None:
+            review = prepare_review(*found, cache=cache)
+        if cache is not None:
+            review.cache_key = key
+            review.cached_answer = cache.get_answer(key)
+    except Exception as e:
+        print(f"Pre-analysis of {found[0]}/pull/{found[1]} failed: {e}")
+        return prompt, None
+
+    focus = ""
+    if review.delta is not None:
+        focus = (
+            "It was reviewed before; focus on the commits pushed since then. "
+            "get_pr_diff_since_last_review returns only their diff.\n"
+        )
+    task = (
+        f"{prompt}\n\n"
+        "The pull request has already been fetched and analyzed by deterministic tools. "
+        "Base your review on this digest and only call tools if you need details that are missing from it.\n"
+        f"{focus}"
+        f"--- Pre-analysis digest ---\n{review.digest}\n--- End of digest ---"
+    )
+    return task, review
+
+
+def hit_step_limit(agent) -> bool:
+    """Whether the agent's last run ran out of steps, so its answer was forced rather than given."""
+    # Imported here: the pre-analysis runs without loading the agent.
+    from smolagents.utils import AgentMaxStepsError
+
+    steps = agent.memory.steps
+    return bool(steps) and isinstance(getattr(steps[-1], "error", None), AgentMaxStepsError)
+
+
+def record_answer(review: PreparedReview, answer: str) -> None:
+    """Stores the agent's final answer so the same question about the same PR head is not run again,
+    and marks that head as the PR's last reviewed one.
+
+    Only called once the agent has answered, so a run that failed or was stopped leaves
+    the next review's delta starting at the last head a model actually reviewed.
+    """
+    cache = get_review_cache()
+    if cache is None:
+        return
+    if review.cache_key is not None:
+        cache.put_answer(review.cache_key, answer)
+    cache.set_last_reviewed(repo_from_url(review.github_url), review.pr_number, review.metadata["head"]["sha"])
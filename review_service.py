@@ -0,0 +1,305 @@
+"""Reviews pull requests when GitHub says they changed.
+
+    WEBHOOK_SECRET=... python review_service.py --port 8080 --workers 2 --output reviews.jsonl
+
+Point a repository or organization webhook at `http://<host>:8080/webhook` with content
+type `application/json`, the same secret, and the "Pull requests" event. Every verified
+`opened`, `reopened`, `synchronize` or `ready_for_review` event puts a job for the PR's
+head SHA on a SQLite queue (`job_queue.py`); worker threads review them with the
+headless reviewer and write one JSON line per finished job. Pushes that arrive within
+REVIEW_COALESCE_SECONDS of each other are reviewed once, at the last SHA.
+
+`GET /jobs/<id>` returns a job with its review, `GET /healthz` the queue counts and
+`GET /metrics` the metrics in the Prometheus text format.
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import re
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, TextIO, Tuple
+
+from instrumentation import record_job, record_webhook, render_metrics
+from job_queue import Job, JobQueue
+from review_cli import HeadlessReviewer
+
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+REVIEW_WORKERS = int(os.getenv("REVIEW_WORKERS", "2"))
+# New jobs wait this long, so a burst of pushes is reviewed once, at its last commit.
+REVIEW_COALESCE_SECONDS = float(os.getenv("REVIEW_COALESCE_SECONDS", "10"))
+REVIEW_MAX_ATTEMPTS = int(os.getenv("REVIEW_MAX_ATTEMPTS", "3"))
+# Base of the exponential delay between attempts of a failing job.
+REVIEW_RETRY_DELAY = float(os.getenv("REVIEW_RETRY_DELAY", "60"))
+REVIEW_LEASE_SECONDS = float(os.getenv("REVIEW_LEASE_SECONDS", "900"))
+REVIEW_DRAFTS = os.getenv("REVIEW_DRAFTS", "0") != "0"
+JOB_RETENTION_DAYS = float(os.getenv("JOB_RETENTION_DAYS", "7"))
+
+REVIEW_ACTIONS = {"opened", "reopened", "synchronize", "ready_for_review"}
+# GitHub caps webhook payloads at 25 MB.
+MAX_PAYLOAD_BYTES = 25 * 1024 * 1024
+
+_JOB_PATH = re.compile(r"^/jobs/(\d+)$")
+
+
+def event_time(pr: dict) -> Optional[float]:
+    """When the PR last changed (`updated_at`), which orders its events however they are delivered."""
+    try:
+        return datetime.fromisoformat(pr["updated_at"].replace("Z", "+00:00")).timestamp()
+    except (KeyError, AttributeError, ValueError):
+        return None
+
+
+def verify_signature(secret: str, body: bytes, signature: Optional[str]) -> bool:
+    """Checks GitHub's `X-Hub-Signature-256` header: an HMAC-SHA256 of the body with the webhook secret."""
+    if not signature or not signature.startswith("sha256="):
+        return False
+    expected = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature[len("sha256="):])
+
+
+class ReviewService:
+    """Turns webhook deliveries into queued jobs and runs them on a pool of worker threads.
+
+    A job that ends with an error is retried up to `max_attempts` times with exponential
+    backoff. A running job whose PR gets a new head (or is closed) stops after the
+    agent's current step; its lease is renewed at every step, so a job is only taken
+    over by another worker when its worker died or one step outlasted the lease. The
+    worker that lost the lease then stops and its result is dropped.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        reviewer: Optional[HeadlessReviewer] = None,
+        secret: str = WEBHOOK_SECRET,
+        workers: int = REVIEW_WORKERS,
+        coalesce: float = REVIEW_COALESCE_SECONDS,
+        max_attempts: int = REVIEW_MAX_ATTEMPTS,
+        retry_delay: float = REVIEW_RETRY_DELAY,
+        lease: float = REVIEW_LEASE_SECONDS,
+        review_drafts: bool = REVIEW_DRAFTS,
+        output: Optional[TextIO] = None,
+        poll_interval: float = 1.0,
+    ):
+        self.queue = queue
+        self.reviewer = reviewer or HeadlessReviewer(source="webhook")
+        self.secret = secret
+        self.workers = max(workers, 1)
+        self.coalesce = coalesce
+        self.max_attempts = max(max_attempts, 1)
+        self.retry_delay = retry_delay
+        self.lease = lease
+        self.review_drafts = review_drafts
+        self.output = output
+        self.poll_interval = poll_interval
+        self._output_lock = threading.Lock()
+        self._shutdown = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._pruned_at = 0.0
+
+    def handle(self, event: str, delivery_id: Optional[str], body: bytes, signature: Optional[str]) -> Tuple[int, dict]:
+        """Handles one webhook delivery; returns the HTTP status and JSON body to answer with."""
+        if self.secret and not verify_signature(self.secret, body, signature):
+            record_webhook(event or "unknown", "bad_signature")
+            return 401, {"error": "invalid signature"}
+        if event == "ping":
+            record_webhook(event, "pong")
+            return 200, {"status": "pong"}
+        if event != "pull_request":
+            record_webhook(event or "unknown", "ignored")
+            return 202, {"status": "ignored", "reason": f"event {event!r} is not reviewed"}
+
+        try:
+            payload = json.loads(body)
+            pr = payload["pull_request"]
+            repo = payload["repository"]["full_name"]
+            number = int(pr["number"])
+            head_sha = pr["head"]["sha"]
+        except (ValueError, KeyError, TypeError):
+            record_webhook(event, "invalid")
+            return 400, {"error": "not a pull_request payload"}
+
+        action = payload.get("action")
+        if action == "closed":
+            cancelled = self.queue.cancel(repo, number)
+            record_webhook(event, "closed")
+            return 200, {"status": "cancelled", "jobs": cancelled}
+        if action not in REVIEW_ACTIONS:
+            record_webhook(event, "ignored")
+            return 202, {"status": "ignored", "reason": f"action {action!r} is not reviewed"}
+        if pr.get("draft") and not self.review_drafts:
+            record_webhook(event, "ignored")
+            return 202, {"status": "ignored", "reason": "draft pull request"}
+
+        job_id, outcome = self.queue.enqueue(repo, number, head_sha, delivery_id, self.coalesce, event_time(pr))
+        record_webhook(event, outcome)
+        return 202, {"status": outcome, "job_id": job_id}
+
+    def start(self) -> "ReviewService":
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"review-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stops taking jobs and waits for the running ones; unfinished jobs are resumed after a restart."""
+        self._shutdown.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _work(self) -> None:
+        while not self._shutdown.is_set():
+            try:
+                job = self.queue.claim(self.lease)
+            except Exception as e:
+                print(f"Job queue unavailable: {e}")
+                job = None
+            if job is None:
+                self._prune()
+                self._shutdown.wait(self.poll_interval)
+                continue
+            self._run(job)
+
+    def _run(self, job: Job) -> None:
+        waited = time.time() - job.created_at if job.attempts == 1 else None
+        try:
+            result = self.reviewer.review(
+                job.url, stop=lambda: self._shutdown.is_set() or not self.queue.renew(job.id, job.attempts, self.lease)
+            )
+        except Exception as e:
+            result = {"url": job.url, "status": "error", "error": str(e)}
+        result.update(job_id=job.id, requested_sha=job.head_sha, attempt=job.attempts)
+
+        released = False
+        if result["status"] == "ok":
+            outcome = self.queue.complete(job.id, job.attempts, result)
+        elif result["status"] == "stopped" and self._shutdown.is_set():
+            # Picked up again by the next worker to start, without using up an attempt.
+            outcome = self.queue.release(job.id, job.attempts)
+            released = True
+        elif result["status"] == "stopped":
+            outcome = self.queue.fail(job.id, job.attempts, "superseded by a newer push", None)
+        else:
+            delay = self.retry_delay * 2 ** (job.attempts - 1) if job.attempts < self.max_attempts else None
+            outcome = self.queue.fail(job.id, job.attempts, result.get("error") or "review failed", delay)
+        # 'lost': the lease expired and another worker took the job over; this result is dropped.
+        record_job(("released" if released else "retry") if outcome == "queued" else outcome, waited)
+
+        if self.output is not None:
+            with self._output_lock:
+                self.output.write(json.dumps(dict(result, job_status=outcome)) + "\n")
+                self.output.flush()
+
+    def _prune(self) -> None:
+        now = time.time()
+        if now - self._pruned_at < 3600:
+            return
+        self._pruned_at = now
+        try:
+            self.queue.prune(JOB_RETENTION_DAYS * 24 * 3600)
+        except Exception as e:
+            print(f"Could not prune the job queue: {e}")
+
+
+def _handler(service: ReviewService, webhook_path: str):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            if self.path.split("?", 1)[0] != webhook_path:
+                return self._send(404, {"error": "not found"})
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_PAYLOAD_BYTES:
+                self.close_connection = True
+                return self._send(413, {"error": "payload too large"})
+            body = self.rfile.read(length)
+            status, payload = service.handle(
+                self.headers.get("X-GitHub-Event", ""),
+                self.headers.get("X-GitHub-Delivery"),
+                body,
+                self.headers.get("X-Hub-Signature-256"),
+            )
+            self._send(status, payload)
+
+        def do_GET(self):
+            path = self.path.split("?", 1)[0]
+            if path == "/healthz":
+                return self._send(200, {"status": "ok", "jobs": service.queue.counts()})
+            if path == "/metrics":
+                return self._send(200, render_metrics(), "text/plain; version=0.0.4; charset=utf-8")
+            match = _JOB_PATH.match(path)
+            if match:
+                job = service.queue.get(int(match.group(1)))
+                return self._send(200, job.to_dict()) if job else self._send(404, {"error": "no such job"})
+            self._send(404, {"error": "not found"})
+
+        def _send(self, status: int, payload, content_type: str = "application/json"):
+            body = payload.encode("utf-8") if isinstance(payload, str) else json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(service: ReviewService, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT, webhook_path: str = "/webhook") -> ThreadingHTTPServer:
+    """Starts the webhook endpoint on a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _handler(service, webhook_path))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="review-webhooks", daemon=True).start()
+    return server
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Review GitHub pull requests from webhook events.")
+    parser.add_argument("--host", default=WEBHOOK_HOST)
+    parser.add_argument("--port", type=int, default=WEBHOOK_PORT)
+    parser.add_argument("--workers", type=int, default=REVIEW_WORKERS, help="Reviews running at once.")
+    parser.add_argument("--queue", help="Path of the SQLite job queue (default: JOB_QUEUE_PATH).")
+    parser.add_argument("-o", "--output", help="Append one JSON line per finished job to this file.")
+    parser.add_argument(
+        "--no-verify", action="store_true", help="Accept unsigned deliveries. Only for local testing without WEBHOOK_SECRET."
+    )
+    args = parser.parse_args(argv)
+    if not WEBHOOK_SECRET and not args.no_verify:
+        parser.error("WEBHOOK_SECRET is not set; set it to the webhook's secret, or pass --no-verify for local testing")
+
+    queue = JobQueue(args.queue) if args.queue else JobQueue()
+    output = open(args.output, "a") if args.output else None
+    service = ReviewService(queue, secret="" if args.no_verify else WEBHOOK_SECRET, workers=args.workers, output=output).start()
+    # docker and systemd stop with SIGTERM: shut down like on Ctrl-C so running jobs are released.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    server = serve(service, args.host, args.port)
+    host, port = server.server_address[:2]
+    print(f"Listening for GitHub webhooks on http://{host}:{port}/webhook with {service.workers} workers; queue at {queue.path}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        service.stop()
+        queue.close()
+        if output is not None:
+            output.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+import hashlib
+import os
+import re
+from typing import Iterable, List, Optional
+
+import yaml
+
+from diff_parser import ParsedDiff
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "security_rules.yaml")
+
+SEVERITY_ORDER = {"high": 0, "medium": 1, "low": 2}
+
+
+class Rule:
+    __slots__ = ("id", "pattern", "message", "severity", "ignore_case")
+
+    def __init__(self, id: str, pattern: str, message: str, severity: str = "medium", ignore_case: bool = False):
+        self.id = id
+        self.pattern = pattern
+        self.message = message
+        self.severity = severity
+        self.ignore_case = ignore_case
+
+
+class Hit:
+    """A rule match on an added line, located by file path and new-file line number."""
+
+    __slots__ = ("rule", "path", "line", "text")
+
+    def __init__(self, rule: Rule, path: str, line: int, text: str):
+        self.rule = rule
+        self.path = path
+        self.line = line
+        self.text = text
+
+    def __repr__(self):
+        return f"Hit({self.rule.id!r}, {self.path!r}, {self.line}, {self.text!r})"
+
+
+class RuleSet:
+    """Rules compiled once, each on its own and all together into one alternation.
+
+    `scan` checks every added line on its own against the alternation, which rejects the
+    (many) lines no rule matches in one pass. Lines that match are then run through each
+    rule's pattern, so every rule hitting a line is reported, even when the matches of
+    two rules overlap. Matches never cross line boundaries.
+    """
+
+    def __init__(self, rules: Iterable[Rule]):
+        self.rules = list(rules)
+        self._compiled = [re.compile(rule.pattern, re.IGNORECASE if rule.ignore_case else 0) for rule in self.rules]
+        alternatives = [f"(?i:{rule.pattern})" if rule.ignore_case else f"(?:{rule.pattern})" for rule in self.rules]
+        self._prefilter = re.compile("|".join(alternatives)) if alternatives else None
+        # Changes whenever a rule is added, removed or edited.
+        self.fingerprint = hashlib.sha1(
+            "\n".join(f"{r.id}\t{r.pattern}\t{r.ignore_case}\t{r.severity}\t{r.message}" for r in self.rules).encode("utf-8")
+        ).hexdigest()[:12]
+
+    def scan_lines(self, lines: List[str]) -> List[tuple]:
+        """Returns (line index, rule, matched text) for every match of every rule in `lines`."""
+        if self._prefilter is None:
+            return []
+        matches = []
+        for index, text in enumerate(lines):
+            if self._prefilter.search(text) is None:
+                continue
+            found = [
+                (match.start(), order, rule, match.group())
+                for order, (rule, pattern) in enumerate(zip(self.rules, self._compiled))
+                for match in pattern.finditer(text)
+            ]
+            found.sort(key=lambda item: (item[0], item[1]))
+            matches.extend((index, rule, matched) for _, _, rule, matched in found)
+        return matches
+
+    def scan(self, parsed: ParsedDiff, path: Optional[str] = None) -> List[Hit]:
+        """Scans the added lines of every file (or of `path` only) in one pass."""
+        files = parsed.files if path is None else [f for f in (parsed.file(path),) if f is not None]
+        located = [(f.path, line) for f in files for line in f.added_lines()]
+        matches = self.scan_lines([line.text for _, line in located])
+        return [Hit(rule, located[index][0], located[index][1].new_lineno, text) for index, rule, text in matches]
+
+
+def load_rules(path: str = DEFAULT_RULES_PATH) -> RuleSet:
+    """Loads a rule set from a YAML file with a top-level `rules` list."""
+    with open(path, "r") as stream:
+        config = yaml.safe_load(stream) or {}
+    return RuleSet(
+        Rule(
+            id=entry["id"],
+            pattern=entry["pattern"],
+            message=entry["message"],
+            severity=entry.get("severity", "medium"),
+            ignore_case=entry.get("ignore_case", False),
+        )
+        for entry in config.get("rules", [])
+    )
+
+
+DEFAULT_RULES = load_rules(os.getenv("SECURITY_RULES_PATH", DEFAULT_RULES_PATH))
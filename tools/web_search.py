@@ -1,6 +1,5 @@
 from typing import Any, Optional
 from smolagents.tools import Tool
-import duckduckgo_search
 
 class DuckDuckGoSearchTool(Tool):
     name = "web_search"